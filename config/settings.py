@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'network.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'network.profiling.RequestProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -81,6 +83,52 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1:5432,host2 — остальные параметры как у default.
+# В тестах реплики зеркалируют основную БД
+NETWORK_READ_REPLICAS = []
+for index, replica in enumerate(filter(None, (os.getenv('DB_REPLICA_HOSTS') or '').split(','))):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    NETWORK_READ_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['network.routers.ReplicaRouter']
+# Окно чтения с основной БД после записи клиента, период проверки здоровья реплик,
+# допустимое отставание и срок кэша для ответов, прочитанных с реплики (секунды)
+NETWORK_REPLICA_STICKY_SECONDS = float(os.getenv('NETWORK_REPLICA_STICKY_SECONDS') or 5)
+NETWORK_REPLICA_HEALTH_INTERVAL = float(os.getenv('NETWORK_REPLICA_HEALTH_INTERVAL') or 10)
+NETWORK_REPLICA_MAX_LAG_SECONDS = float(os.getenv('NETWORK_REPLICA_MAX_LAG_SECONDS') or 5)
+NETWORK_REPLICA_CACHE_TIMEOUT = int(os.getenv('NETWORK_REPLICA_CACHE_TIMEOUT') or 30)
+
+
+# Cache
+# Кэш ответов API звеньев сети. LocMemCache хранится в памяти процесса:
+# при нескольких воркерах для общей инвалидации задайте CACHE_BACKEND,
+# например django.core.cache.backends.filebased.FileBasedCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or 'electronics-network',
+    }
+}
+NETWORK_CACHE_TIMEOUT = int(os.getenv('NETWORK_CACHE_TIMEOUT') or 300)
+
+# Срок хранения надгробий ленты изменений (manage.py prune_tombstones)
+NETWORK_TOMBSTONE_RETENTION_DAYS = int(os.getenv('NETWORK_TOMBSTONE_RETENTION_DAYS') or 30)
+
+# Запросы дольше порога (мс) попадают в журнал network.sql и метрики
+NETWORK_SLOW_QUERY_MS = float(os.getenv('NETWORK_SLOW_QUERY_MS') or 200)
+
+# Профилирование запросов: заголовок X-Profile от сотрудника или доля случайной выборки
+NETWORK_PROFILE_DIR = os.getenv('NETWORK_PROFILE_DIR') or os.path.join(BASE_DIR, 'profiles')
+NETWORK_PROFILE_SAMPLE_RATE = float(os.getenv('NETWORK_PROFILE_SAMPLE_RATE') or 0)
+NETWORK_PROFILE_KEEP = int(os.getenv('NETWORK_PROFILE_KEEP') or 200)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -124,6 +172,7 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'network.authentication.TokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
@@ -133,4 +182,11 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 100,
+    'DEFAULT_RENDERER_CLASSES': [
+        'network.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+
+# Сколько секунд проверенный токен API и его пользователь хранятся в памяти процесса
+NETWORK_TOKEN_CACHE_SECONDS = float(os.getenv('NETWORK_TOKEN_CACHE_SECONDS') or 30)
@@ -0,0 +1,106 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from rest_framework import serializers
+from .cache import invalidate_nodes
+from .models import DebtAdjustment, NetworkNode
+
+ADJUSTMENTS_MAX_ITEMS = 10000
+ADJUSTMENTS_BATCH_SIZE = 1000
+
+
+class DebtAdjustmentWriter:
+    """
+    Пакетное применение корректировок задолженности в одной транзакции.
+
+    Ссылки сверяются с журналом DebtAdjustment под блокировкой счётчика
+    версий, которую change_stamp держит до конца транзакции: повтор пакета,
+    в том числе параллельный, получает статус duplicate и долг не меняет.
+    Изменения суммируются по звеньям и записываются групповыми UPDATE
+    (NetworkNode.objects.adjust_debts); если долг хотя бы одного звена
+    вышел бы за допустимые пределы, пакет откатывается целиком.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.errors = [{} for _ in items]
+
+    def save(self):
+        references = {}
+        for index, item in enumerate(self.items):
+            if item['reference'] in references:
+                self.errors[index]['reference'] = ['Ссылка повторяется в пакете.']
+            references[item['reference']] = index
+        if any(self.errors):
+            raise serializers.ValidationError(self.errors)
+        with transaction.atomic():
+            stamp = NetworkNode.objects.change_stamp()
+            applied = self._new_items()
+            if any(self.errors):
+                raise serializers.ValidationError(self.errors)
+            self._apply(applied, stamp['version'])
+            if any(self.errors):
+                raise serializers.ValidationError(self.errors)
+            if applied:
+                # Версия пакета есть только у изменённых звеньев и их поставщиков
+                invalidate_nodes(NetworkNode.objects.stamped(stamp['version']))
+        return [
+            {
+                'reference': item['reference'],
+                'node_id': item['node_id'],
+                'status': 'applied' if index in applied else 'duplicate',
+            }
+            for index, item in enumerate(self.items)
+        ]
+
+    def _new_items(self):
+        """Индексы элементов, ещё не проведённых; расхождение с журналом — ошибка"""
+        references = [item['reference'] for item in self.items]
+        existing = {}
+        for start in range(0, len(references), ADJUSTMENTS_BATCH_SIZE):
+            existing.update(
+                (reference, (node_id, delta)) for reference, node_id, delta in DebtAdjustment.objects.filter(
+                    reference__in=references[start:start + ADJUSTMENTS_BATCH_SIZE]
+                ).values_list('reference', 'node_id', 'delta')
+            )
+        applied = set()
+        for index, item in enumerate(self.items):
+            if item['reference'] not in existing:
+                applied.add(index)
+            elif existing[item['reference']] != (item['node_id'], item['delta']):
+                self.errors[index]['reference'] = ['Ссылка уже использована для другой корректировки.']
+        return applied
+
+    def _apply(self, indexes, version):
+        deltas = defaultdict(Decimal)
+        for index in indexes:
+            deltas[self.items[index]['node_id']] += self.items[index]['delta']
+        rejected = NetworkNode.objects.adjust_debts(deltas, version)
+        lower, _ = NetworkNode.objects.debt_bounds()
+        for index in indexes:
+            node_id = self.items[index]['node_id']
+            if node_id not in rejected:
+                continue
+            debt = rejected[node_id]
+            if debt is None:
+                self.errors[index]['node_id'] = ['Звено сети не найдено.']
+            elif debt + deltas[node_id] < lower:
+                self.errors[index]['delta'] = [
+                    f'Задолженность станет отрицательной: {debt} + {deltas[node_id]}.'
+                ]
+            else:
+                self.errors[index]['delta'] = [
+                    f'Задолженность превысит допустимое значение: {debt} + {deltas[node_id]}.'
+                ]
+        if not rejected:
+            DebtAdjustment.objects.bulk_create(
+                [
+                    DebtAdjustment(
+                        node_id=self.items[index]['node_id'],
+                        delta=self.items[index]['delta'],
+                        reference=self.items[index]['reference'],
+                    )
+                    for index in sorted(indexes)
+                ],
+                batch_size=ADJUSTMENTS_BATCH_SIZE
+            )
@@ -1,31 +1,34 @@
 from django.contrib import admin
+from django.db import transaction
 from django.urls import reverse
 from django.utils.html import format_html
 from django.db.models import QuerySet
 from django.http import HttpRequest
-from .models import NetworkNode, Contact, Product
+from .cache import invalidate_all
+from .models import ApiToken, DebtAdjustment, NetworkNode, Contact, Product
+from .routers import ReplicaReadAdminMixin
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     list_display = ('email', 'country', 'city', 'street', 'house_number')
     list_filter = ('country', 'city')
     search_fields = ('email', 'country', 'city')
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'model', 'release_date')
     list_filter = ('name',)
     search_fields = ('name', 'model')
 
 
 @admin.register(NetworkNode)
-class NetworkNodeAdmin(admin.ModelAdmin):
+class NetworkNodeAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'get_level_display', 'supplier_link', 'debt', 'created_at', 'city')
     list_filter = ('contact__city', 'level', 'created_at')
     search_fields = ('name', 'contact__city', 'contact__country')
-    readonly_fields = ('created_at', 'level')
+    readonly_fields = ('created_at', 'level', 'customers_count', 'customers_debt', 'subtree_debt')
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'level', 'created_at')
@@ -34,10 +37,10 @@ class NetworkNodeAdmin(admin.ModelAdmin):
             'fields': ('contact',)
         }),
         ('Продукты', {
-            'fields': ('products',)
+            'fields': ('products', 'inherits_assortment', 'excluded_products')
         }),
         ('Поставщик и задолженность', {
-            'fields': ('supplier', 'debt')
+            'fields': ('supplier', 'debt', 'customers_count', 'customers_debt', 'subtree_debt')
         }),
     )
 
@@ -71,7 +74,14 @@ class NetworkNodeAdmin(admin.ModelAdmin):
     @admin.action(description="Очистить задолженность перед поставщиком")
     def clear_debt(self, request: HttpRequest, queryset: QuerySet):
         """Admin action для очистки задолженности"""
-        updated = queryset.update(debt=0)
+        with transaction.atomic():
+            cleared = list(queryset.select_for_update().filter(debt__gt=0).values_list('path', 'debt'))
+            stamp = NetworkNode.objects.change_stamp()
+            updated = queryset.update(debt=0, **stamp)
+            NetworkNode.objects.propagate_aggregates(
+                ((path, -debt, -debt, 0) for path, debt in cleared), stamp['version']
+            )
+            invalidate_all()
         self.message_user(
             request,
             f'Задолженность очищена у {updated} объектов.'
@@ -80,3 +90,40 @@ class NetworkNodeAdmin(admin.ModelAdmin):
     def get_list_filter(self, request):
         """Настройка фильтров"""
         return ['contact__city', 'level', 'created_at']
+
+
+@admin.register(DebtAdjustment)
+class DebtAdjustmentAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
+    """Журнал корректировок только для просмотра: проводятся они через API debt-adjustments"""
+    list_display = ('reference', 'node', 'delta', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('reference', 'node__name')
+    list_select_related = ('node',)
+    readonly_fields = ('node', 'delta', 'reference', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    """Ключ показывается один раз при выпуске, поэтому токены выпускает команда api_tokens"""
+    list_display = ('prefix', 'user', 'name', 'created_at', 'expires_at', 'revoked_at', 'last_used_at')
+    list_filter = ('revoked_at', 'expires_at')
+    search_fields = ('prefix', 'name', 'user__username')
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'prefix', 'created_at', 'revoked_at', 'last_used_at')
+    actions = ['revoke_tokens']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Отозвать выбранные токены")
+    def revoke_tokens(self, request: HttpRequest, queryset: QuerySet) -> None:
+        tokens = list(queryset.filter(revoked_at__isnull=True))
+        for token in tokens:
+            token.revoke()
+        self.message_user(request, f'Отозвано токенов: {len(tokens)}.')
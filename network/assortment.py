@@ -0,0 +1,77 @@
+"""
+Наследуемый ассортимент. Звено с inherits_assortment продаёт ассортимент
+поставщика за вычетом своих excluded_products и вместе со своими products
+(дополнениями); без наследования ассортимент — только products. Поэтому
+изменение ассортимента завода — строки одного завода, а не копии у всех
+его покупателей.
+
+Цепочка наследования не длиннее MAX_LEVEL звеньев: ассортимент пакета
+звеньев собирается фиксированным числом запросов (флаги поставщиков вне
+пакета, строки products всех звеньев цепочек, их исключения), а здесь —
+без запросов — из уже выбранных строк.
+"""
+from collections import defaultdict
+from operator import attrgetter
+
+
+class AssortmentPlan:
+    """Звенья пакета, их цепочки наследования и разрешение ассортимента"""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.inherits = {node.pk: node.inherits_assortment for node in nodes}
+        self.parents = {}
+        for node in nodes:
+            chain = [int(pk) for pk in node.path.split('/') if pk]
+            self.parents.update(zip(chain[1:], chain))
+        # Флаги нужны у промежуточных поставщиков наследующих звеньев: завод
+        # в начале цепочки ничего не наследует
+        self.missing = {
+            ancestor_id
+            for node in nodes if node.inherits_assortment
+            for ancestor_id in node.get_ancestor_ids()[1:]
+        } - self.inherits.keys()
+
+    def add_flags(self, rows):
+        self.inherits.update(rows)
+
+    def involved(self):
+        """Звенья пакета и поставщики, от которых они наследуют"""
+        ids = set()
+        for node in self.nodes:
+            current = node.pk
+            ids.add(current)
+            while self.inherits.get(current) and self.parents.get(current):
+                current = self.parents[current]
+                ids.add(current)
+        return ids
+
+    def inheriting(self, ids):
+        return [pk for pk in ids if self.inherits.get(pk)]
+
+    def attach(self, product_rows, excluded_rows):
+        """
+        product_rows — (id звена, Product) собственных строк, excluded_rows —
+        (id звена, id продукта) исключений. Результат — node._assortment.
+        """
+        own, excluded, resolved = defaultdict(dict), defaultdict(set), {}
+        for node_id, product in product_rows:
+            own[node_id][product.pk] = product
+        for node_id, product_id in excluded_rows:
+            excluded[node_id].add(product_id)
+
+        def effective(pk):
+            if pk not in resolved:
+                parent = self.parents.get(pk)
+                products = {}
+                if self.inherits.get(pk) and parent:
+                    products = {
+                        product_id: product for product_id, product in effective(parent).items()
+                        if product_id not in excluded[pk]
+                    }
+                products.update(own[pk])
+                resolved[pk] = products
+            return resolved[pk]
+
+        for node in self.nodes:
+            node._assortment = sorted(effective(node.pk).values(), key=attrgetter('pk'))
@@ -0,0 +1,104 @@
+"""
+Аутентификация интеграций по токену: Authorization: Token <ключ>
+(или Bearer). В БД лежит только SHA-256 ключа, поэтому проверка — один
+SELECT по уникальному индексу вместо PBKDF2 пароля при Basic.
+
+Проверенные токены кэшируются в памяти процесса вместе с пользователем
+на NETWORK_TOKEN_CACHE_SECONDS: повторный запрос аутентифицируется
+поиском в словаре без SQL. Отзыв токена и изменение пользователя сразу
+сбрасывают кэш своего процесса, остальные процессы видят их не позже
+чем через этот срок.
+"""
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+from .models import ApiToken
+
+KEYWORDS = ('token', 'bearer')
+# Верхняя граница записей кэша; при переполнении он очищается целиком
+MAX_CACHED_TOKENS = 10000
+
+
+def cache_seconds():
+    return getattr(settings, 'NETWORK_TOKEN_CACHE_SECONDS', 30)
+
+
+class TokenCache:
+    """hash ключа → (до какого момента верить, пользователь, срок действия токена)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key_hash):
+        entry = self._entries.get(key_hash)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        _, user, expires_at = entry
+        if expires_at is not None and expires_at <= timezone.now():
+            self.forget_token(key_hash)
+            return None
+        return user
+
+    def remember(self, key_hash, user, expires_at):
+        with self._lock:
+            if len(self._entries) >= MAX_CACHED_TOKENS:
+                self._entries.clear()
+            self._entries[key_hash] = (time.monotonic() + cache_seconds(), user, expires_at)
+
+    def forget_token(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def forget_user(self, user_pk):
+        with self._lock:
+            for key_hash in [key for key, entry in self._entries.items() if entry[1].pk == user_pk]:
+                del self._entries[key_hash]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def token_key(request):
+    """Ключ из заголовка Authorization или None, если схема не токенная"""
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if not auth or auth[0].lower() not in KEYWORDS:
+        return None
+    if len(auth) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header.')
+    return auth[1]
+
+
+def verify_token(token):
+    """Пользователь действующего токена; результат запоминается в кэше"""
+    if token is None or not token.is_active or not token.user.is_active:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    token_cache.remember(token.key_hash, token.user, token.expires_at)
+    return token.user
+
+
+def token_lookup(key_hash):
+    return ApiToken.objects.select_related('user').filter(key_hash=key_hash)
+
+
+class TokenAuthentication(authentication.BaseAuthentication):
+    def authenticate(self, request):
+        key = token_key(request)
+        if key is None:
+            return None
+        key_hash = ApiToken.hash_key(key)
+        user = token_cache.get(key_hash)
+        if user is None:
+            # last_used_at обновляется только при промахе кэша: не чаще раза за его срок
+            user = verify_token(token_lookup(key_hash).first())
+            ApiToken.objects.filter(key_hash=key_hash).update(last_used_at=timezone.now())
+        return user, key_hash
+
+    def authenticate_header(self, request):
+        return 'Token'
@@ -0,0 +1,212 @@
+"""
+Нагрузочные замеры эндпоинтов NetworkNodeViewSet на синтетических сетях
+растущего размера: p50/p95 задержки, число SQL-запросов и размер ответа.
+Результаты сравниваются с сохранённой базовой линией.
+"""
+import gc
+import json
+import math
+import time
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .models import Contact, NetworkNode, Product
+from .synthetic import SyntheticNetworkGenerator, clear_network
+
+# Значения для каждого фильтра NetworkNodeFilter; новый фильтр нужно добавить сюда
+FILTER_SAMPLES = {
+    'country': 'Росс',
+    'city': 'Моск',
+    'level': 1,
+    'created_after': lambda: (date.today() - timedelta(days=1)).isoformat(),
+    'created_before': lambda: (date.today() + timedelta(days=1)).isoformat(),
+}
+LEVEL_ACTIONS = ('factories', 'retailers', 'entrepreneurs')
+SEARCH_QUERY = 'москва'
+
+
+def network_sizes(size):
+    """Пропорции синтетической сети для заданного числа ИП"""
+    return {
+        'factories': max(1, size // 1000),
+        'retailers': max(1, size // 50),
+        'entrepreneurs': size,
+        'products': max(20, size // 20),
+    }
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Scenario:
+    """Один замеряемый запрос: метод, путь и тело строятся по контексту набора данных"""
+
+    def __init__(self, name, method, path, data=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+
+    def request(self, client, context, iteration):
+        path = self.path.format(**context)
+        data = self.data(context, iteration) if callable(self.data) else self.data
+        if self.method == 'get':
+            return client.get(path, data)
+        return getattr(client, self.method)(path, data, format='json')
+
+
+def build_scenarios():
+    scenarios = [
+        Scenario('list', 'get', '/api/nodes/'),
+        Scenario('retrieve', 'get', '/api/nodes/{node_id}/'),
+        Scenario('search', 'get', '/api/nodes/search/', {'q': SEARCH_QUERY}),
+    ]
+    for name, value in FILTER_SAMPLES.items():
+        scenarios.append(Scenario(
+            f'filter-{name}', 'get', '/api/nodes/',
+            lambda context, iteration, name=name, value=value: {
+                name: value() if callable(value) else value
+            }
+        ))
+    for action in LEVEL_ACTIONS:
+        scenarios.append(Scenario(action, 'get', f'/api/nodes/{action}/'))
+    scenarios += [
+        Scenario('debt-info', 'get', '/api/nodes/{node_id}/debt-info/'),
+        Scenario('create', 'post', '/api/nodes/', lambda context, iteration: {
+            'name': f'Замер {iteration}',
+            'contact_id': context['contact_id'],
+            'products_ids': context['product_ids'],
+            'supplier_id': context['supplier_id'],
+        }),
+        Scenario('update', 'patch', '/api/nodes/{node_id}/', lambda context, iteration: {
+            'name': f'Обновлено {iteration % 2}',
+        }),
+    ]
+    return scenarios
+
+
+class BenchmarkRunner:
+    """
+    Прогон сценариев на каждом размере сети. База данных очищается
+    перед каждым размером, поэтому запускать только на тестовой БД.
+    """
+
+    def __init__(self, sizes, iterations=20, warmup=2, seed=42, log=None):
+        self.sizes = sizes
+        self.iterations = iterations
+        self.warmup = warmup
+        self.seed = seed
+        self.log = log or (lambda message: None)
+        self.scenarios = build_scenarios()
+
+    def run(self):
+        results = {
+            'meta': {
+                'vendor': connection.vendor,
+                'iterations': self.iterations,
+                'seed': self.seed,
+            },
+            'results': {},
+        }
+        user = get_user_model().objects.create_user(
+            username='benchmark', password='benchmark', is_staff=True, is_active=True
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        for size in self.sizes:
+            self.log(f'Размер {size}: генерация сети...')
+            clear_network()
+            SyntheticNetworkGenerator(seed=self.seed).generate(**network_sizes(size))
+            context = self.context()
+            results['results'][str(size)] = {
+                scenario.name: self.measure(client, scenario, context)
+                for scenario in self.scenarios
+            }
+        return results
+
+    def context(self):
+        node = NetworkNode.objects.filter(level=2).order_by('id').values('id', 'supplier_id').first()
+        return {
+            'node_id': node['id'],
+            'supplier_id': node['supplier_id'],
+            'contact_id': Contact.objects.order_by('id').values_list('id', flat=True).first(),
+            'product_ids': list(Product.objects.order_by('id').values_list('id', flat=True)[:5]),
+        }
+
+    def measure(self, client, scenario, context):
+        timings, queries, size = [], 0, 0
+        for iteration in range(self.warmup + self.iterations):
+            # Сборка мусора между замерами, а не внутри них: иначе она попадает в p95
+            gc.collect()
+            gc.disable()
+            try:
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = scenario.request(client, context, iteration)
+                    elapsed = time.perf_counter() - started
+            finally:
+                gc.enable()
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f'{scenario.name}: HTTP {response.status_code} {response.content[:200]!r}'
+                )
+            if iteration >= self.warmup:
+                timings.append(elapsed * 1000)
+                queries = max(queries, len(captured))
+                size = max(size, len(response.content))
+        stats = {
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'queries': queries,
+            'bytes': size,
+        }
+        self.log(
+            f'  {scenario.name}: p50 {stats["p50_ms"]} мс, p95 {stats["p95_ms"]} мс, '
+            f'{queries} запросов, {size} байт'
+        )
+        return stats
+
+
+def compare(results, baseline, latency_tolerance=0.5, bytes_tolerance=0.1, latency_floor_ms=5.0):
+    """
+    Сравнение с базовой линией. Рост числа запросов — всегда регрессия;
+    размер ответа и p95 сравниваются с допуском, для задержки ещё и с
+    абсолютным порогом, чтобы не реагировать на шум субмиллисекундных замеров.
+    """
+    regressions = []
+    for size, scenarios in results['results'].items():
+        for name, current in scenarios.items():
+            expected = baseline.get('results', {}).get(size, {}).get(name)
+            if expected is None:
+                continue
+            label = f'{name} @ {size}'
+            if current['queries'] > expected['queries']:
+                regressions.append(
+                    f'{label}: запросов {current["queries"]} вместо {expected["queries"]}'
+                )
+            if current['bytes'] > expected['bytes'] * (1 + bytes_tolerance):
+                regressions.append(
+                    f'{label}: размер ответа {current["bytes"]} вместо {expected["bytes"]}'
+                )
+            limit = max(expected['p95_ms'] * (1 + latency_tolerance), expected['p95_ms'] + latency_floor_ms)
+            if current['p95_ms'] > limit:
+                regressions.append(
+                    f'{label}: p95 {current["p95_ms"]} мс при базовой {expected["p95_ms"]} мс'
+                )
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
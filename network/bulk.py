@@ -0,0 +1,238 @@
+from collections import defaultdict
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import serializers
+from .cache import invalidate_nodes
+from .models import Contact, NetworkNode, Product
+
+BULK_MAX_ITEMS = 10000
+BULK_BATCH_SIZE = 1000
+
+
+class BulkNodeWriter:
+    """
+    Пакетное создание и обновление звеньев сети.
+
+    Внешние ключи проверяются одним запросом IN на каждую связанную модель,
+    новые звенья вставляются через bulk_create волнами: звенья, ссылающиеся
+    друг на друга внутри пакета (supplier_ref), попадают в следующую волну,
+    поэтому уровни и пути всего пакета вычисляются за один проход.
+    Строки M2M пишутся напрямую в промежуточные таблицы products и
+    excluded_products; наследники изменённого ассортимента получают
+    версию пакета одним UPDATE.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.errors = [{} for _ in items]
+
+    def save(self):
+        self._load_related()
+        self._validate()
+        if any(self.errors):
+            raise serializers.ValidationError(self.errors)
+        with transaction.atomic():
+            self.stamp = NetworkNode.objects.change_stamp()
+            created = self._create()
+            self._update()
+            # Версию пакета получили созданные и изменённые звенья, их поставщики,
+            # покупатели и наследники; перенос сбрасывает весь кэш сам (save())
+            invalidate_nodes(NetworkNode.objects.stamped(self.stamp['version']))
+        return [
+            {'ref': item.get('ref'), 'id': node.pk, 'created': index in created}
+            for index, (item, node) in enumerate(zip(self.items, self._nodes))
+        ]
+
+    def _load_related(self):
+        contact_ids = {item['contact_id'] for item in self.items if 'contact_id' in item}
+        product_ids = {
+            pk for item in self.items
+            for field in ('products_ids', 'excluded_products_ids') for pk in item.get(field, ())
+        }
+        supplier_ids = {item['supplier_id'] for item in self.items if item.get('supplier_id')}
+        update_ids = {item['id'] for item in self.items if item.get('id')}
+
+        self.contacts = {
+            pk: (city, country) for pk, city, country in Contact.objects.filter(
+                pk__in=contact_ids
+            ).values_list('pk', 'city', 'country')
+        }
+        self.products = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        self.suppliers = {
+            pk: (level, path) for pk, level, path in NetworkNode.objects.filter(
+                pk__in=supplier_ids
+            ).values_list('pk', 'level', 'path')
+        }
+        self.existing = NetworkNode.objects.filter(pk__in=update_ids).select_related('contact').prefetch_related(None).in_bulk()
+        self.refs = {}
+        for index, item in enumerate(self.items):
+            ref = item.get('ref')
+            if ref in self.refs:
+                self.errors[index]['ref'] = ['Ссылка ref повторяется в пакете.']
+            elif ref:
+                self.refs[ref] = index
+
+    def _validate(self):
+        for index, item in enumerate(self.items):
+            errors = self.errors[index]
+            if item.get('id') and item['id'] not in self.existing:
+                errors['id'] = ['Звено сети не найдено.']
+            if 'contact_id' in item and item['contact_id'] not in self.contacts:
+                errors['contact_id'] = ['Контакт не найден.']
+            for field in ('products_ids', 'excluded_products_ids'):
+                missing = [pk for pk in item.get(field, ()) if pk not in self.products]
+                if missing:
+                    errors[field] = [f'Продукты не найдены: {missing}.']
+            if item.get('supplier_id') and item['supplier_id'] not in self.suppliers:
+                errors['supplier_id'] = ['Поставщик не найден.']
+            elif item.get('id') in self.existing and item.get('supplier_id'):
+                # Глубину поддерева проверяет save() переносимого звена
+                node = self.existing[item['id']]
+                if self.suppliers[item['supplier_id']][1].startswith(node.path):
+                    errors['supplier_id'] = ['Поставщик находится в цепочке покупателей звена: получится цикл.']
+            supplier_ref = item.get('supplier_ref')
+            if supplier_ref:
+                if supplier_ref not in self.refs or self.items[self.refs[supplier_ref]].get('id'):
+                    errors['supplier_ref'] = ['Ссылка должна указывать на новое звено этого пакета.']
+                elif item.get('id'):
+                    errors['supplier_ref'] = ['Ссылка на звено пакета допустима только при создании.']
+        if not any(self.errors):
+            self._resolve_waves()
+
+    def _resolve_waves(self):
+        """Номер волны вставки и уровень для каждого нового звена (без рекурсии)"""
+        self.waves, self.levels = {}, {}
+        for start, item in enumerate(self.items):
+            if item.get('id'):
+                continue
+            chain, index = [], start
+            while index not in self.waves:
+                if index in chain:
+                    self.errors[start]['supplier_ref'] = ['Циклическая ссылка внутри пакета.']
+                    return
+                chain.append(index)
+                supplier_ref = self.items[index].get('supplier_ref')
+                if not supplier_ref:
+                    supplier_id = self.items[index].get('supplier_id')
+                    self.waves[index] = 0
+                    self.levels[index] = self.suppliers[supplier_id][0] + 1 if supplier_id else 0
+                    chain.pop()
+                    break
+                index = self.refs[supplier_ref]
+            for index in reversed(chain):
+                parent = self.refs[self.items[index]['supplier_ref']]
+                self.waves[index] = self.waves[parent] + 1
+                self.levels[index] = self.levels[parent] + 1
+        for index, level in self.levels.items():
+            if level > NetworkNode.MAX_LEVEL:
+                field = 'supplier_ref' if self.items[index].get('supplier_ref') else 'supplier_id'
+                self.errors[index][field] = [f'Уровень звена превысит допустимый ({NetworkNode.MAX_LEVEL}).']
+
+    def _create(self):
+        self._nodes = [self.existing.get(item.get('id')) for item in self.items]
+        by_wave = defaultdict(list)
+        for index, wave in self.waves.items():
+            by_wave[wave].append(index)
+
+        created, self._created_paths = [], {}
+        for wave in sorted(by_wave):
+            nodes = []
+            for index in by_wave[wave]:
+                item = self.items[index]
+                supplier_ref = item.get('supplier_ref')
+                node = NetworkNode(
+                    name=item['name'],
+                    contact_id=item['contact_id'],
+                    supplier_id=self._nodes[self.refs[supplier_ref]].pk if supplier_ref else item.get('supplier_id'),
+                    level=self.levels[index],
+                    inherits_assortment=item.get('inherits_assortment', False),
+                    **self.stamp,
+                    search_document=NetworkNode.build_search_document(
+                        item['name'], *self.contacts[item['contact_id']]
+                    ),
+                )
+                self._nodes[index] = node
+                nodes.append(node)
+            NetworkNode.objects.bulk_create(nodes, batch_size=BULK_BATCH_SIZE)
+            for node in nodes:
+                parent_path = self._path_of(node.supplier_id)
+                node.path = f'{parent_path}{node.pk}/'
+                self._created_paths[node.pk] = node.path
+            created.extend(nodes)
+
+        NetworkNode.objects.bulk_update(created, ['path'], batch_size=BULK_BATCH_SIZE)
+        self._write_products(self.waves)
+        self._write_products(self.waves, field='excluded_products')
+        NetworkNode.objects.propagate_aggregates(((node.path, 0, 0, 1) for node in created), self.stamp['version'])
+        return set(self.waves)
+
+    def _path_of(self, supplier_id):
+        if not supplier_id:
+            return ''
+        if supplier_id in self.suppliers:
+            return self.suppliers[supplier_id][1]
+        return self._created_paths[supplier_id]
+
+    def _update(self):
+        renamed, moved, inheritance_changed, name_changed = [], [], [], []
+        update_indexes = [index for index, item in enumerate(self.items) if item.get('id')]
+        for index in update_indexes:
+            item, node = self.items[index], self._nodes[index]
+            if item.get('name', node.name) != node.name:
+                node.name = item['name']
+                name_changed.append(node.pk)
+            if item.get('inherits_assortment', node.inherits_assortment) != node.inherits_assortment:
+                node.inherits_assortment = item['inherits_assortment']
+                inheritance_changed.append(node.pk)
+            if 'contact_id' in item and item['contact_id'] != node.contact_id:
+                node.contact_id = item['contact_id']
+                city, country = self.contacts[node.contact_id]
+            else:
+                city, country = node.contact.city, node.contact.country
+            node.search_document = NetworkNode.build_search_document(node.name, city, country)
+            node.version, node.updated_at = self.stamp['version'], self.stamp['updated_at']
+            if 'supplier_id' in item and item['supplier_id'] != node.supplier_id:
+                node.supplier_id = item['supplier_id']
+                moved.append(node)
+            else:
+                renamed.append(node)
+
+        NetworkNode.objects.bulk_update(
+            renamed, ['name', 'contact', 'inherits_assortment', 'search_document', 'version', 'updated_at'],
+            batch_size=BULK_BATCH_SIZE
+        )
+        if name_changed:
+            # Покупатели выводят имя поставщика: их представление тоже изменилось
+            NetworkNode.objects.filter(supplier_id__in=name_changed).update(**self.stamp)
+        # Перенос поддерева выполняется постоянным числом запросов на звено;
+        # save() проверяет цикл и глубину с учётом переносов этого же пакета
+        for node in moved:
+            try:
+                node.save(update_fields=['name', 'contact', 'supplier', 'inherits_assortment', 'search_document'])
+            except DjangoValidationError as error:
+                self.errors[self._nodes.index(node)]['supplier_id'] = error.message_dict['supplier']
+                raise serializers.ValidationError(self.errors)
+        replaced = self._write_products(update_indexes, replace=True)
+        replaced += self._write_products(update_indexes, field='excluded_products', replace=True)
+        # Наследники видят новый ассортимент без записи своих строк: только версия
+        NetworkNode.objects.touch(
+            NetworkNode.objects.assortment_heirs({*replaced, *inheritance_changed}), self.stamp['version']
+        )
+        return update_indexes
+
+    def _write_products(self, indexes, field='products', replace=False):
+        """Строки M2M field из {field}_ids элементов; возвращает id звеньев с записанными строками"""
+        through, key = getattr(NetworkNode, field).through, f'{field}_ids'
+        indexes = [index for index in indexes if key in self.items[index]]
+        node_ids = [self._nodes[index].pk for index in indexes]
+        if replace and indexes:
+            through.objects.filter(networknode_id__in=node_ids).delete()
+        through.objects.bulk_create(
+            [
+                through(networknode_id=self._nodes[index].pk, product_id=product_id)
+                for index in indexes
+                for product_id in dict.fromkeys(self.items[index][key])
+            ],
+            batch_size=BULK_BATCH_SIZE
+        )
+        return node_ids
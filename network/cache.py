@@ -0,0 +1,138 @@
+import hashlib
+import threading
+import uuid
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+from .conditional import node_state, not_modified, set_validators, validators
+from .routers import current_read_alias
+
+GENERATION_KEY = 'network:generation'
+LIST_VERSION_KEY = 'network:list'
+NODE_VERSION_KEY = 'network:node:{}'
+
+
+class CacheStats:
+    """Счётчики попаданий и промахов кэша ответов (в пределах процесса)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def increment(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'NETWORK_CACHE_ALIAS', 'default')]
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def _versions(node_id=None):
+    """
+    Версии, входящие в ключ: общее поколение и версия списков либо
+    конкретного звена. Отсутствующая версия создаётся.
+    """
+    keys = [GENERATION_KEY, LIST_VERSION_KEY if node_id is None else NODE_VERSION_KEY.format(node_id)]
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _token(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def response_cache_key(request, node_id=None, renderer_format=None):
+    params = sorted(request.query_params.lists())
+    renderer_format = renderer_format or request.accepted_renderer.format
+    fingerprint = hashlib.md5(
+        f'{request.path}|{params}|{renderer_format}'.encode()
+    ).hexdigest()
+    # Запись — данные с валидаторами условного GET
+    return 'network:entry:{}:{}:{}'.format(*_versions(node_id), fingerprint)
+
+
+def response_timeout():
+    timeout = getattr(settings, 'NETWORK_CACHE_TIMEOUT', 300)
+    if current_read_alias() is not None:
+        # Ответ с отстающей реплики мог пережить сброс версий: храним его недолго
+        timeout = min(timeout, getattr(settings, 'NETWORK_REPLICA_CACHE_TIMEOUT', 30))
+    return timeout
+
+
+def cached_response(view_method):
+    """
+    Кэширование успешных ответов действия чтения. Для detail-действий
+    ключ привязан к версии звена, для списков — к версии всех списков.
+    Проверка прав выполняется до вызова обработчика, то есть и для кэша.
+
+    Запись кэша хранит и валидаторы (ETag, Last-Modified): условный
+    запрос к закэшированному ответу получает 304 без SQL. При промахе
+    валидаторы вычисляются агрегатным запросом до обработчика, а для
+    keyset-страницы — по её строкам после него, без COUNT по набору.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = response_cache_key(request, kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        cache = get_cache()
+        entry = cache.get(key)
+        if entry is not None:
+            stats.increment('hits')
+            return not_modified(request, entry['validators']) or set_validators(
+                Response(entry['data']), entry['validators']
+            )
+        stats.increment('misses')
+        paginator = self.paginator
+        if hasattr(paginator, 'page_state'):
+            response = view_method(self, request, *args, **kwargs)
+            response_validators = None
+            if response.status_code == 200 and getattr(paginator, 'page', None) is not None:
+                response_validators = validators(request, paginator.page_state(), request.accepted_renderer.format)
+                cache.set(key, {'data': response.data, 'validators': response_validators}, response_timeout())
+            return not_modified(request, response_validators) or set_validators(response, response_validators)
+        state = node_state(self)
+        # Число строк из агрегата валидаторов заменяет COUNT(*) пагинации
+        self.known_count = state and state['count']
+        response_validators = validators(request, state, request.accepted_renderer.format)
+        response = not_modified(request, response_validators)
+        if response is not None:
+            return response
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, {'data': response.data, 'validators': response_validators}, response_timeout())
+        return set_validators(response, response_validators)
+    return wrapper
+
+
+def _bump(keys):
+    get_cache().set_many({key: _token() for key in keys}, None)
+    stats.increment('invalidations')
+
+
+def invalidate_nodes(node_ids):
+    """Сброс кэша конкретных звеньев и всех списков после фиксации транзакции"""
+    keys = [LIST_VERSION_KEY, *(NODE_VERSION_KEY.format(pk) for pk in set(node_ids))]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate_all():
+    """Сброс всего кэша ответов: для групповых изменений дерева"""
+    transaction.on_commit(lambda: _bump([GENERATION_KEY]))
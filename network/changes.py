@@ -0,0 +1,115 @@
+"""
+Лента изменений звеньев для синхронизации внешних систем. Каждая запись
+звена получает версию из монотонного счётчика (NetworkNodeManager.next_version),
+удаления оставляют надгробия NodeTombstone с версией удаления.
+
+Клиент передаёт токен последней полученной записи (?since=) и получает
+изменения после неё пачками в порядке (версия, id): изменённые звенья
+целиком и идентификаторы удалённых. Без since лента начинается с начала
+и служит первичной загрузкой.
+
+Надгробия хранятся ограниченное время (prune_tombstones). Граница ленты —
+последняя удалённая с ними версия: токен до неё мог бы пропустить удаление,
+поэтому он отклоняется с 410 и клиент загружает ленту заново без since.
+"""
+from django.db import transaction
+from django.db.models import Max, Q
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from .models import ChangeCounter, NodeTombstone
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 5000
+
+
+class ChangesExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Токен ленты изменений устарел: загрузите ленту заново без since.'
+    default_code = 'changes_expired'
+
+
+def horizon():
+    """Наименьшая версия токена, которую лента ещё принимает"""
+    return ChangeCounter.objects.filter(pk=ChangeCounter.NODES_HORIZON).values_list('value', flat=True).first() or 0
+
+
+def move_horizon(version):
+    """Подъём границы ленты; вызывается в транзакции удаления надгробий"""
+    counter, _ = ChangeCounter.objects.select_for_update().get_or_create(pk=ChangeCounter.NODES_HORIZON)
+    if version > counter.value:
+        counter.value = version
+        counter.save(update_fields=['value'])
+
+
+def prune_tombstones(deleted_before):
+    """
+    Удаление надгробий старше deleted_before. Граница ленты поднимается
+    до последней удалённой версии в той же транзакции. Незафиксированные
+    удаления держат счётчик версий, поэтому их версии больше границы.
+    Возвращает число удалённых надгробий.
+    """
+    with transaction.atomic():
+        version = NodeTombstone.objects.filter(deleted_at__lt=deleted_before).aggregate(
+            version=Max('version')
+        )['version']
+        if version is None:
+            return 0
+        move_horizon(version)
+        deleted, _ = NodeTombstone.objects.filter(version__lte=version).delete()
+    return deleted
+
+
+def encode_token(version, node_id):
+    return f'{version}.{node_id}'
+
+
+def decode_token(token):
+    """Позиция (версия, id); пустой токен — начало ленты"""
+    if not token:
+        return -1, 0
+    try:
+        version, node_id = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise ValidationError({'since': 'Некорректный токен ленты изменений.'})
+    return version, node_id
+
+
+def after(position, version_field, id_field):
+    version, node_id = position
+    return Q(**{f'{version_field}__gt': version}) | Q(**{version_field: version, f'{id_field}__gt': node_id})
+
+
+def page_size(value):
+    try:
+        return min(max(int(value), 1), CHANGES_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return CHANGES_PAGE_SIZE
+
+
+def read_changes(queryset, since, limit):
+    """
+    Пачка изменений после позиции since: (звенья, удалённые id, следующий
+    токен, есть ли ещё). Звенья и надгробия выбираются по индексам
+    (version, id) не больше limit + 1 строк каждое и сливаются.
+    """
+    position = decode_token(since)
+    if since and position[0] < horizon():
+        raise ChangesExpired()
+    nodes = list(queryset.filter(after(position, 'version', 'id')).order_by('version', 'id')[:limit + 1])
+    tombstones = list(
+        NodeTombstone.objects.filter(after(position, 'version', 'node_id'))
+        .order_by('version', 'node_id').values_list('version', 'node_id')[:limit + 1]
+    )
+    merged = sorted(
+        [(node.version, node.pk, node) for node in nodes]
+        + [(version, node_id, None) for version, node_id in tombstones],
+        key=lambda change: change[:2]
+    )
+    page = merged[:limit]
+    next_token = encode_token(*(page[-1][:2] if page else position))
+    return (
+        [node for _, _, node in page if node is not None],
+        [{'id': node_id, 'version': version} for version, node_id, node in page if node is None],
+        next_token,
+        len(merged) > limit,
+    )
@@ -0,0 +1,78 @@
+"""
+Условные GET звеньев сети. Сильный ETag и Last-Modified вычисляются из
+версии и времени изменения строк (NetworkNode.version, updated_at):
+для карточки — по самому звену, для списков — по максимальной версии и
+числу строк отфильтрованного набора, одним агрегатным запросом.
+Удаление строки меняет число строк, любое изменение — версию.
+Keyset-страница агрегат не запрашивает: её валидаторы — версии и id её
+строк (NetworkNodeKeysetPagination.page_state) после выборки.
+Last-Modified отдаётся только для карточки: у набора максимум updated_at
+не растёт при удалении строки и уменьшается, когда новейшая строка
+выходит из фильтра, поэтому списки проверяются только по ETag.
+Совпавший If-None-Match или If-Modified-Since даёт 304 без выборки строк
+и сериализации; кэш ответов хранит валидаторы рядом с данными.
+"""
+import hashlib
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def state_query(view):
+    """Набор строк ответа и агрегаты его состояния (время изменения — только для карточки)"""
+    queryset = view.filter_queryset(view.get_queryset())
+    aggregates = {'version': Max('version'), 'count': Count('pk')}
+    pk = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+    if pk is not None:
+        queryset = queryset.filter(pk=pk)
+        aggregates['modified'] = Max('updated_at')
+    return queryset.select_related(None).prefetch_related(None).order_by(), aggregates
+
+
+def node_state(view):
+    """Версия, число строк и время изменения данных ответа; None — отдать как есть"""
+    try:
+        queryset, aggregates = state_query(view)
+        return queryset.aggregate(**aggregates)
+    except (TypeError, ValueError, ValidationError):
+        # Некорректный id: обработчик ответит 404
+        return None
+
+
+def validators(request, state, renderer_format):
+    """
+    (ETag, Last-Modified или None для списков) ответа или None, если строк
+    нет (ответ 404 или пустой список)
+    """
+    if not state or not state['count']:
+        return None
+    # ?format= уже учтён в renderer_format: одинаковые ответы получают один ETag
+    params = sorted((key, values) for key, values in request.GET.lists() if key != 'format')
+    digest = hashlib.sha256(
+        f'{request.path}|{params}|{renderer_format}|{state["version"]}|{state["count"]}|{state.get("page")}'.encode()
+    ).hexdigest()[:32]
+    modified = state.get('modified')
+    return f'"{digest}"', modified.timestamp() if modified else None
+
+
+def not_modified(request, response_validators):
+    """HttpResponseNotModified, если клиентская копия актуальна"""
+    if response_validators is None:
+        return None
+    etag, last_modified = response_validators
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified) if last_modified is not None else None
+    )
+    if response is not None:
+        set_validators(response, response_validators)
+    return response
+
+
+def set_validators(response, response_validators):
+    if response_validators is not None and response.status_code in (200, 304):
+        etag, last_modified = response_validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
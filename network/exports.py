@@ -0,0 +1,43 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = [
+    'id', 'name', 'level', 'debt', 'supplier_id', 'supplier__name',
+    'contact__email', 'contact__country', 'contact__city',
+    'contact__street', 'contact__house_number', 'created_at',
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    """Строки выгрузки с серверного курсора без создания экземпляров моделей"""
+    return queryset.prefetch_related(None).values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in export_rows(queryset):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in export_rows(queryset):
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+EXPORT_FORMATS = {
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'csv': (stream_csv, 'text/csv'),
+}
@@ -1,9 +1,11 @@
 import django_filters
-from .models import NetworkNode
+from .models import NetworkNode, Product
 
 
 class NetworkNodeFilter(django_filters.FilterSet):
     """Фильтр для модели NetworkNode"""
+    # icontains по стране и городу на PostgreSQL идёт по триграммным
+    # индексам UPPER(country)/UPPER(city) (миграция 0014)
     country = django_filters.CharFilter(
         field_name='contact__country',
         lookup_expr='icontains',
@@ -32,3 +34,31 @@ class NetworkNodeFilter(django_filters.FilterSet):
     class Meta:
         model = NetworkNode
         fields = ['country', 'city', 'level']
+
+
+class ProductFilter(django_filters.FilterSet):
+    """Фильтр каталога продуктов"""
+    name = django_filters.CharFilter(
+        field_name='name',
+        lookup_expr='icontains',
+        label='Название'
+    )
+    model = django_filters.CharFilter(
+        field_name='model',
+        lookup_expr='icontains',
+        label='Модель'
+    )
+    released_after = django_filters.DateFilter(
+        field_name='release_date',
+        lookup_expr='gte',
+        label='Выход на рынок не раньше'
+    )
+    released_before = django_filters.DateFilter(
+        field_name='release_date',
+        lookup_expr='lte',
+        label='Выход на рынок не позже'
+    )
+
+    class Meta:
+        model = Product
+        fields = ['name', 'model']
@@ -0,0 +1,277 @@
+"""
+Снимок дерева поставок в памяти процесса для аналитики. Звенья лежат в
+плоских массивах (array): id по возрастанию, индекс поставщика, уровень
+и долг в копейках; покупатели — в формате CSR (смещения и индексы).
+Снимок загружается одним запросом, а дальше догоняет базу по ленте
+изменений (changes.read_changes): перечитываются только изменённые
+звенья. Ленту пишут все пути записи, в том числе групповые UPDATE без
+сигналов моделей, и она общая для всех процессов.
+
+Проверка актуальности — чтение счётчика версий по первичному ключу.
+Снимок догоняет один поток, остальные тем временем читают прежний.
+Изменения долгов и уровней применяются к копиям двух массивов, структура
+(поставщики, покупатели, порядок обхода) переиспользуется; снимок
+перестраивается целиком, только если изменилась она.
+Агрегаты по всей сети — однопроходные циклы по массивам в порядке
+обхода в ширину, без запросов к БД на звено.
+"""
+import heapq
+import threading
+from array import array
+from collections import Counter
+from decimal import Decimal
+from functools import cached_property
+from itertools import accumulate
+from .changes import CHANGES_MAX_PAGE_SIZE, ChangesExpired, encode_token, read_changes
+from .models import ChangeCounter, NetworkNode
+
+
+def current_counter():
+    return ChangeCounter.objects.filter(pk=ChangeCounter.NODES).values_list('value', flat=True).first() or 0
+
+
+def to_cents(debt):
+    return int(debt * 100)
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class GraphSnapshot:
+    """
+    Неизменяемый снимок сети. Покупатели звена i — индексы
+    children[offsets[i]:offsets[i + 1]], их число — customers[i]; order —
+    порядок обхода в ширину (сначала корни), depth — глубина по цепочке
+    поставщиков (-1, если звено недостижимо от корней). Агрегаты
+    вычисляются при первом обращении и хранятся до следующего снимка.
+    """
+    # Поля, которые зависят только от набора звеньев и их поставщиков
+    STRUCTURE = ('ids', 'index', 'parents', 'customers', 'offsets', 'children', 'order', 'roots', 'depth')
+    STRUCTURE_AGGREGATES = ('fanout', 'orphans')
+
+    def __init__(self, rows, counter, position):
+        """rows — (id, id поставщика, уровень, долг в копейках) по возрастанию id"""
+        self.counter = counter
+        self.position = position
+        self.ids = array('q', (row[0] for row in rows))
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.parents = array('q', (self.index.get(row[1], -1) for row in rows))
+        self.levels = array('q', (row[2] for row in rows))
+        self.debts = array('q', (row[3] for row in rows))
+        self._build_children()
+        self._build_order()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build_children(self):
+        size = len(self.ids)
+        counts = array('q', bytes(8 * (size + 1)))
+        for parent in self.parents:
+            if parent >= 0:
+                counts[parent + 1] += 1
+        self.customers = counts[1:]
+        self.offsets = array('q', accumulate(counts))
+        self.children = array('q', bytes(8 * self.offsets[-1]))
+        fill = self.offsets[:-1]
+        for i, parent in enumerate(self.parents):
+            if parent >= 0:
+                self.children[fill[parent]] = i
+                fill[parent] += 1
+
+    def _build_order(self):
+        self.depth = array('q', [-1]) * len(self.ids)
+        self.order = array('q', (i for i, parent in enumerate(self.parents) if parent < 0))
+        self.roots = len(self.order)
+        for i in self.order:
+            self.depth[i] = 0
+        offsets, children, depth, order = self.offsets, self.children, self.depth, self.order
+        position = 0
+        while position < len(order):
+            i = order[position]
+            position += 1
+            for child in children[offsets[i]:offsets[i + 1]]:
+                depth[child] = depth[i] + 1
+                order.append(child)
+
+    @cached_property
+    def subtree_totals(self):
+        """Размер поддерева (вместе со звеном) и его долг в копейках — один обратный проход"""
+        sizes = array('q', [1]) * len(self.ids)
+        debts = array('q', self.debts)
+        parents = self.parents
+        # После корней в порядке обхода идут только звенья с поставщиком
+        for i in reversed(self.order[self.roots:]):
+            parent = parents[i]
+            sizes[parent] += sizes[i]
+            debts[parent] += debts[i]
+        return sizes, debts
+
+    @cached_property
+    def fanout(self):
+        """Распределение числа прямых покупателей: {покупателей: звеньев}"""
+        distribution = Counter(self.customers)
+        suppliers = len(self.ids) - distribution.get(0, 0)
+        return {
+            'max': max(distribution, default=0),
+            'mean': round(len(self.children) / suppliers, 2) if suppliers else 0,
+            'distribution': dict(sorted(distribution.items())),
+        }
+
+    @cached_property
+    def summary(self):
+        depths = Counter(self.depth)
+        unreachable = depths.pop(-1, 0)
+        return {
+            'nodes': len(self.ids),
+            'roots': self.roots,
+            'orphans': len(self.orphans),
+            # В порядке обхода в ширину последнее звено — самое глубокое
+            'max_depth': self.depth[self.order[-1]] if self.order else -1,
+            'total_debt': from_cents(sum(self.debts)),
+            'levels': dict(sorted(Counter(self.levels).items())),
+            'depths': dict(sorted(depths.items())),
+            'unreachable': unreachable,
+            'version': self.counter,
+        }
+
+    @cached_property
+    def orphans(self):
+        """Индексы звеньев вне цепочек: без поставщика и без покупателей"""
+        customers = self.customers
+        return [i for i in self.order[:self.roots] if not customers[i]]
+
+    def largest_subtrees(self, limit, by='size'):
+        """Индексы звеньев с самыми большими поддеревьями по числу звеньев или долгу"""
+        sizes, debts = self.subtree_totals
+        values = sizes if by == 'size' else debts
+        return heapq.nlargest(limit, range(len(self.ids)), key=values.__getitem__)
+
+    def updated(self, changes, counter, position):
+        """
+        Снимок с изменёнными уровнями и долгами; changes — {id: (id поставщика,
+        уровень, долг в копейках)}. None, если меняется структура: звено
+        добавлено, удалено или сменило поставщика.
+        """
+        index, parents = self.index, self.parents
+        for node_id, row in changes.items():
+            i = index.get(node_id)
+            if row is None or i is None or parents[i] != index.get(row[0], -1):
+                return None
+        snapshot = object.__new__(GraphSnapshot)
+        shared = self.STRUCTURE + tuple(name for name in self.STRUCTURE_AGGREGATES if name in self.__dict__)
+        snapshot.__dict__.update({name: self.__dict__[name] for name in shared})
+        snapshot.counter, snapshot.position = counter, position
+        snapshot.levels, snapshot.debts = array('q', self.levels), array('q', self.debts)
+        for node_id, (_, level, debt) in changes.items():
+            snapshot.levels[index[node_id]] = level
+            snapshot.debts[index[node_id]] = debt
+        return snapshot
+
+    def rows(self):
+        ids = self.ids
+        return {
+            node_id: (ids[parent] if parent >= 0 else None, level, debt)
+            for node_id, parent, level, debt in zip(ids, self.parents, self.levels, self.debts)
+        }
+
+
+class GraphStore:
+    """
+    Текущий снимок процесса. Обновляет его поток, взявший блокировку;
+    остальные не ждут и получают прежний снимок (ждут только первую загрузку).
+    """
+    # Если изменений больше этой доли звеньев, снимок загружается заново
+    RELOAD_FRACTION = 0.5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self):
+        counter = current_counter()
+        snapshot = self._snapshot
+        # Меньшее значение счётчика читается с отстающей реплики: снимок уже новее
+        if snapshot is not None and snapshot.counter >= counter:
+            return snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.counter < counter:
+                snapshot = self._snapshot = self._refresh(snapshot, counter)
+        finally:
+            self._lock.release()
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _refresh(self, snapshot, counter):
+        # Счётчик прочитан до данных: всё зафиксированное позже придёт в ленту
+        if snapshot is None:
+            return self.load(counter)
+        limit = max(int(len(snapshot) * self.RELOAD_FRACTION), CHANGES_MAX_PAGE_SIZE)
+        queryset = NetworkNode.objects.select_related(None).prefetch_related(None).only(
+            'id', 'supplier', 'level', 'debt', 'version'
+        )
+        changes, position, has_more = {}, snapshot.position, True
+        while has_more:
+            try:
+                nodes, tombstones, position, has_more = read_changes(queryset, position, CHANGES_MAX_PAGE_SIZE)
+            except ChangesExpired:
+                # Надгробия после позиции снимка уже удалены
+                return self.load(counter)
+            # Последнее по версии событие звена: запись или удаление (None)
+            events = [(node.version, node.pk, node) for node in nodes]
+            events += [(tombstone['version'], tombstone['id'], None) for tombstone in tombstones]
+            for _, node_id, node in sorted(events, key=lambda event: event[:2]):
+                changes[node_id] = node and (node.supplier_id, node.level, to_cents(node.debt))
+            if len(changes) > limit:
+                return self.load(counter)
+        updated = snapshot.updated(changes, counter, position)
+        if updated is not None:
+            return updated
+        rows = snapshot.rows()
+        for node_id, row in changes.items():
+            if row is None:
+                rows.pop(node_id, None)
+            else:
+                rows[node_id] = row
+        return GraphSnapshot(
+            [(node_id, *rows[node_id]) for node_id in sorted(rows)], counter, position
+        )
+
+    @staticmethod
+    def load(counter):
+        queryset = NetworkNode.objects.order_by('pk').values_list('pk', 'supplier_id', 'level', 'debt')
+        rows = [
+            (pk, supplier_id, level, to_cents(debt))
+            for pk, supplier_id, level, debt in queryset.iterator(chunk_size=CHANGES_MAX_PAGE_SIZE)
+        ]
+        # Звенья с версией counter уже прочитаны; повтор из ленты безвреден
+        return GraphSnapshot(rows, counter, encode_token(counter, 0))
+
+
+store = GraphStore()
+
+
+def describe(snapshot, indexes):
+    """Звенья снимка с названиями из БД (один запрос) и агрегатами поддеревьев"""
+    ids = [snapshot.ids[i] for i in indexes]
+    names = dict(NetworkNode.objects.filter(pk__in=ids).values_list('pk', 'name'))
+    sizes, debts = snapshot.subtree_totals
+    return [
+        {
+            'id': snapshot.ids[i],
+            'name': names.get(snapshot.ids[i]),
+            'level': snapshot.levels[i],
+            'depth': snapshot.depth[i],
+            'customers_count': snapshot.customers[i],
+            'subtree_size': sizes[i],
+            'subtree_debt': from_cents(debts[i]),
+        }
+        for i in indexes
+    ]
@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from network.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Выпуск, список и отзыв токенов API интеграций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['issue', 'list', 'revoke'])
+        parser.add_argument('target', nargs='?', help='issue: имя пользователя; revoke: начало ключа')
+        parser.add_argument('--name', default='', help='Назначение токена, например имя интеграции')
+        parser.add_argument('--days', type=int, help='Срок действия в днях; без него токен бессрочный')
+        parser.add_argument('--user', help='list: только токены пользователя')
+
+    def handle(self, *args, **options):
+        getattr(self, options['action'])(options)
+
+    def issue(self, options):
+        try:
+            user = get_user_model().objects.get(username=options['target'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Пользователь {options["target"]} не найден')
+        expires_at = timezone.now() + timedelta(days=options['days']) if options['days'] else None
+        token, key = ApiToken.issue(user, options['name'], expires_at)
+        self.stdout.write(self.style.SUCCESS(f'Токен {token.prefix} выпущен для {user.username}'))
+        self.stdout.write('Ключ показывается один раз:')
+        self.stdout.write(key)
+
+    def list(self, options):
+        tokens = ApiToken.objects.select_related('user').order_by('-created_at')
+        if options['user']:
+            tokens = tokens.filter(user__username=options['user'])
+        for token in tokens:
+            state = 'отозван' if token.revoked_at else ('действует' if token.is_active else 'истёк')
+            self.stdout.write(
+                f'{token.prefix}  {token.user.username:<20} {state:<10} '
+                f'до {token.expires_at or "-"}  использован {token.last_used_at or "-"}  {token.name}'
+            )
+
+    def revoke(self, options):
+        tokens = list(ApiToken.objects.filter(prefix=options['target'], revoked_at__isnull=True))
+        if not tokens:
+            raise CommandError(f'Действующий токен {options["target"]} не найден')
+        for token in tokens:
+            token.revoke()
+        self.stdout.write(self.style.SUCCESS(f'Отозвано токенов: {len(tokens)}'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from network.models import NetworkNode
+
+PROBLEMS = {
+    'cycles': 'В циклах или под ними (недостижимы от корней)',
+    'too_deep': f'Глубже допустимого уровня {NetworkNode.MAX_LEVEL}',
+    'mismatched': 'Уровень или путь расходятся с цепочкой поставщиков',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет всю сеть одним запросом: циклы поставщиков, превышение глубины '
+        'и расхождение уровней и путей. Завершается с ошибкой, если нарушения найдены'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Сколько id звеньев показать по каждому нарушению')
+
+    def handle(self, *args, **options):
+        report = NetworkNode.objects.audit_tree()
+        for key, title in PROBLEMS.items():
+            ids = report[key]
+            if not ids:
+                continue
+            shown = ', '.join(str(node_id) for node_id in ids[:options['limit']])
+            self.stdout.write(f'{title}: {len(ids)} ({shown}{", …" if len(ids) > options["limit"] else ""})')
+        if any(report.values()):
+            hint = ' Уровни и пути исправит relevel_network.' if report['mismatched'] else ''
+            raise CommandError(f'Найдены нарушения структуры сети.{hint}')
+        self.stdout.write(self.style.SUCCESS('Нарушений структуры сети нет'))
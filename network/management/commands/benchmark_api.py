@@ -0,0 +1,99 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment
+)
+from network.benchmarks import BenchmarkRunner, compare, load_results, save_results
+
+BASELINE_DIR = os.path.join(settings.BASE_DIR, 'benchmarks')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, число SQL-запросов и размер ответов API на '
+        'синтетических сетях растущего размера во временной тестовой БД '
+        'и сравнивает результат с базовой линией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000],
+            help='Количество ИП в каждой генерируемой сети'
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Замеров на сценарий')
+        parser.add_argument('--warmup', type=int, default=2, help='Прогревочных запросов на сценарий')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора данных')
+        parser.add_argument(
+            '--output', default='benchmark_results.json', help='Файл для результатов в JSON'
+        )
+        parser.add_argument(
+            '--baseline', help='Базовая линия (по умолчанию benchmarks/baseline-<СУБД>.json)'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true', help='Записать результаты как базовую линию'
+        )
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=0.5,
+            help='Допустимый относительный рост p95 (0.5 = +50%%)'
+        )
+        parser.add_argument(
+            '--bytes-tolerance', type=float, default=0.1,
+            help='Допустимый относительный рост размера ответа'
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Не отключать кэш ответов (замеряются попадания в кэш)'
+        )
+
+    def handle(self, *args, **options):
+        baseline_path = options['baseline'] or os.path.join(
+            BASELINE_DIR, f'baseline-{connection.vendor}.json'
+        )
+        runner = BenchmarkRunner(
+            options['sizes'], iterations=options['iterations'], warmup=options['warmup'],
+            seed=options['seed'], log=self.stdout.write
+        )
+        results = self.run_isolated(runner, options['warm_cache'])
+        save_results(results, options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            save_results(results, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия обновлена: {baseline_path}'))
+            return
+        if not os.path.exists(baseline_path):
+            self.stdout.write(self.style.WARNING(f'Базовая линия {baseline_path} не найдена'))
+            return
+
+        regressions = compare(
+            results, load_results(baseline_path),
+            latency_tolerance=options['latency_tolerance'],
+            bytes_tolerance=options['bytes_tolerance']
+        )
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(f'  • {regression}')
+            raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
+
+    def run_isolated(self, runner, warm_cache):
+        """Прогон во временной тестовой БД, чтобы не затронуть рабочие данные"""
+        cache_settings = {} if warm_cache else {
+            'CACHES': {
+                **settings.CACHES,
+                'network-benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            },
+            'NETWORK_CACHE_ALIAS': 'network-benchmark',
+        }
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(**cache_settings):
+                return runner.run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -3,19 +3,51 @@ from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.db import models
 from network.models import Contact, Product, NetworkNode
+from network.synthetic import SyntheticNetworkGenerator, clear_network
 
 
-class Command(BaseCommand):
-    help = 'Генерирует тестовые данные для сети электроники'
+SYNTHETIC_DEFAULTS = {
+    'factories': 10,
+    'retailers': 1000,
+    'entrepreneurs': 100000,
+    'products': 2000,
+}
+
 
-    def handle(self, *args, **kwargs):
+class Command(BaseCommand):
+    help = (
+        'Генерирует тестовые данные для сети электроники. Без параметров размера '
+        'создаётся небольшой демонстрационный набор, с --factories/--retailers/'
+        '--entrepreneurs/--products — синтетическая сеть заданного размера'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in SYNTHETIC_DEFAULTS.items():
+            parser.add_argument(
+                f'--{name}', type=int,
+                help=f'Количество: {name} (по умолчанию {default} в синтетическом режиме)'
+            )
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов для ИП')
+        parser.add_argument('--quiet', action='store_true', help='Не выводить построчный журнал')
+
+    def log(self, message):
+        if not self.quiet:
+            self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        self.quiet = options['quiet'] or options['verbosity'] == 0
+        random.seed(options['seed'])
         self.stdout.write(self.style.SUCCESS('Начинаем генерацию тестовых данных...'))
 
         # Очищаем существующие данные
         self.stdout.write('Очищаем базу данных...')
-        NetworkNode.objects.all().delete()
-        Product.objects.all().delete()
-        Contact.objects.all().delete()
+        clear_network()
+
+        if any(options[name] is not None for name in SYNTHETIC_DEFAULTS):
+            self.generate_synthetic(options)
+            return
 
         # Создаем контакты
         self.stdout.write('Создаем контакты...')
@@ -40,7 +72,27 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS('✅ Тестовые данные успешно созданы!'))
 
         # Выводим статистику
-        self.show_statistics()
+        if not self.quiet:
+            self.show_statistics()
+
+    def generate_synthetic(self, options):
+        """Синтетическая сеть заданного размера с отчётом о производительности"""
+        sizes = {
+            name: default if options[name] is None else options[name]
+            for name, default in SYNTHETIC_DEFAULTS.items()
+        }
+        generator = SyntheticNetworkGenerator(
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            log=self.log
+        )
+        stats = generator.generate(**sizes)
+        total = stats['total']
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Создано звеньев: {total["rows"]} за {total["seconds"]:.2f} с '
+            f'({total["rows"] / total["seconds"]:,.0f} звеньев/с)'
+        ))
 
     def create_contacts(self):
         """Создание контактов"""
@@ -92,7 +144,7 @@ class Command(BaseCommand):
         for data in contacts_data:
             contact = Contact.objects.create(**data)
             contacts.append(contact)
-            self.stdout.write(f'  Создан контакт: {contact.city}, {contact.street}')
+            self.log(f'  Создан контакт: {contact.city}, {contact.street}')
 
         return contacts
 
@@ -134,7 +186,7 @@ class Command(BaseCommand):
         for data in products_data:
             product = Product.objects.create(**data)
             products.append(product)
-            self.stdout.write(f'  Создан продукт: {product.name} ({product.model})')
+            self.log(f'  Создан продукт: {product.name} ({product.model})')
 
         return products
 
@@ -175,7 +227,7 @@ class Command(BaseCommand):
                 factory.products.set(products[10:13] + [products[15]])
 
             factories.append(factory)
-            self.stdout.write(f'  Создан завод: {factory.name} (уровень {factory.level})')
+            self.log(f'  Создан завод: {factory.name} (уровень {factory.level})')
 
         return factories
 
@@ -216,18 +268,17 @@ class Command(BaseCommand):
         ]
 
         for data in retailer_data:
+            # Ассортимент завода наследуется ссылкой, строки продуктов не копируются
             retailer = NetworkNode.objects.create(
                 name=data['name'],
                 contact=data['contact'],
                 supplier=data['supplier'],
-                debt=data['debt']
+                debt=data['debt'],
+                inherits_assortment=True
             )
 
-            supplier_products = data['supplier'].products.all()
-            retailer.products.set(supplier_products)
-
             retailers.append(retailer)
-            self.stdout.write(f'  Создана розничная сеть: {retailer.name} (уровень {retailer.level})')
+            self.log(f'  Создана розничная сеть: {retailer.name} (уровень {retailer.level})')
 
         return retailers
 
@@ -289,14 +340,13 @@ class Command(BaseCommand):
                 debt=data['debt']
             )
 
-            supplier_products = data['supplier'].products.all()
-            # Берем случайные продукты от поставщика
-            product_list = list(supplier_products)
+            # Берем случайные продукты из действующего ассортимента поставщика
+            product_list = list(data['supplier'].assortment)
             selected_products = random.sample(product_list, min(random.randint(3, 6), len(product_list)))
             entrepreneur.products.set(selected_products)
 
             entrepreneurs.append(entrepreneur)
-            self.stdout.write(f'  Создан ИП: {entrepreneur.name} (уровень {entrepreneur.level})')
+            self.log(f'  Создан ИП: {entrepreneur.name} (уровень {entrepreneur.level})')
 
         return entrepreneurs
 
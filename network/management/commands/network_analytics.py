@@ -0,0 +1,49 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+from network.graph import describe, store
+
+
+class Command(BaseCommand):
+    help = 'Аналитика сети по снимку дерева в памяти: глубина, ветвление, крупнейшие поддеревья'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Сколько крупнейших поддеревьев показать')
+        parser.add_argument('--by', default='size', choices=['size', 'debt'], help='Мера размера поддерева')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        snapshot = store.snapshot()
+        loaded = time.perf_counter()
+        report = {
+            'summary': snapshot.summary,
+            'fanout': snapshot.fanout,
+            'subtrees': describe(snapshot, snapshot.largest_subtrees(options['top'], options['by'])),
+        }
+        finished = time.perf_counter()
+        if options['json']:
+            self.stdout.write(json.dumps(report, cls=JSONEncoder, ensure_ascii=False, indent=2))
+            return
+
+        summary, fanout = report['summary'], report['fanout']
+        self.stdout.write(self.style.SUCCESS(
+            f'Снимок: {summary["nodes"]} звеньев за {(loaded - started) * 1000:.1f} мс, '
+            f'аналитика за {(finished - loaded) * 1000:.1f} мс'
+        ))
+        self.stdout.write(
+            f'Корней: {summary["roots"]}, вне цепочек: {summary["orphans"]}, '
+            f'недостижимо от корней: {summary["unreachable"]}'
+        )
+        self.stdout.write(f'Максимальная глубина: {summary["max_depth"]}, по глубинам: {summary["depths"]}')
+        self.stdout.write(f'По уровням: {summary["levels"]}, общий долг: {summary["total_debt"]}')
+        self.stdout.write(
+            f'Покупателей у звена: до {fanout["max"]}, в среднем у поставщика {fanout["mean"]}'
+        )
+        self.stdout.write(f'Крупнейшие поддеревья ({options["by"]}):')
+        for node in report['subtrees']:
+            self.stdout.write(
+                f'  {node["id"]:>8}  {node["name"]}  звеньев {node["subtree_size"]}  '
+                f'долг {node["subtree_debt"]}  глубина {node["depth"]}'
+            )
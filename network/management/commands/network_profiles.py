@@ -0,0 +1,63 @@
+import io
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+from network.profiling import list_profiles, profile_dir
+
+
+class Command(BaseCommand):
+    help = 'Список последних профилей запросов API и сводка по самым затратным функциям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Сколько последних профилей показать')
+        parser.add_argument('--endpoint', help='Только профили эндпоинта (например node-list)')
+        parser.add_argument(
+            '--summary', nargs='?', const='latest',
+            help='Сводка по профилю: имя файла или latest (по умолчанию)'
+        )
+        parser.add_argument(
+            '--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+            help='Сортировка функций в сводке'
+        )
+        parser.add_argument('--top', type=int, default=25, help='Число функций в сводке')
+
+    def handle(self, *args, **options):
+        profiles = list_profiles()
+        if options['endpoint']:
+            profiles = [meta for meta in profiles if meta['endpoint'] == options['endpoint']]
+        if not profiles:
+            self.stdout.write(f'Профилей в {profile_dir()} нет')
+            return
+
+        if options['summary']:
+            self.show_summary(self.find(profiles, options['summary']), options['sort'], options['top'])
+            return
+
+        for meta in profiles[:options['limit']]:
+            params = '&'.join(
+                f'{key}={value}' for key, values in meta['query_params'].items() for value in values
+            )
+            self.stdout.write(
+                f'{meta["started_at"]}  {meta["duration_ms"]:>9.1f} мс  {meta["status"]}  '
+                f'{meta["method"]} {meta["endpoint"]} ({meta["action"] or "-"})'
+                f'{" ?" + params if params else ""}  [{meta["trigger"]}]'
+            )
+            self.stdout.write(f'    {meta["profile"]}')
+
+    def find(self, profiles, name):
+        if name == 'latest':
+            return profiles[0]
+        for meta in profiles:
+            if name in meta['profile']:
+                return meta
+        raise CommandError(f'Профиль {name} не найден')
+
+    def show_summary(self, meta, sort, top):
+        self.stdout.write(self.style.SUCCESS(
+            f'{meta["method"]} {meta["path"]} → {meta["endpoint"]} '
+            f'({meta["view"]}.{meta["action"]}), {meta["duration_ms"]} мс'
+        ))
+        self.stdout.write(f'Параметры: {meta["query_params"]}')
+        output = io.StringIO()
+        stats = pstats.Stats(meta['profile'], stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+        self.stdout.write(output.getvalue())
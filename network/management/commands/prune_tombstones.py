@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from network.changes import horizon, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые надгробия ленты изменений и поднимает её границу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Срок хранения в днях (по умолчанию NETWORK_TOMBSTONE_RETENTION_DAYS)'
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'NETWORK_TOMBSTONE_RETENTION_DAYS', 30)
+        deleted = prune_tombstones(timezone.now() - timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f'Удалено надгробий: {deleted}'))
+        self.stdout.write(f'Лента принимает токены с версии {horizon()}')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from network.cache import invalidate_all
+from network.models import NetworkNode
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает уровни, пути и агрегаты задолженности всех звеньев сети'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            fixed = NetworkNode.objects.rebuild_tree()
+            recomputed = NetworkNode.objects.recompute_aggregates()
+            invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Исправлено звеньев: {fixed}'))
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны агрегаты задолженности: {recomputed}'))
@@ -0,0 +1,252 @@
+"""
+Метрики запросов в памяти процесса: длительность, число и время SQL,
+время сериализации и размер ответа по эндпоинтам (имя маршрута, например
+node-list или node-debt-info) и счётчики кэша ответов. Отдаются в текстовом
+формате Prometheus.
+"""
+import logging
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger('network.sql')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Имя метрики: (описание, границы корзин, поле RequestSample)
+HISTOGRAMS = {
+    'network_request_duration_seconds': ('Длительность обработки запроса', LATENCY_BUCKETS, 'duration'),
+    'network_sql_queries': ('Число SQL-запросов на запрос', QUERY_BUCKETS, 'queries'),
+    'network_sql_duration_seconds': ('Суммарное время SQL на запрос', LATENCY_BUCKETS, 'sql_seconds'),
+    'network_serialization_duration_seconds': (
+        'Время сериализации и рендеринга без SQL', LATENCY_BUCKETS, 'serialization_seconds'
+    ),
+    'network_response_size_bytes': ('Размер тела ответа', SIZE_BUCKETS, 'response_bytes'),
+}
+SLOW_QUERIES = 'network_slow_queries_total'
+# Имя метрики: (описание, счётчик network.cache.CacheStats)
+CACHE_COUNTERS = {
+    'network_cache_hits_total': ('Попадания в кэш ответов', 'hits'),
+    'network_cache_misses_total': ('Промахи кэша ответов', 'misses'),
+    'network_cache_invalidations_total': ('Сбросы версий кэша ответов', 'invalidations'),
+}
+
+_current = ContextVar('network_request_sample', default=None)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; синхронизацию обеспечивает реестр"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestSample:
+    """Накопители одного HTTP-запроса"""
+    __slots__ = (
+        'queries', 'sql_seconds', 'serialization_seconds', 'serializing',
+        'duration', 'response_bytes', 'request'
+    )
+
+    def __init__(self, request):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serializing = False
+        self.duration = 0.0
+        self.response_bytes = None
+        self.request = request
+
+    @property
+    def endpoint(self):
+        """Имя маршрута; известно после разрешения URL"""
+        match = getattr(self.request, 'resolver_match', None)
+        return (match.url_name or match.view_name) if match else None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._slow_queries = {}
+
+    def observe(self, labels, sample):
+        with self._lock:
+            for name, (_, buckets, attribute) in HISTOGRAMS.items():
+                value = getattr(sample, attribute)
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[name, labels] = Histogram(buckets)
+                histogram.observe(value)
+
+    def record_slow_query(self, endpoint):
+        with self._lock:
+            self._slow_queries[endpoint] = self._slow_queries.get(endpoint, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._slow_queries.clear()
+
+    def render(self, cache_counters=None):
+        """
+        Текстовый формат экспозиции Prometheus 0.0.4; cache_counters —
+        снимок счётчиков кэша ответов (CacheStats.snapshot()).
+        """
+        with self._lock:
+            histograms = {
+                key: (list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()
+            }
+            slow_queries = dict(self._slow_queries)
+        lines = []
+        for name, (description, buckets, _) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                label_text = _format_labels(labels)
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {total}')
+                lines.append(f'{name}_count{{{label_text}}} {count}')
+        lines += [f'# HELP {SLOW_QUERIES} Число медленных SQL-запросов', f'# TYPE {SLOW_QUERIES} counter']
+        for endpoint, count in sorted(slow_queries.items()):
+            lines.append(f'{SLOW_QUERIES}{{endpoint="{_escape(endpoint)}"}} {count}')
+        if cache_counters is not None:
+            for name, (description, counter) in CACHE_COUNTERS.items():
+                lines += [
+                    f'# HELP {name} {description}', f'# TYPE {name} counter', f'{name} {cache_counters[counter]}'
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    endpoint, method = labels
+    return f'endpoint="{_escape(endpoint)}",method="{method}"'
+
+
+registry = MetricsRegistry()
+
+
+def slow_query_threshold():
+    return getattr(settings, 'NETWORK_SLOW_QUERY_MS', 200) / 1000
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка execute: счётчик и время SQL текущего запроса, журнал медленных запросов"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        sample = _current.get()
+        if sample is not None:
+            sample.queries += 1
+            sample.sql_seconds += elapsed
+        if elapsed >= slow_query_threshold():
+            endpoint = (sample.endpoint if sample is not None else None) or 'unresolved'
+            registry.record_slow_query(endpoint)
+            logger.warning('Медленный запрос %.1f мс (%s): %s', elapsed * 1000, endpoint, sql)
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serialization_timer():
+    """
+    Время сериализации текущего запроса. SQL, выполненный внутри
+    (ленивые запросы при обходе связей), вычитается: он учтён как время ORM.
+    Вложенные вызовы не считаются повторно.
+    """
+    sample = _current.get()
+    if sample is None or sample.serializing:
+        yield
+        return
+    sample.serializing = True
+    started, sql_before = time.perf_counter(), sample.sql_seconds
+    try:
+        yield
+    finally:
+        sample.serializing = False
+        sample.serialization_seconds += (
+            time.perf_counter() - started - (sample.sql_seconds - sql_before)
+        )
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSON-рендерер, время которого входит во время сериализации"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serialization_timer():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class RequestMetricsMiddleware:
+    """
+    Сбор метрик запроса, синхронно и под ASGI. Сам SQL считает
+    record_query, который подключается к каждому соединению при его создании.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sample = RequestSample(request)
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, sample, started)
+
+    async def __acall__(self, request):
+        sample = RequestSample(request)
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, sample, started)
+
+    def finish(self, request, response, sample, started):
+        sample.duration = time.perf_counter() - started
+        if not response.streaming:
+            sample.response_bytes = len(response.content)
+        registry.observe((sample.endpoint or 'unresolved', request.method), sample)
+        return response
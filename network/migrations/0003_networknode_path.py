@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    """Заполнение материализованного пути для существующих звеньев"""
+    NetworkNode = apps.get_model('network', 'NetworkNode')
+    parents = dict(NetworkNode.objects.order_by('id').values_list('id', 'supplier_id'))
+    paths = {}
+
+    def build(pk):
+        # подъём к корню без рекурсии: цикл поставщиков даёт понятную ошибку
+        chain = []
+        while pk and pk not in paths:
+            if pk in chain:
+                cycle = chain[chain.index(pk):] + [pk]
+                raise ValueError(
+                    'Цикл поставщиков: ' + ' → '.join(map(str, cycle))
+                    + '. Исправьте supplier_id у этих звеньев и повторите миграцию.'
+                )
+            chain.append(pk)
+            pk = parents[pk]
+        path = paths[pk] if pk else ''
+        for node_pk in reversed(chain):
+            path += f'{node_pk}/'
+            paths[node_pk] = path
+        return path
+
+    nodes = []
+    for pk in parents:
+        nodes.append(NetworkNode(pk=pk, path=build(pk)))
+    NetworkNode.objects.bulk_update(nodes, ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0002_alter_contact_email_alter_networknode_supplier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в иерархии'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
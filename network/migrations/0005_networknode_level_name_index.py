@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0004_networknode_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['level', 'name', 'id'], name='networknode_level_name_idx'),
+        ),
+    ]
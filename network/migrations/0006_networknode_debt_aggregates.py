@@ -0,0 +1,57 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:30
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def fill_aggregates(apps, schema_editor):
+    """Начальный расчёт агрегатов задолженности по материализованным путям"""
+    NetworkNode = apps.get_model('network', 'NetworkNode')
+    rows = list(NetworkNode.objects.values_list('id', 'supplier_id', 'path', 'debt'))
+    counts, customers, subtree = defaultdict(int), defaultdict(Decimal), defaultdict(Decimal)
+    for pk, supplier_id, path, debt in rows:
+        if supplier_id:
+            counts[supplier_id] += 1
+            customers[supplier_id] += debt
+        for ancestor_id in [int(part) for part in path.split('/') if part][:-1]:
+            subtree[ancestor_id] += debt
+
+    nodes = [
+        NetworkNode(
+            pk=pk,
+            customers_count=counts[pk],
+            customers_debt=customers[pk],
+            subtree_debt=subtree[pk]
+        )
+        for pk, *_ in rows
+    ]
+    NetworkNode.objects.bulk_update(
+        nodes, ['customers_count', 'customers_debt', 'subtree_debt'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0005_networknode_level_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='customers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество прямых покупателей'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='customers_debt',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Задолженность прямых покупателей'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='subtree_debt',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=15, verbose_name='Задолженность всей цепочки покупателей'),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def fill_search_documents(apps, schema_editor):
+    """Поисковая строка для существующих звеньев"""
+    NetworkNode = apps.get_model('network', 'NetworkNode')
+    nodes = []
+    for pk, name, city, country in NetworkNode.objects.values_list(
+        'pk', 'name', 'contact__city', 'contact__country'
+    ):
+        nodes.append(NetworkNode(pk=pk, search_document=' '.join((name, city, country)).lower()))
+    NetworkNode.objects.bulk_update(nodes, ['search_document'], batch_size=1000)
+
+
+TRIGRAM_INDEXES = [
+    ('network_networknode', 'search_document', 'networknode_search_trgm_idx'),
+    ('network_contact', 'city', 'contact_city_trgm_idx'),
+    ('network_contact', 'country', 'contact_country_trgm_idx'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Триграммные GIN-индексы создаются только на PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column, name in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, _, name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0006_networknode_debt_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='search_document',
+            field=models.CharField(default='', editable=False, max_length=500, verbose_name='Поисковая строка'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
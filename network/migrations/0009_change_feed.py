@@ -0,0 +1,56 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+def create_node_counter(apps, schema_editor):
+    """Строка счётчика создаётся заранее: next_version обходится одним UPDATE"""
+    apps.get_model('network', 'ChangeCounter').objects.get_or_create(name='nodes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0008_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Счётчик версий',
+                'verbose_name_plural': 'Счётчики версий',
+            },
+        ),
+        migrations.CreateModel(
+            name='NodeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_id', models.BigIntegerField(verbose_name='Идентификатор звена')),
+                ('version', models.BigIntegerField(verbose_name='Версия удаления')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Время удаления')),
+            ],
+            options={
+                'verbose_name': 'Удалённое звено',
+                'verbose_name_plural': 'Удалённые звенья',
+            },
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Версия в ленте изменений'),
+        ),
+        migrations.AddIndex(
+            model_name='networknode',
+            index=models.Index(fields=['version', 'id'], name='networknode_version_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodetombstone',
+            index=models.Index(fields=['version', 'node_id'], name='tombstone_version_node_idx'),
+        ),
+        migrations.RunPython(create_node_counter, migrations.RunPython.noop),
+    ]
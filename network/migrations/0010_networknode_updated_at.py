@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0009_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Время изменения'),
+        ),
+    ]
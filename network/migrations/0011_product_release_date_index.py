@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0010_networknode_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='release_date',
+            field=models.DateField(db_index=True, verbose_name='Дата выхода на рынок'),
+        ),
+    ]
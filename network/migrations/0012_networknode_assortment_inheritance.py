@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0011_product_release_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='networknode',
+            name='excluded_products',
+            field=models.ManyToManyField(blank=True, related_name='excluded_from_nodes', to='network.product', verbose_name='Исключённые продукты поставщика'),
+        ),
+        migrations.AddField(
+            model_name='networknode',
+            name='inherits_assortment',
+            field=models.BooleanField(default=False, verbose_name='Наследует ассортимент поставщика'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0012_networknode_assortment_inheritance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtAdjustment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Изменение задолженности')),
+                ('reference', models.CharField(max_length=100, unique=True, verbose_name='Ссылка на операцию')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время проведения')),
+            ],
+            options={
+                'verbose_name': 'Корректировка задолженности',
+                'verbose_name_plural': 'Корректировки задолженности',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='networknode',
+            constraint=models.CheckConstraint(condition=models.Q(('debt__gte', 0)), name='networknode_debt_non_negative'),
+        ),
+        migrations.AddField(
+            model_name='debtadjustment',
+            name='node',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debt_adjustments', to='network.networknode', verbose_name='Звено сети'),
+        ),
+    ]
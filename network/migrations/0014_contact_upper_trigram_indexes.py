@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# icontains на PostgreSQL — UPPER("city"::text) LIKE UPPER(...): индекс по
+# самой колонке такой запрос не использует, нужен индекс по выражению
+UPPER_TRIGRAM_INDEXES = [
+    ('network_contact', 'city', 'contact_city_upper_trgm_idx', 'contact_city_trgm_idx'),
+    ('network_contact', 'country', 'contact_country_upper_trgm_idx', 'contact_country_trgm_idx'),
+]
+
+
+def create_upper_trigram_indexes(apps, schema_editor):
+    """Триграммные индексы по UPPER() вместо неиспользуемых индексов по колонкам"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column, name, replaced in UPPER_TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {replaced}')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def restore_column_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column, name, replaced in UPPER_TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {replaced} ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0013_debt_adjustments'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trigram_indexes, restore_column_trigram_indexes),
+    ]
@@ -1,6 +1,18 @@
-from django.db import models
+import hashlib
+import secrets
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.core.exceptions import ValidationError
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.lookups import GreaterThanOrEqual, LessThanOrEqual
+from django.db.models.functions import Coalesce, Concat, Length, Substr
+from django.db.models.base import DEFERRED
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from .assortment import AssortmentPlan
 
 
 class ContactManager(models.Manager):
@@ -28,14 +40,40 @@ class Contact(models.Model):
 
 class ProductManager(models.Manager):
     """Менеджер для модели Product"""
-    pass
+
+    def distribution(self, product_ids=None):
+        """
+        Число звеньев с продуктом в ассортименте по уровням:
+        {id продукта: {уровень: звеньев}}. Один GROUP BY по действующему
+        ассортименту (NetworkNode.objects.assortment_cte) с JOIN звена —
+        вместо COUNT на каждый продукт. product_ids — список, queryset
+        с одной колонкой id или None (весь каталог).
+        """
+        distribution = defaultdict(lambda: dict.fromkeys(NetworkNode.LEVELS, 0))
+        cte, params = NetworkNode.objects.assortment_cte(product_ids)
+        if cte is None:
+            return distribution
+        connection = connections[self.db]
+        nodes = connection.ops.quote_name(NetworkNode._meta.db_table)
+        sql = f"""
+            {cte}
+            SELECT assortment.product_id, node.level, COUNT(*)
+            FROM assortment
+            JOIN {nodes} AS node ON node.id = assortment.node_id
+            GROUP BY assortment.product_id, node.level
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for product_id, level, nodes_count in cursor.fetchall():
+                distribution[product_id][level] = nodes_count
+        return distribution
 
 
 class Product(models.Model):
     """Модель продукта"""
     name = models.CharField(max_length=255, verbose_name="Название")
     model = models.CharField(max_length=100, verbose_name="Модель")
-    release_date = models.DateField(verbose_name="Дата выхода на рынок")
+    release_date = models.DateField(db_index=True, verbose_name="Дата выхода на рынок")
 
     objects = ProductManager()
 
@@ -47,8 +85,370 @@ class Product(models.Model):
         return f"{self.name} ({self.model})"
 
 
-class NetworkNodeManager(models.Manager):
+class NetworkNodeQuerySet(models.QuerySet):
+    """QuerySet звеньев сети с запросами по материализованному пути"""
+
+    def descendants_of(self, node):
+        """Все звенья ниже по цепочке поставок (одним запросом по индексу path)"""
+        return self.filter(path__startswith=node.path).exclude(pk=node.pk)
+
+    def ancestors_of(self, node):
+        """Цепочка поставщиков от завода до прямого поставщика"""
+        return self.filter(pk__in=node.get_ancestor_ids()).order_by(Length('path'))
+
+    def carrying(self, product):
+        """Звенья, в действующем ассортименте которых есть продукт (с наследованием)"""
+        cte, params = NetworkNode.objects.db_manager(self.db).assortment_cte([product.pk])
+        return self.filter(pk__in=RawSQL(f'{cte} SELECT node_id FROM assortment', params))
+
+
+class NetworkNodeManager(models.Manager.from_queryset(NetworkNodeQuerySet)):
     """Менеджер для модели NetworkNode"""
+    AGGREGATE_BATCH_SIZE = 500
+
+    def next_version(self):
+        """
+        Следующая версия ленты изменений. Вызывается внутри транзакции,
+        которая пишет звенья: строка счётчика остаётся заблокированной
+        до её завершения, поэтому версии фиксируются строго по возрастанию
+        и клиент ленты не пропустит изменение, зафиксированное позже
+        изменения с большей версией.
+        """
+        connection = connections[self.db]
+        if connection.vendor in ('postgresql', 'sqlite'):
+            # UPDATE ... RETURNING: блокировка и новое значение за один запрос
+            table = connection.ops.quote_name(ChangeCounter._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET value = value + 1 WHERE name = %s RETURNING value',
+                    [ChangeCounter.NODES]
+                )
+                row = cursor.fetchone()
+            if row:
+                return row[0]
+        counter = ChangeCounter.objects.using(self.db)
+        counter.get_or_create(pk=ChangeCounter.NODES)
+        counter.filter(pk=ChangeCounter.NODES).update(value=F('value') + 1)
+        return counter.filter(pk=ChangeCounter.NODES).values_list('value', flat=True).get()
+
+    def change_stamp(self, version=None):
+        """Версия и время изменения для групповых UPDATE"""
+        return {'version': version or self.next_version(), 'updated_at': timezone.now()}
+
+    def touch(self, node_ids, version=None):
+        """Отметка звеньев изменёнными (продукты, контакт) для ленты изменений"""
+        node_ids = list(node_ids)
+        if not node_ids:
+            return 0
+        return self.filter(pk__in=node_ids).update(**self.change_stamp(version))
+
+    def stamped(self, version):
+        """
+        id звеньев с версией version — всё, что изменила транзакция,
+        получившая эту версию (для точечного сброса кэша). Запрос по индексу.
+        """
+        return list(self.filter(version=version).values_list('pk', flat=True))
+
+    def assortment_heirs(self, node_ids):
+        """
+        Звенья, наследующие ассортимент node_ids: наследующие покупатели,
+        их наследующие покупатели и так далее до MAX_LEVEL — один запрос.
+        """
+        node_ids = list(node_ids)
+        if not node_ids:
+            return []
+        condition, chain, prefix = Q(), Q(inherits_assortment=True), ''
+        for _ in range(self.model.MAX_LEVEL):
+            condition |= chain & Q(**{f'{prefix}supplier_id__in': node_ids})
+            prefix += 'supplier__'
+            chain &= Q(**{f'{prefix}inherits_assortment': True})
+        return list(self.filter(condition).values_list('pk', flat=True))
+
+    def touch_assortment(self, node_ids, version=None):
+        """
+        Отметка изменённого ассортимента: сами звенья и наследники получают
+        новую версию одним UPDATE, строки products наследников не меняются.
+        Возвращает id отмеченных звеньев (для сброса кэша).
+        """
+        node_ids = list(node_ids)
+        node_ids += self.assortment_heirs(node_ids)
+        self.touch(node_ids, version)
+        return node_ids
+
+    def attach_assortments(self, nodes):
+        """
+        Действующий ассортимент пакета звеньев в node.assortment не больше
+        чем за три запроса на весь пакет (см. network.assortment).
+        Звеньям нужны колонки path и inherits_assortment.
+        """
+        plan = AssortmentPlan([node for node in nodes if '_assortment' not in node.__dict__])
+        if not plan.nodes:
+            return
+        if plan.missing:
+            plan.add_flags(self.filter(pk__in=plan.missing).values_list('pk', 'inherits_assortment'))
+        products, excluded = self._assortment_rows(plan)
+        plan.attach([(row.networknode_id, row.product) for row in products], excluded)
+
+    def _assortment_rows(self, plan):
+        ids = plan.involved()
+        products = self.model.products.through.objects.filter(
+            networknode_id__in=ids
+        ).select_related('product')
+        excluded = self.model.excluded_products.through.objects.filter(
+            networknode_id__in=plan.inheriting(ids)
+        ).values_list('networknode_id', 'product_id')
+        return products, excluded
+
+    def assortment_cte(self, product_ids=None):
+        """
+        Рекурсивный CTE assortment (node_id, product_id) — действующий
+        ассортимент: собственные строки products и строки поставщика у
+        наследующих покупателей без их исключений. Возвращает (SQL, параметры);
+        (None, []) — пустой набор продуктов.
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        nodes = quote(self.model._meta.db_table)
+        products = quote(self.model.products.through._meta.db_table)
+        excluded = quote(self.model.excluded_products.through._meta.db_table)
+        where, params = '', []
+        if isinstance(product_ids, models.QuerySet):
+            subquery, params = product_ids.query.sql_with_params()
+            where = f'WHERE product_id IN ({subquery})'
+        elif product_ids is not None:
+            product_ids = list(product_ids)
+            if not product_ids:
+                return None, []
+            where = f'WHERE product_id IN ({", ".join(["%s"] * len(product_ids))})'
+            params = product_ids
+        sql = f"""
+            WITH RECURSIVE assortment (node_id, product_id) AS (
+                SELECT networknode_id, product_id FROM {products} {where}
+                UNION
+                SELECT child.id, assortment.product_id
+                FROM assortment
+                JOIN {nodes} AS child ON child.supplier_id = assortment.node_id
+                WHERE child.inherits_assortment AND NOT EXISTS (
+                    SELECT 1 FROM {excluded} AS excluded
+                    WHERE excluded.networknode_id = child.id AND excluded.product_id = assortment.product_id
+                )
+            )
+        """
+        return sql, list(params)
+
+    def move_subtree(self, old_path, old_level, new_path, new_level, exclude_pk=None, version=None):
+        """
+        Перенос поддерева одним UPDATE: префикс пути заменяется,
+        уровень сдвигается на разницу между старым и новым положением корня.
+        """
+        queryset = self.filter(path__startswith=old_path)
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        return queryset.update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+            level=F('level') + (new_level - old_level),
+            **self.change_stamp(version)
+        )
+
+    def propagate_aggregates(self, changes, version=None):
+        """
+        Инкрементальное обновление агрегатов долга одним UPDATE на пачку.
+        changes — итерируемое из (path, debt_delta, total_delta, count_delta):
+        debt_delta и count_delta применяются к прямому поставщику звена,
+        total_delta (долг звена вместе с поддеревом) — ко всем его поставщикам.
+        """
+        subtree, customers, counts = defaultdict(Decimal), defaultdict(Decimal), defaultdict(int)
+        for path, debt_delta, total_delta, count_delta in changes:
+            ancestor_ids = [int(pk) for pk in path.split('/') if pk][:-1]
+            if not ancestor_ids:
+                continue
+            for ancestor_id in ancestor_ids:
+                subtree[ancestor_id] += total_delta
+            customers[ancestor_ids[-1]] += debt_delta
+            counts[ancestor_ids[-1]] += count_delta
+
+        ids = [pk for pk in subtree if subtree[pk] or customers[pk] or counts[pk]]
+        stamp = self.change_stamp(version) if ids else None
+        for start in range(0, len(ids), self.AGGREGATE_BATCH_SIZE):
+            batch = ids[start:start + self.AGGREGATE_BATCH_SIZE]
+            self.filter(pk__in=batch).update(
+                subtree_debt=F('subtree_debt') + self._case(batch, subtree, models.DecimalField()),
+                customers_debt=F('customers_debt') + self._case(batch, customers, models.DecimalField()),
+                customers_count=F('customers_count') + self._case(batch, counts, models.IntegerField()),
+                **stamp,
+            )
+
+    @staticmethod
+    def _case(ids, deltas, output_field):
+        whens = [When(pk=pk, then=Value(deltas[pk])) for pk in ids if deltas.get(pk)]
+        if not whens:
+            return Value(0, output_field=output_field)
+        return Case(*whens, default=Value(0), output_field=output_field)
+
+    def debt_bounds(self):
+        """Допустимые значения долга: от нуля до максимума по max_digits поля"""
+        field = self.model._meta.get_field('debt')
+        step = Decimal(1).scaleb(-field.decimal_places)
+        return Decimal('0'), Decimal(10) ** (field.max_digits - field.decimal_places) - step
+
+    def adjust_debts(self, deltas, version=None):
+        """
+        Изменение долга звеньев на deltas ({id звена: изменение}) групповыми
+        UPDATE debt = debt + CASE без чтения строк до записи: условие в WHERE
+        пропускает звенья, у которых долг вышел бы за debt_bounds. Вызывается
+        внутри транзакции. Возвращает {id: текущий долг или None, если звена
+        нет} для пропущенных звеньев — тогда транзакцию нужно откатить;
+        иначе изменения поднимаются к поставщикам (propagate_aggregates).
+        """
+        stamp = self.change_stamp(version)
+        lower, upper = self.debt_bounds()
+        ids, changes, rejected = list(deltas), [], {}
+        for start in range(0, len(ids), self.AGGREGATE_BATCH_SIZE):
+            batch = ids[start:start + self.AGGREGATE_BATCH_SIZE]
+            debt = F('debt') + self._case(batch, deltas, models.DecimalField())
+            self.filter(pk__in=batch).filter(
+                GreaterThanOrEqual(debt, Value(lower)), LessThanOrEqual(debt, Value(upper))
+            ).update(debt=debt, **stamp)
+            # Версия этого изменения отличает записанные строки от пропущенных
+            rows = {pk: (path, debt, row_version) for pk, path, debt, row_version in self.filter(
+                pk__in=batch
+            ).values_list('pk', 'path', 'debt', 'version')}
+            for pk in batch:
+                if pk not in rows or rows[pk][2] != stamp['version']:
+                    rejected[pk] = rows[pk][1] if pk in rows else None
+                else:
+                    changes.append((rows[pk][0], deltas[pk], deltas[pk], 0))
+        if not rejected:
+            self.propagate_aggregates(changes, stamp['version'])
+        return rejected
+
+    def recompute_aggregates(self):
+        """
+        Полный пересчёт агрегатов долга снизу вверх по уровням: долг
+        поддерева звена — сумма долгов и поддеревьев прямых покупателей,
+        пересчитанных на предыдущем шаге. Подзапросы идут по индексу
+        supplier_id, поэтому каждый шаг линеен по числу звеньев.
+        Все звенья получают новую версию: клиенты ленты перечитают их.
+        """
+        deepest = self.aggregate(deepest=Max('level'))['deepest']
+        if deepest is None:
+            return 0
+        customers = self.model.objects.filter(supplier=OuterRef('pk')).order_by().values('supplier')
+        zero = Value(Decimal('0'), output_field=models.DecimalField())
+        stamp = self.change_stamp()
+        updated = 0
+        for level in range(deepest, -1, -1):
+            updated += self.filter(level=level).update(
+                customers_count=Coalesce(Subquery(customers.annotate(count=Count('pk')).values('count')), 0),
+                customers_debt=Coalesce(Subquery(customers.annotate(total=Sum('debt')).values('total')), zero),
+                subtree_debt=Coalesce(Subquery(
+                    customers.annotate(total=Sum(F('debt') + F('subtree_debt'))).values('total')
+                ), zero),
+                **stamp,
+            )
+        return updated
+
+    # Уровни и пути по ссылкам supplier_id от корней. Звенья в циклах от
+    # корней недостижимы, поэтому рекурсия конечна и на испорченных данных.
+    TREE_CTE = """
+        WITH RECURSIVE tree (id, depth, node_path) AS (
+            SELECT id, 0, CAST(id AS TEXT) || '/'
+            FROM {table}
+            WHERE supplier_id IS NULL
+            UNION ALL
+            SELECT child.id, tree.depth + 1, tree.node_path || CAST(child.id AS TEXT) || '/'
+            FROM {table} AS child
+            JOIN tree ON child.supplier_id = tree.id
+        )
+    """
+
+    def rebuild_tree(self):
+        """
+        Полный пересчёт уровней и путей рекурсивным CTE за один запрос.
+        Обновляются только строки, у которых значения разошлись.
+        Возвращает количество исправленных звеньев.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = f"""
+            UPDATE {table}
+            SET level = tree.depth, path = tree.node_path, version = %s, updated_at = %s
+            FROM (
+                {self.TREE_CTE.format(table=table)}
+                SELECT id, depth, node_path FROM tree
+            ) AS tree
+            WHERE tree.id = {table}.id
+              AND ({table}.level <> tree.depth OR {table}.path <> tree.node_path)
+        """
+        with connection.cursor() as cursor:
+            stamp = self.change_stamp()
+            cursor.execute(sql, [stamp['version'], connection.ops.adapt_datetimefield_value(stamp['updated_at'])])
+            return cursor.rowcount
+
+    def audit_tree(self):
+        """
+        Проверка всей таблицы одним запросом: id звеньев, недостижимых от
+        корней (в цикле или под ним), глубже MAX_LEVEL и с разошедшимися
+        с цепочкой поставщиков уровнем или путём.
+        """
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = f"""
+            {self.TREE_CTE.format(table=table)}
+            SELECT node.id, tree.depth, node.level <> tree.depth OR node.path <> tree.node_path
+            FROM {table} AS node
+            LEFT JOIN tree ON tree.id = node.id
+            WHERE tree.id IS NULL OR tree.depth > %s
+               OR node.level <> tree.depth OR node.path <> tree.node_path
+            ORDER BY node.id
+        """
+        report = {'cycles': [], 'too_deep': [], 'mismatched': []}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.model.MAX_LEVEL])
+            for node_id, depth, mismatched in cursor.fetchall():
+                if depth is None:
+                    report['cycles'].append(node_id)
+                    continue
+                if depth > self.model.MAX_LEVEL:
+                    report['too_deep'].append(node_id)
+                if mismatched:
+                    report['mismatched'].append(node_id)
+        return report
+
+    def check_placement(self, supplier_id, path='', level=0):
+        """
+        Путь и уровень поставщика supplier_id для звена с путём path и
+        уровнем level (path='' — новое звено). ValidationError, если поставщик
+        лежит в поддереве звена (цикл) или поддерево опустится глубже
+        MAX_LEVEL. Один запрос: строка поставщика по первичному ключу
+        и наибольший уровень поддерева по индексу path, без обхода цепочки.
+        """
+        if not supplier_id:
+            return '', -1
+        if path:
+            in_subtree = Q(path__startswith=path)
+            row = self.filter(Q(pk=supplier_id) | in_subtree).aggregate(
+                supplier_path=Max('path', filter=Q(pk=supplier_id)),
+                supplier_level=Max('level', filter=Q(pk=supplier_id)),
+                subtree_level=Max('level', filter=in_subtree),
+            )
+            supplier_path, supplier_level = row['supplier_path'], row['supplier_level']
+            height = (row['subtree_level'] or level) - level
+        else:
+            supplier_path, supplier_level = self.filter(pk=supplier_id).values_list('path', 'level').first() or (None, None)
+            height = 0
+        if supplier_path is None:
+            raise self.model.DoesNotExist('Поставщик не найден')
+        if path and supplier_path.startswith(path):
+            raise ValidationError(
+                {'supplier': 'Поставщик находится в цепочке покупателей звена: получится цикл'}
+            )
+        if supplier_level + 1 + height > self.model.MAX_LEVEL:
+            raise ValidationError({'supplier': (
+                f'Цепочка поставок станет глубже допустимого уровня {self.model.MAX_LEVEL} '
+                f'({dict(self.model.LEVEL_CHOICES)[self.model.MAX_LEVEL]})'
+            )})
+        return supplier_path, supplier_level
 
     def get_queryset(self):
         return super().get_queryset().select_related(
@@ -63,6 +463,8 @@ class NetworkNode(models.Model):
         (1, 'Розничная сеть'),
         (2, 'Индивидуальный предприниматель'),
     ]
+    LEVELS = [level for level, _ in LEVEL_CHOICES]
+    MAX_LEVEL = LEVELS[-1]
 
     name = models.CharField(max_length=255, verbose_name="Название")
     contact = models.ForeignKey(
@@ -76,6 +478,16 @@ class NetworkNode(models.Model):
         related_name='network_nodes',
         verbose_name="Продукты"
     )
+    inherits_assortment = models.BooleanField(
+        default=False,
+        verbose_name="Наследует ассортимент поставщика"
+    )
+    excluded_products = models.ManyToManyField(
+        Product,
+        related_name='excluded_from_nodes',
+        blank=True,
+        verbose_name="Исключённые продукты поставщика"
+    )
     supplier = models.ForeignKey(
         'self',
         on_delete=models.SET_NULL,
@@ -101,24 +513,350 @@ class NetworkNode(models.Model):
         editable=False,
         verbose_name="Уровень иерархии"
     )
+    path = models.CharField(
+        max_length=255,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name="Путь в иерархии"
+    )
+    search_document = models.CharField(
+        max_length=500,
+        default='',
+        editable=False,
+        verbose_name="Поисковая строка"
+    )
+    customers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Количество прямых покупателей"
+    )
+    customers_debt = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Задолженность прямых покупателей"
+    )
+    subtree_debt = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Задолженность всей цепочки покупателей"
+    )
+    version = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Версия в ленте изменений"
+    )
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name="Время изменения"
+    )
+
+    # Колонки, которые поддерживаются групповыми UPDATE
+    MAINTAINED_FIELDS = {'level', 'path', 'customers_count', 'customers_debt', 'subtree_debt'}
+    # Значения, загруженные из БД, по которым save() и сигналы определяют изменения
+    TRACKED_FIELDS = ('supplier_id', 'debt', 'name', 'contact_id', 'inherits_assortment')
 
     objects = NetworkNodeManager()
 
     class Meta:
         verbose_name = "Звено сети"
         verbose_name_plural = "Звенья сети"
+        indexes = [
+            # Составные индексы для keyset-пагинации по каждому полю сортировки
+            models.Index(fields=['name', 'id'], name='networknode_name_id_idx'),
+            models.Index(fields=['level', 'id'], name='networknode_level_id_idx'),
+            models.Index(fields=['debt', 'id'], name='networknode_debt_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='networknode_created_id_idx'),
+            # Списки уровней: фильтр по level с сортировкой по имени
+            models.Index(fields=['level', 'name', 'id'], name='networknode_level_name_idx'),
+            # Лента изменений: keyset по (версия, id)
+            models.Index(fields=['version', 'id'], name='networknode_version_id_idx'),
+        ]
+        constraints = [
+            # Инвариант MinValueValidator для групповых UPDATE в обход валидации модели
+            models.CheckConstraint(condition=models.Q(debt__gte=0), name='networknode_debt_non_negative'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._loaded = {name: loaded.get(name, DEFERRED) for name in cls.TRACKED_FIELDS}
+        return instance
+
     def save(self, *args, **kwargs):
-        """Автоматическое определение уровня иерархии"""
-        if self.supplier:
-            self.level = self.supplier.level + 1
+        """
+        Автоматическое определение уровня иерархии и пути в дереве,
+        поддержка агрегатов задолженности у поставщиков.
+        """
+        update_fields = kwargs.get('update_fields')
+        deferred = self.get_deferred_fields()
+        loaded = getattr(self, '_loaded', {})
+
+        def writes(attname):
+            name = attname.removesuffix('_id')
+            return attname not in deferred and (update_fields is None or name in update_fields)
+
+        if (
+            self._state.adding
+            or (writes('name') and self.name != loaded.get('name', DEFERRED))
+            or (writes('contact_id') and self.contact_id != loaded.get('contact_id', DEFERRED))
+        ):
+            self.search_document = self._build_own_search_document()
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, 'search_document']
+
+        if update_fields is not None:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'version', 'updated_at']
+
+        with transaction.atomic():
+            stamp = NetworkNode.objects.change_stamp()
+            self.version, self.updated_at = stamp['version'], stamp['updated_at']
+            debt_changed = writes('debt') and self.debt != loaded.get('debt', DEFERRED)
+            if self._state.adding:
+                self._insert_into_tree(*args, **kwargs)
+            elif writes('supplier_id') and self.supplier_id != loaded.get('supplier_id', DEFERRED):
+                self._move_in_tree(debt_changed, *args, **kwargs)
+            else:
+                self._save_in_place(debt_changed, *args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded = {
+            name: getattr(self, name) for name in self.TRACKED_FIELDS if name not in deferred
+        }
+
+    @staticmethod
+    def build_search_document(name, city, country):
+        """Строка для поиска: название и адрес в нижнем регистре"""
+        return ' '.join((name, city, country)).lower()
+
+    def _build_own_search_document(self):
+        if NetworkNode.contact.is_cached(self):
+            city, country = self.contact.city, self.contact.country
+        else:
+            city, country = Contact.objects.filter(
+                pk=self.contact_id
+            ).values_list('city', 'country').get()
+        return self.build_search_document(self.name, city, country)
+
+    def _writable_fields(self, update_fields, include=(), debt_changed=False):
+        """
+        Поля для UPDATE: уровень, путь и агрегаты поддерживаются групповыми
+        запросами, поэтому значения из памяти в БД не записываются. Долг
+        тоже меняют групповые UPDATE (adjust_debts): он записывается, только
+        если изменён в этом экземпляре, иначе устаревшее значение затёрло бы
+        корректировку.
+        """
+        skipped = self.MAINTAINED_FIELDS - set(include)
+        if not debt_changed:
+            skipped |= {'debt'}
+        deferred = self.get_deferred_fields()
+        names = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in skipped and field.attname not in deferred
+        ]
+        if update_fields is not None:
+            names = [name for name in names if name in update_fields or name in include]
+        return names
+
+    def clean(self):
+        """Поставщик не из своего поддерева и глубина не больше MAX_LEVEL (формы админки)"""
+        super().clean()
+        if self.supplier_id:
+            NetworkNode.objects.check_placement(
+                self.supplier_id, '' if self._state.adding else self.path, self.level
+            )
+
+    def _insert_into_tree(self, *args, **kwargs):
+        parent_path, parent_level = NetworkNode.objects.check_placement(self.supplier_id)
+        self.level = parent_level + 1
+        if self.pk:
+            self.path = f'{parent_path}{self.pk}/'
+            super().save(*args, **kwargs)
         else:
-            self.level = 0
+            super().save(*args, **kwargs)
+            self.path = f'{parent_path}{self.pk}/'
+            NetworkNode.objects.filter(pk=self.pk).update(path=self.path)
+        debt = self._meta.get_field('debt').to_python(self.debt)
+        NetworkNode.objects.propagate_aggregates([(self.path, debt, debt, 1)], self.version)
+
+    def _move_in_tree(self, debt_changed, *args, **kwargs):
+        """Смена поставщика: перенос поддерева и перенос агрегатов долга"""
+        old_path, old_level, old_debt, subtree_debt = NetworkNode.objects.select_for_update().filter(
+            pk=self.pk
+        ).values_list('path', 'level', 'debt', 'subtree_debt').get()
+        # Транзакция уже держит строку счётчика версий (change_stamp), поэтому
+        # параллельные переносы выполнены до проверки и цикл не пропустят
+        parent_path, parent_level = NetworkNode.objects.check_placement(self.supplier_id, old_path, old_level)
+        self.level = parent_level + 1
+        self.path = f'{parent_path}{self.pk}/'
+        if not debt_changed:
+            self.debt = old_debt
+        kwargs['update_fields'] = self._writable_fields(
+            kwargs.get('update_fields'), include=('level', 'path'), debt_changed=debt_changed
+        )
+        super().save(*args, **kwargs)
+        if old_path != self.path:
+            NetworkNode.objects.move_subtree(
+                old_path, old_level, self.path, self.level, exclude_pk=self.pk, version=self.version
+            )
+        debt = self._meta.get_field('debt').to_python(self.debt)
+        NetworkNode.objects.propagate_aggregates([
+            (old_path, -old_debt, -(old_debt + subtree_debt), -1),
+            (self.path, debt, debt + subtree_debt, 1),
+        ], self.version)
+
+    def _save_in_place(self, debt_changed, *args, **kwargs):
+        """Сохранение без смены поставщика; изменение долга поднимается к поставщикам"""
+        kwargs['update_fields'] = self._writable_fields(kwargs.get('update_fields'), debt_changed=debt_changed)
+        if not debt_changed:
+            super().save(*args, **kwargs)
+            return
+        path, old_debt = NetworkNode.objects.select_for_update().filter(
+            pk=self.pk
+        ).values_list('path', 'debt').get()
         super().save(*args, **kwargs)
+        delta = self._meta.get_field('debt').to_python(self.debt) - old_debt
+        if delta:
+            NetworkNode.objects.propagate_aggregates([(path, delta, delta, 0)], self.version)
+
+    @property
+    def assortment(self):
+        """
+        Действующий ассортимент: products, а при inherits_assortment — ещё и
+        ассортимент поставщика без excluded_products. Списки заполняют его
+        пакетно через NetworkNode.objects.attach_assortments.
+        """
+        if '_assortment' not in self.__dict__:
+            NetworkNode.objects.attach_assortments([self])
+        return self._assortment
+
+    def get_ancestor_ids(self):
+        """Идентификаторы всех поставщиков вверх по цепочке, взятые из пути"""
+        return [int(pk) for pk in self.path.split('/') if pk][:-1]
 
     def get_level_display_name(self):
         """Получение отображаемого названия уровня"""
         return dict(self.LEVEL_CHOICES).get(self.level, "Неизвестный уровень")
+
+
+class ChangeCounter(models.Model):
+    """Счётчики версий ленты изменений"""
+    NODES = 'nodes'
+    # Версия, до которой надгробия удалены: более ранние токены лента не принимает
+    NODES_HORIZON = 'nodes_horizon'
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Счётчик версий"
+        verbose_name_plural = "Счётчики версий"
+
+
+class NodeTombstone(models.Model):
+    """Запись об удалённом звене для ленты изменений"""
+    node_id = models.BigIntegerField(verbose_name="Идентификатор звена")
+    version = models.BigIntegerField(verbose_name="Версия удаления")
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Время удаления")
+
+    class Meta:
+        verbose_name = "Удалённое звено"
+        verbose_name_plural = "Удалённые звенья"
+        indexes = [
+            models.Index(fields=['version', 'node_id'], name='tombstone_version_node_idx'),
+        ]
+
+
+class DebtAdjustment(models.Model):
+    """
+    Проведённая корректировка задолженности (платёж или начисление).
+    Уникальная ссылка делает повторную отправку той же корректировки
+    безопасной: она не применяется второй раз.
+    """
+    node = models.ForeignKey(
+        NetworkNode,
+        on_delete=models.CASCADE,
+        related_name='debt_adjustments',
+        verbose_name="Звено сети"
+    )
+    delta = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Изменение задолженности")
+    reference = models.CharField(max_length=100, unique=True, verbose_name="Ссылка на операцию")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время проведения")
+
+    class Meta:
+        verbose_name = "Корректировка задолженности"
+        verbose_name_plural = "Корректировки задолженности"
+
+    def __str__(self):
+        return f"{self.reference}: {self.delta}"
+
+
+class ApiTokenQuerySet(models.QuerySet):
+    def active(self):
+        now = timezone.now()
+        return self.filter(revoked_at__isnull=True).filter(
+            models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=now)
+        )
+
+
+class ApiToken(models.Model):
+    """
+    Токен API интеграций. Хранится только SHA-256 ключа: у случайного
+    ключа 256 бит энтропии, медленный хеш вроде PBKDF2 ему не нужен.
+    Сам ключ показывается один раз при выпуске.
+    """
+    PREFIX_LENGTH = 8
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='api_tokens',
+        verbose_name="Пользователь"
+    )
+    name = models.CharField(max_length=100, blank=True, verbose_name="Назначение")
+    prefix = models.CharField(max_length=PREFIX_LENGTH, editable=False, verbose_name="Начало ключа")
+    key_hash = models.CharField(max_length=64, unique=True, editable=False, verbose_name="Хеш ключа")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время выпуска")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Действует до")
+    revoked_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Время отзыва")
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Последнее использование")
+
+    objects = ApiTokenQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Токен API"
+        verbose_name_plural = "Токены API"
+
+    def __str__(self):
+        return f"{self.prefix}… ({self.user})"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name='', expires_at=None):
+        """Выпуск токена; возвращает (токен, ключ)"""
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(
+            user=user, name=name, prefix=key[:cls.PREFIX_LENGTH],
+            key_hash=cls.hash_key(key), expires_at=expires_at
+        )
+        return token, key
+
+    @property
+    def is_active(self):
+        return self.revoked_at is None and (self.expires_at is None or self.expires_at > timezone.now())
+
+    def revoke(self):
+        if self.revoked_at is None:
+            self.revoked_at = timezone.now()
+            self.save(update_fields=['revoked_at'])
@@ -0,0 +1,126 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
+from urllib import parse
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class NetworkNodeKeysetPagination(CursorPagination):
+    """
+    Keyset-пагинация звеньев сети.
+    Позиция курсора — пара (значение поля сортировки, id), поэтому каждая
+    страница выбирается по составному индексу без OFFSET и без COUNT(*).
+    Сортировка берётся из OrderingFilter (учитывается первое поле).
+    """
+    ordering = 'name'
+    tie_breaker = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.order = self.get_ordering(request, queryset, view)[0]
+        self.field_name = self.order.lstrip('-')
+        self.model_field = queryset.model._meta.get_field(self.field_name)
+
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        descending = self.order.startswith('-') != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field_name, prefix + self.tie_breaker)
+
+        if self.cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            value, pk = self.cursor['value'], self.cursor['id']
+            # Ведущее условие-диапазон (>= / <=) даёт поиск по индексу с позиции
+            # курсора: одно OR без него база читает индекс с начала
+            queryset = queryset.filter(
+                Q(**{f'{self.field_name}__{lookup}e': value}),
+                Q(**{f'{self.field_name}__{lookup}': value})
+                | Q(**{self.field_name: value, f'{self.tie_breaker}__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def page_state(self):
+        """
+        Состояние страницы для ETag (cached_response) по её же строкам:
+        агрегат с COUNT по всему набору keyset-странице не нужен
+        """
+        return {
+            'version': max((node.version for node in self.page), default=None),
+            'count': len(self.page),
+            'page': ([node.pk for node in self.page], self.has_next, self.has_previous),
+        }
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            querystring = urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            tokens = dict(parse.parse_qsl(querystring, keep_blank_values=True))
+            if tokens['o'] != self.order:
+                raise ValueError
+            return {
+                'value': self.model_field.to_python(tokens['v']),
+                'id': int(tokens['i']),
+                'reverse': tokens.get('r') == '1',
+            }
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse=False):
+        tokens = {
+            'o': self.order,
+            'v': str(getattr(instance, self.field_name)),
+            'i': str(getattr(instance, self.tie_breaker)),
+        }
+        if reverse:
+            tokens['r'] = '1'
+        encoded = urlsafe_b64encode(parse.urlencode(tokens).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class KnownCountPaginator(Paginator):
+    def __init__(self, *args, known_count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if known_count is not None:
+            self.count = known_count
+
+
+class NetworkNodePageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация, которая не повторяет COUNT(*), если число
+    строк уже посчитано для ETag (view.known_count).
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            KnownCountPaginator, known_count=getattr(view, 'known_count', None)
+        )
+        return super().paginate_queryset(queryset, request, view)
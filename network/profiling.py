@@ -0,0 +1,183 @@
+"""
+Профилирование отдельных запросов API через cProfile. Включается
+заголовком X-Profile от сотрудника (профили остальных не сохраняются)
+или случайной выборкой с долей NETWORK_PROFILE_SAMPLE_RATE. Рядом с каждым
+.prof лежит .json с эндпоинтом, представлением, действием и параметрами.
+"""
+import cProfile
+import json
+import os
+import random
+import time
+import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from datetime import datetime, timezone
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from .authentication import TokenAuthentication, token_key
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+def profile_dir():
+    return getattr(settings, 'NETWORK_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def sample_rate():
+    return getattr(settings, 'NETWORK_PROFILE_SAMPLE_RATE', 0)
+
+
+def is_staff(user):
+    return bool(user and user.is_authenticated and user.is_active and (user.is_staff or user.is_superuser))
+
+
+def header_staff(request):
+    """
+    Сотрудник ли автор запроса с X-Profile: по сессии или по токену — через
+    кэш токенов, из которого его затем возьмёт и представление. Для Basic
+    None: повторная проверка пароля стоила бы второго PBKDF2, поэтому
+    права проверяются по request.user после ответа.
+    """
+    if is_staff(getattr(request, 'user', None)):
+        return True
+    if 'HTTP_AUTHORIZATION' not in request.META:
+        return False
+    try:
+        if token_key(request) is None:
+            return None
+        credentials = TokenAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return is_staff(credentials[0])
+
+
+def list_profiles(directory=None):
+    """Метаданные сохранённых профилей, новые первыми"""
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            meta = json.load(file)
+        meta['profile'] = os.path.join(directory, name[:-len('.json')] + '.prof')
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta['started_at'], reverse=True)
+
+
+def save_profile(profiler, meta, directory=None):
+    directory = directory or profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    base = os.path.join(directory, f'{stamp}-{meta["endpoint"]}-{uuid.uuid4().hex[:8]}')
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w', encoding='utf-8') as file:
+        json.dump(meta, file, ensure_ascii=False, indent=2)
+    prune_profiles(directory)
+    return base + '.prof'
+
+
+def prune_profiles(directory):
+    """Хранятся только NETWORK_PROFILE_KEEP последних профилей"""
+    keep = getattr(settings, 'NETWORK_PROFILE_KEEP', 200)
+    for meta in list_profiles(directory)[keep:]:
+        for path in (meta['profile'], meta['profile'][:-len('.prof')] + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class RequestProfilingMiddleware:
+    """
+    Без заголовка и при нулевой доле выборки запрос проходит без
+    профилировщика: проверка сводится к поиску ключа в request.META.
+    С заголовком пользователь проверяется до запуска профилировщика;
+    при Basic — после ответа, и профиль не сотрудника не сохраняется.
+    Под ASGI в профиль попадают и другие корутины, выполнявшиеся
+    в том же потоке, пока запрос ожидал.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        staff = PROFILE_HEADER in request.META and header_staff(request)
+        trigger = self.trigger(request, staff is not False)
+        profiler = self.start(trigger)
+        if profiler is None:
+            return self.get_response(request)
+        started_at, started = datetime.now(timezone.utc), time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.finish(request, response, profiler, trigger, staff, started_at, started)
+
+    async def __acall__(self, request):
+        staff = PROFILE_HEADER in request.META and await sync_to_async(header_staff)(request)
+        trigger = self.trigger(request, staff is not False)
+        profiler = self.start(trigger)
+        if profiler is None:
+            return await self.get_response(request)
+        started_at, started = datetime.now(timezone.utc), time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        return self.finish(request, response, profiler, trigger, staff, started_at, started)
+
+    def start(self, trigger):
+        if trigger is None:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Уже работает другой профилировщик
+            return None
+        return profiler
+
+    def finish(self, request, response, profiler, trigger, staff, started_at, started):
+        if trigger == 'header' and staff is None and not is_staff(getattr(request, 'user', None)):
+            # Пользователя Basic аутентифицировало представление: не сотрудник
+            return response
+        duration = time.perf_counter() - started
+        meta = self.describe(request, response, trigger, duration)
+        meta['started_at'] = started_at.isoformat()
+        path = save_profile(profiler, meta)
+        if trigger == 'header':
+            response['X-Profile-File'] = os.path.basename(path)
+        return response
+
+    def trigger(self, request, staff):
+        if staff:
+            return 'header'
+        rate = sample_rate()
+        if rate and random.random() < rate:
+            return 'sample'
+        return None
+
+    def describe(self, request, response, trigger, duration):
+        match = request.resolver_match
+        view = getattr(match.func, 'cls', None) if match else None
+        actions = (getattr(match.func, 'actions', None) or {}) if match else {}
+        return {
+            'endpoint': (match.url_name if match else None) or 'unresolved',
+            'view': f'{view.__module__}.{view.__name__}' if view else None,
+            'action': actions.get(request.method.lower()),
+            'method': request.method,
+            'path': request.path,
+            'query_params': {key: request.GET.getlist(key) for key in request.GET},
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'trigger': trigger,
+            'user': getattr(getattr(request, 'user', None), 'username', None),
+        }
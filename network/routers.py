@@ -0,0 +1,250 @@
+"""
+Чтение с реплик. Маршрутизатор отправляет чтение на реплику только внутри
+области replica_reads: её открывают безопасные запросы NetworkNodeViewSet
+(включая выгрузку) и changelist админки. Всё остальное, в том числе
+чтение внутри логики записи, идёт на основную БД.
+
+После записи клиент привязывается к основной БД на
+NETWORK_REPLICA_STICKY_SECONDS: cookie для браузеров и ключ в кэше
+по пользователю для API-клиентов без cookie.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger('network.replicas')
+
+STICKY_COOKIE = 'network_primary_until'
+STICKY_CACHE_KEY = 'network:primary-until:{}'
+# Если реплика догнала основную БД, отставание нулевое даже при давней последней транзакции
+POSTGRES_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+_read_alias = ContextVar('network_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'NETWORK_READ_REPLICAS', [])
+
+
+def current_read_alias():
+    """Реплика текущей области чтения; None — основная БД"""
+    return _read_alias.get()
+
+
+class ReplicaPool:
+    """
+    Здоровье реплик с кэшированием результата на NETWORK_REPLICA_HEALTH_INTERVAL.
+    Реплика нездорова, если недоступна или отстаёт больше
+    NETWORK_REPLICA_MAX_LAG_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+
+    def choose(self):
+        healthy = [alias for alias in replica_aliases() if self.is_healthy(alias)]
+        return random.choice(healthy) if healthy else None
+
+    def is_healthy(self, alias):
+        interval = getattr(settings, 'NETWORK_REPLICA_HEALTH_INTERVAL', 10)
+        with self._lock:
+            status = self._status.get(alias)
+        if status is not None and time.monotonic() - status[1] < interval:
+            return status[0]
+        healthy = self.check(alias)
+        with self._lock:
+            self._status[alias] = (healthy, time.monotonic())
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor != 'postgresql':
+                    cursor.execute('SELECT 1')
+                    return True
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = cursor.fetchone()[0] or 0
+        except DatabaseError as error:
+            logger.warning('Реплика %s недоступна: %s', alias, error)
+            connection.close()
+            return False
+        max_lag = getattr(settings, 'NETWORK_REPLICA_MAX_LAG_SECONDS', 5)
+        if lag > max_lag:
+            logger.warning('Реплика %s отстаёт на %.1f с', alias, lag)
+            return False
+        return True
+
+    def mark_unhealthy(self, alias):
+        with self._lock:
+            self._status[alias] = (False, time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+pool = ReplicaPool()
+
+
+def _pin_cache():
+    return caches[getattr(settings, 'NETWORK_CACHE_ALIAS', 'default')]
+
+
+def sticky_seconds():
+    return getattr(settings, 'NETWORK_REPLICA_STICKY_SECONDS', 5)
+
+
+def is_pinned(request):
+    """Клиент недавно писал и должен читать с основной БД"""
+    now = time.time()
+    try:
+        if float(request.COOKIES.get(STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return (_pin_cache().get(STICKY_CACHE_KEY.format(user.pk)) or 0) > now
+    return False
+
+
+def pin_to_primary(request, response):
+    """Привязка клиента к основной БД после успешной записи"""
+    if not replica_aliases():
+        return
+    seconds = sticky_seconds()
+    until = time.time() + seconds
+    response.set_cookie(
+        STICKY_COOKIE, f'{until:.3f}', max_age=int(seconds) + 1, httponly=True, samesite='Lax'
+    )
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        _pin_cache().set(STICKY_CACHE_KEY.format(user.pk), until, int(seconds) + 1)
+
+
+def start_replica_reads(request):
+    """Открывает область чтения с реплики; возвращает токен для end_replica_reads"""
+    if not replica_aliases() or is_pinned(request):
+        return None
+    alias = pool.choose()
+    return _read_alias.set(alias) if alias else None
+
+
+def end_replica_reads(token):
+    if token is not None:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def replica_reads(request):
+    token = start_replica_reads(request)
+    try:
+        yield current_read_alias()
+    finally:
+        end_replica_reads(token)
+
+
+@contextmanager
+def primary_reads():
+    """Временный возврат на основную БД внутри области реплики"""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение — на реплику текущей области, запись и миграции — на основную БД"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаются из той же БД, что и сам объект
+            return instance._state.db
+        return current_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
+
+
+class ReplicaReadViewMixin:
+    """
+    Безопасные запросы представления DRF читают с реплики: область
+    открывается после аутентификации, чтобы учесть привязку пользователя.
+    Если реплика отказала посреди запроса, он повторяется на основной БД.
+    Успешная запись привязывает клиента к основной БД.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in self.SAFE_METHODS:
+            self._replica_token = start_replica_reads(request)
+
+    def handle_exception(self, exc):
+        alias = current_read_alias()
+        if alias is not None and isinstance(exc, DatabaseError):
+            logger.warning('Чтение с реплики %s не удалось, повтор на основной БД: %s', alias, exc)
+            # Сломанное соединение закроется по сигналу конца запроса
+            pool.mark_unhealthy(alias)
+            handler = getattr(self, self.request.method.lower(), self.http_method_not_allowed)
+            try:
+                with primary_reads():
+                    return handler(self.request, *self.args, **self.kwargs)
+            except Exception as retry_exc:
+                return super().handle_exception(retry_exc)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        end_replica_reads(getattr(self, '_replica_token', None))
+        self._replica_token = None
+        if request.method not in self.SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request, response)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaReadAdminMixin:
+    """Changelist админки читает с реплики; сохранения и действия привязывают к основной БД"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            response = super().changelist_view(request, extra_context)
+            if response.status_code == 302:
+                pin_to_primary(request, response)
+            return response
+        with replica_reads(request):
+            response = super().changelist_view(request, extra_context)
+            # Шаблон выполняет запросы при рендеринге: рендерим внутри области
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        response = super().changeform_view(request, object_id, form_url, extra_context)
+        if request.method == 'POST' and response.status_code == 302:
+            pin_to_primary(request, response)
+        return response
+
+    def delete_view(self, request, object_id, extra_context=None):
+        response = super().delete_view(request, object_id, extra_context)
+        if request.method == 'POST' and response.status_code == 302:
+            pin_to_primary(request, response)
+        return response
@@ -0,0 +1,68 @@
+from django.db import connections
+from django.db.models import Case, FloatField, Value, When
+from rest_framework import filters
+
+
+class FallbackSearchEngine:
+    """
+    Поиск без расширений СУБД (SQLite в тестах): все слова запроса должны
+    входить в поисковую строку, ранг — по совпадению с названием.
+    """
+
+    def filter(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(search_document__contains=term)
+        return queryset
+
+    def rank(self, queryset, query):
+        return queryset.annotate(rank=Case(
+            When(search_document__startswith=query, then=Value(1.0)),
+            When(search_document__contains=query, then=Value(0.5)),
+            default=Value(0.1),
+            output_field=FloatField()
+        ))
+
+
+class TrigramSearchEngine(FallbackSearchEngine):
+    """
+    PostgreSQL: LIKE по поисковой строке обслуживается GIN-индексом
+    gin_trgm_ops, ранг — сходство слов по триграммам (pg_trgm).
+    """
+
+    def rank(self, queryset, query):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        return queryset.annotate(rank=TrigramWordSimilarity(query, 'search_document'))
+
+
+def get_search_engine(queryset):
+    if connections[queryset.db].vendor == 'postgresql':
+        return TrigramSearchEngine()
+    return FallbackSearchEngine()
+
+
+def normalize_query(query):
+    """Запрос в нижнем регистре, как и поисковая строка, и его слова"""
+    query = ' '.join(query.lower().split())
+    return query, query.split()
+
+
+def search_nodes(queryset, query):
+    """Звенья, содержащие все слова запроса, упорядоченные по релевантности"""
+    query, terms = normalize_query(query)
+    engine = get_search_engine(queryset)
+    queryset = engine.rank(engine.filter(queryset, terms), query)
+    return queryset.order_by('-rank', 'name', 'id')
+
+
+class NetworkNodeSearchFilter(filters.SearchFilter):
+    """
+    ?search= по денормализованной поисковой строке. Слова приводятся
+    к нижнему регистру в Python, поэтому регистр не зависит от СУБД,
+    а на PostgreSQL условие LIKE использует триграммный индекс.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        _, terms = normalize_query(' '.join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+        return get_search_engine(queryset).filter(queryset, terms)
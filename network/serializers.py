@@ -1,5 +1,65 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models, transaction
 from rest_framework import serializers
-from .models import NetworkNode, Contact, Product
+from .metrics import serialization_timer
+from .models import DebtAdjustment, NetworkNode, Contact, Product
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with serialization_timer():
+            return super().data
+
+
+class NetworkNodeListSerializer(TimedListSerializer):
+    """Список звеньев: действующий ассортимент всей страницы разрешается пакетно"""
+
+    def to_representation(self, data):
+        nodes = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if 'products' in self.child.fields:
+            NetworkNode.objects.attach_assortments(nodes)
+        return super().to_representation(nodes)
+
+
+class TimedSerializationMixin:
+    """Время построения .data учитывается в метриках сериализации запроса"""
+
+    @property
+    def data(self):
+        with serialization_timer():
+            return super().data
+
+
+class DynamicFieldsMixin:
+    """
+    Разреженные наборы полей.
+    fields=['id', 'name'] ограничивает вывод перечисленными полями;
+    expand=['contact'] разворачивает во вложенные объекты только
+    перечисленные связи из expandable_fields, остальные отдаются
+    идентификаторами. expand=None разворачивает все связи.
+    """
+    expandable_fields = {}
+
+    @classmethod
+    def check_fields(cls, fields):
+        """Имена из ?fields=, которых нет среди выводимых полей, — ошибка со списком"""
+        readable = {name for name, field in cls().fields.items() if not field.write_only}
+        unknown = set(fields) - readable
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Неизвестные поля: {", ".join(sorted(unknown))}.']})
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+        if expand is not None:
+            for field_name, make_field in self.expandable_fields.items():
+                if field_name in self.fields and field_name not in expand:
+                    self.fields[field_name] = make_field()
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -14,14 +74,41 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'model', 'release_date']
 
 
-class NetworkNodeSerializer(serializers.ModelSerializer):
+class ProductCatalogSerializer(TimedSerializationMixin, serializers.ModelSerializer):
+    """
+    Продукт каталога с числом звеньев, у которых он в ассортименте, по уровням.
+    Распределение передаётся в context['distribution'] одним запросом на страницу.
+    """
+    nodes_by_level = serializers.SerializerMethodField()
+    nodes_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'model', 'release_date', 'nodes_count', 'nodes_by_level']
+        list_serializer_class = TimedListSerializer
+
+    def _distribution(self, product):
+        distribution = self.context.get('distribution')
+        if distribution is None:
+            distribution = Product.objects.distribution([product.pk])
+        return distribution.get(product.pk) or dict.fromkeys(NetworkNode.LEVELS, 0)
+
+    def get_nodes_by_level(self, product):
+        return self._distribution(product)
+
+    def get_nodes_count(self, product):
+        return sum(self._distribution(product).values())
+
+
+class NetworkNodeSerializer(TimedSerializationMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     contact = ContactSerializer(read_only=True)
     contact_id = serializers.PrimaryKeyRelatedField(
         queryset=Contact.objects.all(),
         source='contact',
         write_only=True
     )
-    products = ProductSerializer(many=True, read_only=True)
+    # Действующий ассортимент (с наследованием), products_ids — собственные строки
+    products = ProductSerializer(many=True, read_only=True, source='assortment')
     products_ids = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(),
         source='products',
@@ -40,14 +127,92 @@ class NetworkNodeSerializer(serializers.ModelSerializer):
         read_only=True
     )
 
+    expandable_fields = {
+        'contact': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'products': lambda: serializers.PrimaryKeyRelatedField(read_only=True, many=True, source='assortment'),
+    }
+
     class Meta:
         model = NetworkNode
         fields = [
             'id', 'name', 'contact', 'contact_id', 'products', 'products_ids',
-            'supplier', 'supplier_id', 'debt', 'level', 'level_display',
-            'created_at'
+            'inherits_assortment', 'supplier', 'supplier_id', 'debt', 'level',
+            'level_display', 'created_at'
         ]
         read_only_fields = ['debt', 'level', 'created_at']
+        list_serializer_class = NetworkNodeListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=None, extra_columns=()):
+        """
+        Подготовка queryset под запрошенные поля: .only() по нужным колонкам,
+        JOIN только для запрошенных связей. Ассортимент не предзагружается:
+        его разрешает NetworkNodeListSerializer по path и inherits_assortment.
+        """
+        def wanted(name):
+            return fields is None or name in fields
+
+        def expanded(name):
+            return expand is None or name in expand
+
+        queryset = queryset.select_related(None).prefetch_related(None)
+        columns = {'id', *extra_columns}
+        columns.update(
+            name for name in ('name', 'inherits_assortment', 'debt', 'level', 'created_at') if wanted(name)
+        )
+        if wanted('level_display'):
+            columns.add('level')
+        if wanted('contact'):
+            columns.add('contact')
+            if expanded('contact'):
+                queryset = queryset.select_related('contact')
+        if wanted('supplier'):
+            columns.update({'supplier', 'supplier__name'})
+            queryset = queryset.select_related('supplier')
+        if wanted('products'):
+            columns.update({'path', 'inherits_assortment'})
+        return queryset.only(*columns)
+
+
+class NetworkNodeDebtSummarySerializer(TimedSerializationMixin, serializers.ModelSerializer):
+    """Задолженность звена вместе с агрегатами по его покупателям"""
+
+    class Meta:
+        model = NetworkNode
+        fields = [
+            'id', 'name', 'level', 'debt', 'customers_count',
+            'customers_debt', 'subtree_debt'
+        ]
+        read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+
+
+class PrimaryKeyListField(serializers.ManyRelatedField):
+    """
+    Список первичных ключей, разрешаемый одним запросом in_bulk, а не
+    запросом на каждый ключ; ошибки — те же, что у child_relation
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pk_field = child.get_queryset().model._meta.pk
+        pks = []
+        for item in data:
+            try:
+                if isinstance(item, bool):
+                    raise DjangoValidationError('')
+                pks.append(pk_field.to_python(item))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(item).__name__)
+        objects = child.get_queryset().in_bulk(set(pks))
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
 
 
 class NetworkNodeCreateUpdateSerializer(serializers.ModelSerializer):
@@ -56,13 +221,17 @@ class NetworkNodeCreateUpdateSerializer(serializers.ModelSerializer):
         queryset=Contact.objects.all(),
         source='contact'
     )
-    products_ids = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
-        source='products',
-        many=True
+    products_ids = PrimaryKeyListField(
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=Product.objects.all()),
+        source='products'
+    )
+    excluded_products_ids = PrimaryKeyListField(
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=Product.objects.all()),
+        source='excluded_products',
+        required=False
     )
     supplier_id = serializers.PrimaryKeyRelatedField(
-        queryset=NetworkNode.objects.all(),
+        queryset=NetworkNode.objects.select_related(None).prefetch_related(None),
         source='supplier',
         allow_null=True
     )
@@ -70,34 +239,116 @@ class NetworkNodeCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = NetworkNode
         fields = [
-            'id', 'name', 'contact_id', 'products_ids',
-            'supplier_id', 'debt', 'created_at'
+            'id', 'name', 'contact_id', 'products_ids', 'inherits_assortment',
+            'excluded_products_ids', 'supplier_id', 'debt', 'created_at'
         ]
         read_only_fields = ['debt', 'created_at']
 
     def validate_supplier_id(self, value):
-        """Валидация поставщика для предотвращения циклических ссылок"""
+        """
+        Валидация поставщика: без циклов (и самого звена) в цепочке
+        и без выхода за допустимый уровень — одним запросом. Новое звено
+        проверяет только save() под блокировкой: циклов у него не бывает.
+        """
         if value and self.instance:
             if value.id == self.instance.id:
                 raise serializers.ValidationError(
                     "Звено сети не может быть своим собственным поставщиком"
                 )
+            try:
+                NetworkNode.objects.check_placement(value.id, self.instance.path, self.instance.level)
+            except DjangoValidationError as error:
+                raise serializers.ValidationError(error.message_dict['supplier'])
         return value
 
+    @staticmethod
+    def _save_node(node):
+        """Сохранение с повторной проверкой размещения под блокировкой"""
+        try:
+            node.save()
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'supplier_id': error.message_dict['supplier']})
+
     def create(self, validated_data):
         products = validated_data.pop('products', [])
-        node = NetworkNode.objects.create(**validated_data)
-        node.products.set(products)
+        excluded_products = validated_data.pop('excluded_products', [])
+        node = NetworkNode(**validated_data)
+        # Строки M2M пишутся в транзакции вставки и покрываются её версией:
+        # наследников у нового звена нет, отдельная отметка не нужна
+        with transaction.atomic():
+            self._save_node(node)
+            for field, rows in (('products', products), ('excluded_products', excluded_products)):
+                through = getattr(NetworkNode, field).through
+                through.objects.bulk_create(
+                    [through(networknode_id=node.pk, product_id=product.pk) for product in dict.fromkeys(rows)]
+                )
         return node
 
     def update(self, instance, validated_data):
         products = validated_data.pop('products', None)
+        excluded_products = validated_data.pop('excluded_products', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        self._save_node(instance)
 
         if products is not None:
             instance.products.set(products)
+        if excluded_products is not None:
+            instance.excluded_products.set(excluded_products)
 
         return instance
+
+
+class NetworkNodeBulkItemSerializer(serializers.Serializer):
+    """
+    Элемент пакетной загрузки. Без id звено создаётся, с id — обновляется.
+    Внешние ключи здесь не разрешаются: их проверяет BulkNodeWriter
+    одним запросом на модель. supplier_ref ссылается на ref другого
+    нового звена этого же пакета.
+    """
+    id = serializers.IntegerField(required=False)
+    ref = serializers.CharField(required=False, max_length=100)
+    name = serializers.CharField(required=False, max_length=255)
+    contact_id = serializers.IntegerField(required=False)
+    products_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    inherits_assortment = serializers.BooleanField(required=False)
+    excluded_products_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    supplier_id = serializers.IntegerField(required=False, allow_null=True)
+    supplier_ref = serializers.CharField(required=False, max_length=100)
+
+    def validate(self, attrs):
+        if 'id' not in attrs:
+            missing = [field for field in ('name', 'contact_id') if field not in attrs]
+            if missing:
+                raise serializers.ValidationError(
+                    {field: ['Обязательное поле при создании.'] for field in missing}
+                )
+        if attrs.get('supplier_id') and attrs.get('supplier_ref'):
+            raise serializers.ValidationError(
+                {'supplier_ref': ['Укажите либо supplier_id, либо supplier_ref.']}
+            )
+        return attrs
+
+
+class DebtAdjustmentItemSerializer(serializers.Serializer):
+    """
+    Элемент пакета корректировок: положительное delta увеличивает долг
+    (начисление), отрицательное — уменьшает (платёж). Звенья и ссылки
+    проверяет DebtAdjustmentWriter одним запросом на пачку.
+    """
+    node_id = serializers.IntegerField()
+    delta = serializers.DecimalField(max_digits=12, decimal_places=2)
+    reference = serializers.CharField(max_length=100)
+
+    def validate_delta(self, value):
+        if not value:
+            raise serializers.ValidationError('Изменение задолженности не может быть нулевым.')
+        return value
+
+
+class DebtAdjustmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DebtAdjustment
+        fields = ['id', 'node_id', 'delta', 'reference', 'created_at']
+        read_only_fields = fields
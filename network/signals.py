@@ -0,0 +1,146 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.base import DEFERRED
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .authentication import token_cache
+from .cache import invalidate_all, invalidate_nodes
+from .metrics import install_query_recorder
+from .models import ApiToken, Contact, NetworkNode, NodeTombstone, Product
+
+
+@receiver(pre_delete, sender=NetworkNode)
+def detach_subtree(sender, instance, **kwargs):
+    """
+    Перед удалением звена его покупатели становятся корнями (SET_NULL),
+    поэтому путь и уровень всего поддерева пересчитываются одним UPDATE,
+    а долг поддерева вычитается из агрегатов бывших поставщиков.
+    Значения читаются из БД: при каскадном удалении они могли уже измениться.
+    """
+    current = NetworkNode.objects.filter(pk=instance.pk).values_list(
+        'path', 'level', 'debt', 'subtree_debt'
+    ).first()
+    if not current or not current[0]:
+        return
+    path, level, debt, subtree_debt = current
+    version = NetworkNode.objects.next_version()
+    NetworkNode.objects.move_subtree(path, level, '', -1, exclude_pk=instance.pk, version=version)
+    NetworkNode.objects.propagate_aggregates([(path, -debt, -(debt + subtree_debt), -1)], version)
+
+
+@receiver(post_save, sender=NetworkNode)
+def invalidate_saved_node(sender, instance, created, **kwargs):
+    """
+    Сброс кэша звена и его поставщиков (у них меняются агрегаты долга).
+    При переименовании сбрасываются и прямые покупатели, которые выводят
+    имя поставщика, при смене inherits_assortment — наследники ассортимента;
+    перенос поддерева сбрасывает весь кэш.
+    """
+    loaded = getattr(instance, '_loaded', {})
+    if not created and instance.supplier_id != loaded.get('supplier_id', DEFERRED):
+        invalidate_all()
+        return
+    if created:
+        # Путь нового звена только что построен: в нём вся цепочка поставщиков
+        node_ids = [int(pk) for pk in instance.path.split('/') if pk]
+    else:
+        supplier_path = NetworkNode.objects.filter(
+            pk=instance.supplier_id
+        ).values_list('path', flat=True).first() or ''
+        node_ids = [int(pk) for pk in supplier_path.split('/') if pk] + [instance.pk]
+    if not created and instance.name != loaded.get('name', DEFERRED):
+        # Покупатели выводят имя поставщика: их представление тоже изменилось
+        customer_ids = list(NetworkNode.objects.filter(supplier=instance).values_list('pk', flat=True))
+        NetworkNode.objects.touch(customer_ids, instance.version)
+        node_ids += customer_ids
+    if not created and instance.inherits_assortment != loaded.get('inherits_assortment', DEFERRED):
+        instance.__dict__.pop('_assortment', None)
+        heir_ids = NetworkNode.objects.assortment_heirs([instance.pk])
+        NetworkNode.objects.touch(heir_ids, instance.version)
+        node_ids += heir_ids
+    invalidate_nodes(node_ids)
+
+
+@receiver(post_delete, sender=NetworkNode)
+def invalidate_deleted_node(sender, instance, **kwargs):
+    """Удаление попадает в ленту изменений записью-надгробием"""
+    NodeTombstone.objects.create(node_id=instance.pk, version=NetworkNode.objects.next_version())
+    invalidate_all()
+
+
+@receiver(m2m_changed, sender=NetworkNode.products.through)
+@receiver(m2m_changed, sender=NetworkNode.excluded_products.through)
+def invalidate_node_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Изменение ассортимента звена меняет и ассортимент наследников:
+    их строки не копируются, поэтому они только получают новую версию.
+    """
+    if action == 'pre_clear' and reverse:
+        # После очистки связей продукта его звенья уже не найти
+        nodes = instance.network_nodes if sender is NetworkNode.products.through else instance.excluded_from_nodes
+        NetworkNode.objects.touch_assortment(nodes.values_list('pk', flat=True))
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        instance.__dict__.pop('_assortment', None)
+    node_ids = NetworkNode.objects.touch_assortment([instance.pk] if not reverse else pk_set or ())
+    if reverse and pk_set is None:
+        invalidate_all()
+    else:
+        invalidate_nodes(node_ids)
+
+
+@receiver(post_save, sender=Contact)
+def refresh_contact_nodes(sender, instance, **kwargs):
+    """
+    Город и страна входят в поисковую строку звеньев с этим контактом,
+    а сам контакт — в их представление в API и ленте изменений
+    """
+    with transaction.atomic():
+        rows = list(NetworkNode.objects.filter(contact=instance).values_list('pk', 'name'))
+        stamp = NetworkNode.objects.change_stamp() if rows else {}
+        nodes = [
+            NetworkNode(
+                pk=pk, **stamp,
+                search_document=NetworkNode.build_search_document(name, instance.city, instance.country)
+            )
+            for pk, name in rows
+        ]
+        NetworkNode.objects.bulk_update(nodes, ['search_document', 'version', 'updated_at'])
+    invalidate_nodes(node.pk for node in nodes)
+
+
+@receiver(post_delete, sender=Contact)
+def invalidate_contact_nodes(sender, instance, **kwargs):
+    invalidate_nodes(NetworkNode.objects.filter(contact=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_product_nodes(sender, instance, **kwargs):
+    with transaction.atomic():
+        node_ids = NetworkNode.objects.touch_assortment(
+            NetworkNode.products.through.objects.filter(product=instance).values_list('networknode_id', flat=True)
+        )
+    invalidate_nodes(node_ids)
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    """Учёт SQL каждого нового соединения в метриках запросов"""
+    install_query_recorder(connection)
+
+
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+def forget_token(sender, instance, **kwargs):
+    """Отзыв и смена срока действуют в этом процессе сразу"""
+    token_cache.forget_token(instance.key_hash)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+    """Кэш токенов хранит пользователя: блокировка и смена прав сбрасывают его"""
+    token_cache.forget_user(instance.pk)
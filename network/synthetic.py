@@ -0,0 +1,266 @@
+"""
+Детерминированный генератор синтетической сети для нагрузочных тестов.
+Все строки вставляются через bulk_create пачками; уровни известны заранее,
+пути строятся одним рекурсивным запросом в конце, агрегаты задолженности
+накапливаются по ходу генерации.
+"""
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connections, transaction
+from .cache import invalidate_all
+from .changes import move_horizon
+from .models import Contact, DebtAdjustment, NetworkNode, NodeTombstone, Product
+
+LOCATIONS = [
+    ('Россия', 'Москва'), ('Россия', 'Санкт-Петербург'), ('Россия', 'Казань'),
+    ('Россия', 'Новосибирск'), ('Россия', 'Екатеринбург'), ('Казахстан', 'Алматы'),
+    ('Беларусь', 'Минск'), ('Китай', 'Пекин'), ('Южная Корея', 'Сеул'), ('Япония', 'Токио'),
+]
+PRODUCT_NAMES = ['Смартфон', 'Ноутбук', 'Планшет', 'Наушники', 'Часы', 'Телевизор', 'Монитор']
+LEVEL_NAMES = {0: 'Завод', 1: 'Розничная сеть', 2: 'ИП'}
+
+# Размеры ассортимента: (минимум, максимум) для завода и ИП; розничные сети
+# наследуют ассортимент завода и исключают из него долю RETAILER_EXCLUDED_SHARE
+FACTORY_ASSORTMENT = (20, 200)
+RETAILER_EXCLUDED_SHARE = (0, 0.2)
+ENTREPRENEUR_ASSORTMENT = (3, 15)
+
+THROUGH_TABLE = NetworkNode.products.through._meta.db_table
+EXCLUDED_THROUGH_TABLE = NetworkNode.excluded_products.through._meta.db_table
+THROUGH_INSERT_SQL = 'INSERT INTO {table} (networknode_id, product_id) VALUES (%s, %s)'
+
+_worker_state = {}
+
+
+def _chunk_rng(seed, level, chunk_index):
+    return random.Random(f'{seed}:{level}:{chunk_index}')
+
+
+def _pick_assortment(rng, level, supplier_assortment, product_ids):
+    """
+    (строки products, строки excluded_products, действующий ассортимент).
+    Розничная сеть наследует ассортимент завода: строк только исключения.
+    """
+    if level == 0:
+        low, high = (min(bound, len(product_ids)) for bound in FACTORY_ASSORTMENT)
+        products = rng.sample(product_ids, rng.randint(low, high))
+        return products, [], products
+    if level == 1:
+        share = rng.uniform(*RETAILER_EXCLUDED_SHARE)
+        excluded = rng.sample(supplier_assortment, int(len(supplier_assortment) * share))
+        skipped = set(excluded)
+        return [], excluded, [pk for pk in supplier_assortment if pk not in skipped]
+    low, high = (min(bound, len(supplier_assortment)) for bound in ENTREPRENEUR_ASSORTMENT)
+    products = rng.sample(supplier_assortment, rng.randint(low, high))
+    return products, [], products
+
+
+def create_level_chunk(seed, level, chunk_index, start, count, suppliers, cum_weights, product_ids):
+    """
+    Создание одной пачки звеньев уровня level вместе с контактами и M2M.
+    Возвращает созданные звенья (pk, действующий ассортимент, поставщик)
+    и суммы (покупатели, долг) по поставщикам.
+    """
+    rng = _chunk_rng(seed, level, chunk_index)
+    contacts, nodes, assortments = [], [], []
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for number in range(start, start + count):
+        country, city = rng.choice(LOCATIONS)
+        contacts.append(Contact(
+            email=f'node{level}-{number}@example.com', country=country, city=city,
+            street=f'Улица {rng.randint(1, 300)}', house_number=str(rng.randint(1, 200))
+        ))
+        supplier = rng.choices(suppliers, cum_weights=cum_weights)[0] if suppliers else None
+        name = f'{LEVEL_NAMES[level]} {number}'
+        debt = Decimal(rng.randint(0, 10_000_000)) / 100 if level else Decimal('0')
+        nodes.append(NetworkNode(
+            name=name, level=level, debt=debt,
+            supplier_id=supplier[0] if supplier else None,
+            inherits_assortment=level == 1,
+            search_document=NetworkNode.build_search_document(name, city, country)
+        ))
+        assortments.append(_pick_assortment(rng, level, supplier[1] if supplier else (), product_ids))
+        if supplier:
+            totals[supplier[0]][0] += 1
+            totals[supplier[0]][1] += debt
+
+    connection = connections[NetworkNode.objects.db]
+    with transaction.atomic(using=connection.alias):
+        Contact.objects.bulk_create(contacts)
+        for node, contact in zip(nodes, contacts):
+            node.contact_id = contact.pk
+        NetworkNode.objects.bulk_create(nodes)
+        # Строк M2M на порядок больше, чем звеньев: вставляем их без модельных объектов
+        with connection.cursor() as cursor:
+            for table, column in ((THROUGH_TABLE, 0), (EXCLUDED_THROUGH_TABLE, 1)):
+                rows = [
+                    (node.pk, product_id)
+                    for node, assortment in zip(nodes, assortments)
+                    for product_id in assortment[column]
+                ]
+                if rows:
+                    cursor.executemany(THROUGH_INSERT_SQL.format(table=connection.ops.quote_name(table)), rows)
+    created = [(node.pk, assortment[2], node.supplier_id) for node, assortment in zip(nodes, assortments)]
+    return created, dict(totals)
+
+
+def _init_worker(state):
+    _worker_state.update(state)
+
+
+def _run_worker_chunk(task):
+    chunk_index, start, count = task
+    state = _worker_state
+    created, totals = create_level_chunk(
+        state['seed'], state['level'], chunk_index, start, count,
+        state['suppliers'], state['cum_weights'], state['product_ids']
+    )
+    return len(created), totals
+
+
+class SyntheticNetworkGenerator:
+    """
+    Генерация сети заданного размера. Результат зависит только от seed
+    (и не зависит от числа процессов): каждая пачка получает свой
+    генератор случайных чисел по номеру.
+    """
+
+    def __init__(self, seed=42, chunk_size=5000, workers=1, log=None):
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.stats = {}
+
+    def generate(self, factories, retailers, entrepreneurs, products):
+        started = time.perf_counter()
+        product_ids = self._timed('products', products, self._create_products, products)
+        factory_rows, _ = self._timed(
+            'factories', factories, self._create_level, 0, factories, [], product_ids
+        )
+        retailer_rows, factory_totals = self._timed(
+            'retailers', retailers, self._create_level, 1, retailers, factory_rows, product_ids
+        )
+        _, retailer_totals = self._timed(
+            'entrepreneurs', entrepreneurs, self._create_level, 2, entrepreneurs,
+            retailer_rows, product_ids, keep_rows=False
+        )
+        self._timed('tree', factories + retailers + entrepreneurs, self._finish_tree,
+                    factory_rows, retailer_rows, factory_totals, retailer_totals)
+        total = time.perf_counter() - started
+        self.stats['total'] = {'rows': factories + retailers + entrepreneurs, 'seconds': total}
+        return self.stats
+
+    def _timed(self, phase, rows, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        self.stats[phase] = {'rows': rows, 'seconds': seconds}
+        rate = rows / seconds if seconds else 0
+        self.log(f'{phase}: {rows} строк за {seconds:.2f} с ({rate:,.0f} строк/с)')
+        return result
+
+    def _create_products(self, count):
+        rng = random.Random(f'{self.seed}:products')
+        products = [
+            Product(
+                name=f'{rng.choice(PRODUCT_NAMES)} {number}',
+                model=f'M-{number:07d}',
+                release_date=date(2020, 1, 1) + timedelta(days=rng.randint(0, 2000))
+            )
+            for number in range(count)
+        ]
+        Product.objects.bulk_create(products, batch_size=self.chunk_size)
+        return [product.pk for product in products]
+
+    def _create_level(self, level, count, suppliers, product_ids, keep_rows=True):
+        rng = random.Random(f'{self.seed}:weights:{level}')
+        cum_weights, running = [], 0.0
+        for _ in suppliers:
+            # Распределение Парето: немногие поставщики обслуживают большинство покупателей
+            running += rng.paretovariate(1.2)
+            cum_weights.append(running)
+        tasks = [
+            (index, start, min(self.chunk_size, count - start))
+            for index, start in enumerate(range(0, count, self.chunk_size))
+        ]
+        state = {
+            'seed': self.seed, 'level': level, 'suppliers': suppliers,
+            'cum_weights': cum_weights or None, 'product_ids': product_ids,
+        }
+        rows, totals = [], defaultdict(lambda: [0, Decimal('0')])
+        if self.parallel and not keep_rows and len(tasks) > 1:
+            results = self._run_parallel(state, tasks)
+        else:
+            results = (
+                create_level_chunk(self.seed, level, *task, suppliers, state['cum_weights'], product_ids)
+                for task in tasks
+            )
+        for created, chunk_totals in results:
+            if keep_rows:
+                rows.extend(created)
+            for supplier_id, (customers, debt) in chunk_totals.items():
+                totals[supplier_id][0] += customers
+                totals[supplier_id][1] += debt
+        return rows, totals
+
+    @property
+    def parallel(self):
+        # SQLite допускает только одного писателя: процессы лишь ждали бы блокировку
+        return self.workers > 1 and connections[NetworkNode.objects.db].vendor != 'sqlite'
+
+    def _run_parallel(self, state, tasks):
+        # Дочерние процессы открывают собственные соединения с БД
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(self.workers, initializer=_init_worker, initargs=(state,)) as pool:
+            yield from pool.imap_unordered(_run_worker_chunk, tasks)
+
+    @transaction.atomic
+    def _finish_tree(self, factory_rows, retailer_rows, factory_totals, retailer_totals):
+        """
+        Пути одним рекурсивным запросом и агрегаты заводов и розничных сетей.
+        Построение путей присваивает новым звеньям версию ленты изменений.
+        """
+        NetworkNode.objects.rebuild_tree()
+        empty = [0, Decimal('0')]
+        # У розничной сети всё поддерево — её прямые покупатели-ИП
+        downstream = defaultdict(Decimal)
+        for pk, _, supplier_id in retailer_rows:
+            downstream[supplier_id] += retailer_totals.get(pk, empty)[1]
+
+        nodes = []
+        for rows, totals in ((factory_rows, factory_totals), (retailer_rows, retailer_totals)):
+            for pk, _, _ in rows:
+                customers, customers_debt = totals.get(pk, empty)
+                nodes.append(NetworkNode(
+                    pk=pk,
+                    customers_count=customers,
+                    customers_debt=customers_debt,
+                    subtree_debt=customers_debt + downstream[pk]
+                ))
+        NetworkNode.objects.bulk_update(
+            nodes, ['customers_count', 'customers_debt', 'subtree_debt'], batch_size=self.chunk_size
+        )
+
+
+def clear_network():
+    """
+    Быстрая очистка таблиц сети: без поштучных сигналов удаления.
+    Лента изменений начинается заново: надгробия удаляются вместе с сетью,
+    а граница ленты поднимается до новой версии, поэтому прежние токены
+    отклоняются и клиенты загружают ленту с начала.
+    """
+    connection = connections[NetworkNode.objects.db]
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        move_horizon(NetworkNode.objects.next_version())
+        for model in (
+            NodeTombstone, DebtAdjustment, NetworkNode.products.through, NetworkNode.excluded_products.through,
+            NetworkNode, Contact, Product,
+        ):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        invalidate_all()
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .authentication import token_cache
+from .benchmarks import FILTER_SAMPLES, BenchmarkRunner, build_scenarios, compare
+from .cache import stats as cache_stats
+from .filters import NetworkNodeFilter
+from .graph import GraphSnapshot, GraphStore, current_counter, store as graph_store
+from .metrics import registry as metrics_registry
+from .profiling import list_profiles
+from .routers import (
+    STICKY_COOKIE, ReplicaPool, ReplicaRouter, current_read_alias, pool, primary_reads, replica_reads
+)
+from .models import ApiToken, Contact, DebtAdjustment, NetworkNode, NodeTombstone, Product
+from .synthetic import SyntheticNetworkGenerator, clear_network
+from .views import NetworkNodeViewSet
 
-# Create your tests here.
+
+class NetworkTestMixin:
+    """Общие фикстуры: контакт, сотрудник и клиент API"""
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        graph_store.clear()
+        self.contact = Contact.objects.create(
+            email='test@example.com', country='Россия', city='Москва',
+            street='Тверская', house_number='1'
+        )
+        self.user = get_user_model().objects.create_user(
+            username='employee', password='password', is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_node(self, name, supplier=None, **kwargs):
+        return NetworkNode.objects.create(
+            name=name, contact=self.contact, supplier=supplier, **kwargs
+        )
+
+
+class NetworkNodePathTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+        self.entrepreneur = self.make_node('ИП', self.retailer)
+
+    def test_path_built_on_create(self):
+        self.assertEqual(self.factory.path, f'{self.factory.pk}/')
+        self.assertEqual(
+            self.entrepreneur.path,
+            f'{self.factory.pk}/{self.retailer.pk}/{self.entrepreneur.pk}/'
+        )
+
+    def test_descendants_and_ancestors(self):
+        self.assertQuerySetEqual(
+            NetworkNode.objects.descendants_of(self.factory).order_by('level'),
+            [self.retailer, self.entrepreneur]
+        )
+        self.assertQuerySetEqual(
+            NetworkNode.objects.ancestors_of(self.entrepreneur),
+            [self.factory, self.retailer]
+        )
+
+    def test_reparenting_rewrites_subtree(self):
+        other = self.make_node('Другой завод')
+        self.retailer.supplier = other
+        self.retailer.save()
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(
+            self.entrepreneur.path,
+            f'{other.pk}/{self.retailer.pk}/{self.entrepreneur.pk}/'
+        )
+
+    def test_delete_detaches_subtree(self):
+        self.factory.delete()
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, f'{self.retailer.pk}/{self.entrepreneur.pk}/')
+
+    def test_path_migration_fills_paths_and_reports_cycles(self):
+        fill_paths = import_module('network.migrations.0003_networknode_path').fill_paths
+        NetworkNode.objects.update(path='')
+        fill_paths(django_apps, None)
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(
+            self.entrepreneur.path,
+            f'{self.factory.pk}/{self.retailer.pk}/{self.entrepreneur.pk}/'
+        )
+        NetworkNode.objects.filter(pk=self.factory.pk).update(supplier=self.entrepreneur)
+        with self.assertRaisesMessage(
+            ValueError, f'{self.factory.pk} → {self.entrepreneur.pk} → {self.retailer.pk} → {self.factory.pk}'
+        ):
+            fill_paths(django_apps, None)
+
+    def test_tree_endpoints(self):
+        response = self.client.get(f'/api/nodes/{self.factory.pk}/descendants/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get(f'/api/nodes/{self.entrepreneur.pk}/ancestors/')
+        self.assertEqual([item['id'] for item in response.data], [self.factory.pk, self.retailer.pk])
+
+
+class NetworkNodeRelevelTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+        self.entrepreneurs = [self.make_node(f'ИП {i}', self.retailer) for i in range(5)]
+
+    def test_reparenting_relevels_subtree(self):
+        self.retailer.supplier = None
+        self.retailer.save()
+        levels = set(NetworkNode.objects.filter(supplier=self.retailer).values_list('level', flat=True))
+        self.assertEqual(self.retailer.level, 0)
+        self.assertEqual(levels, {1})
+
+    def test_reparenting_query_count_does_not_grow_with_subtree(self):
+        other = self.make_node('Другой завод')
+        self.retailer.supplier = other
+        # Включая UPDATE ... RETURNING счётчика версий ленты изменений
+        with self.assertNumQueries(8):
+            self.retailer.save()
+        for i in range(5, 50):
+            self.make_node(f'ИП {i}', self.retailer)
+        self.retailer.supplier = self.factory
+        with self.assertNumQueries(8):
+            self.retailer.save()
+
+    def test_delete_relevels_customers(self):
+        self.factory.delete()
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.level, 0)
+        self.assertEqual(NetworkNode.objects.filter(level=1).count(), 5)
+
+    def test_rebuild_tree_repairs_table(self):
+        NetworkNode.objects.update(level=0, path='')
+        self.assertEqual(NetworkNode.objects.rebuild_tree(), 7)
+        entrepreneur = NetworkNode.objects.get(pk=self.entrepreneurs[0].pk)
+        self.assertEqual(entrepreneur.level, 2)
+        self.assertEqual(
+            entrepreneur.path, f'{self.factory.pk}/{self.retailer.pk}/{entrepreneur.pk}/'
+        )
+        self.assertEqual(NetworkNode.objects.rebuild_tree(), 0)
+
+
+class NetworkNodePlacementTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Телефон', model='X1', release_date='2024-01-01')
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+        self.entrepreneur = self.make_node('ИП', self.retailer)
+        self.other = self.make_node('Другой завод')
+
+    def patch_supplier(self, node, supplier):
+        return self.client.patch(f'/api/nodes/{node.pk}/', {'supplier_id': supplier.pk}, format='json')
+
+    def test_api_rejects_deep_cycle_and_excess_depth(self):
+        response = self.patch_supplier(self.factory, self.entrepreneur)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('цикл', response.data['supplier_id'][0])
+        # Сеть с покупателем под другой сетью: ИП окажется на уровне 3
+        other_retailer = self.make_node('Сеть 2', self.other)
+        response = self.patch_supplier(self.retailer, other_retailer)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('уровня 2', response.data['supplier_id'][0])
+        response = self.client.post('/api/nodes/', {
+            'name': 'Субдилер', 'contact_id': self.contact.pk,
+            'products_ids': [self.product.pk], 'supplier_id': self.entrepreneur.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.patch_supplier(self.retailer, self.other).status_code, 200)
+
+    def test_check_is_one_query(self):
+        with self.assertNumQueries(1):
+            with self.assertRaises(ValidationError):
+                NetworkNode.objects.check_placement(self.entrepreneur.pk, self.factory.path, self.factory.level)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                NetworkNode.objects.check_placement(self.other.pk, self.retailer.path, self.retailer.level),
+                (self.other.path, 0)
+            )
+
+    def test_save_and_admin_clean_guard(self):
+        self.factory.supplier = self.entrepreneur
+        with self.assertRaises(ValidationError) as raised:
+            self.factory.full_clean()
+        self.assertIn('supplier', raised.exception.message_dict)
+        with self.assertRaises(ValidationError):
+            self.factory.save()
+        self.assertIsNone(NetworkNode.objects.get(pk=self.factory.pk).supplier_id)
+
+    def test_bulk_rejects_cycle_within_batch(self):
+        # По отдельности оба переноса допустимы, вместе — цикл
+        lone = self.make_node('Сеть 2')
+        response = self.client.post('/api/nodes/bulk/', [
+            {'id': lone.pk, 'supplier_id': self.other.pk},
+            {'id': self.other.pk, 'supplier_id': lone.pk},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('supplier_id', response.data[1])
+        self.assertIsNone(NetworkNode.objects.get(pk=lone.pk).supplier_id)
+        response = self.client.post('/api/nodes/bulk/', [
+            {'ref': 'a', 'name': 'A', 'contact_id': self.contact.pk, 'supplier_id': self.retailer.pk},
+            {'ref': 'b', 'name': 'B', 'contact_id': self.contact.pk, 'supplier_ref': 'a'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('supplier_ref', response.data[1])
+
+    def test_audit(self):
+        self.assertEqual(NetworkNode.objects.audit_tree(), {'cycles': [], 'too_deep': [], 'mismatched': []})
+        call_command('audit_network', stdout=io.StringIO())
+        # Испорченные данные в обход save(): цикл завод → ИП → сеть → завод
+        NetworkNode.objects.filter(pk=self.factory.pk).update(supplier=self.entrepreneur)
+        report = NetworkNode.objects.audit_tree()
+        self.assertEqual(report['cycles'], [self.factory.pk, self.retailer.pk, self.entrepreneur.pk])
+        with self.assertRaises(CommandError):
+            call_command('audit_network', stdout=io.StringIO())
+
+
+class NetworkNodeExportTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory, debt=Decimal('150.50'))
+
+    def test_ndjson_export_respects_filters(self):
+        response = self.client.get('/api/nodes/export/', {'level': 1})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['name'], 'Сеть')
+        self.assertEqual(row['supplier__name'], 'Завод')
+        self.assertEqual(row['debt'], '150.50')
+
+    def test_csv_export(self):
+        response = self.client.get('/api/nodes/export/', {'export_format': 'csv', 'ordering': 'name'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['id', 'name'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Завод', 'Сеть'])
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/nodes/export/', {'export_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class NetworkNodeKeysetPaginationTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        factory = self.make_node('Завод')
+        for i in range(7):
+            self.make_node(f'Сеть {i % 3}', factory, debt=Decimal(i % 2))
+
+    def walk(self, params, link='next'):
+        url, seen = '/api/nodes/', []
+        params = {'cursor': '', 'page_size': 2, **params}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            url, params = response.data[link], {}
+        return seen
+
+    def test_pages_match_full_ordering_for_each_field(self):
+        for ordering in ['name', '-name', 'level', 'debt', '-debt', 'created_at', '-created_at']:
+            field = ordering.lstrip('-')
+            prefix = '-' if ordering.startswith('-') else ''
+            expected = list(NetworkNode.objects.order_by(
+                prefix + field, prefix + 'id'
+            ).values_list('id', flat=True))
+            with self.subTest(ordering=ordering):
+                self.assertEqual(self.walk({'ordering': ordering}), expected)
+
+    def test_page_validators_without_count(self):
+        params = {'cursor': '', 'page_size': 2, 'fields': 'id,name'}
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/nodes/', params)
+        self.assertEqual(len(captured), 1)
+        self.assertNotIn('COUNT(', captured[0]['sql'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/nodes/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        node = NetworkNode.objects.get(pk=response.data['results'][0]['id'])
+        node.name += ' 2'
+        with self.captureOnCommitCallbacks(execute=True):
+            node.save()
+        response = self.client.get('/api/nodes/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_previous_link_walks_back(self):
+        first = self.client.get('/api/nodes/', {'cursor': '', 'page_size': 3, 'ordering': 'debt'})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/nodes/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_page_seeks_index(self):
+        for ordering, bound in (('name', '"name" >='), ('-debt', '"debt" <=')):
+            first = self.client.get('/api/nodes/', {'cursor': '', 'page_size': 2, 'ordering': ordering})
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(first.data['next'])
+            sql = next(query['sql'] for query in captured.captured_queries if 'ORDER BY' in query['sql'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            with self.subTest(ordering=ordering):
+                # Диапазон — первое условие WHERE, а не ветка OR
+                self.assertIn(f'WHERE ("network_networknode".{bound}', sql)
+                self.assertRegex(plan, r'SEARCH \S+ USING (COVERING )?INDEX \w+ \((name|debt)[<>]\?')
+
+
+class NetworkNodeLevelActionTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        factory = self.make_node('Завод')
+        retailer = self.make_node('Сеть', factory)
+        for name in ['ИП Петров', 'ИП Иванов', 'ИП Сидоров']:
+            self.make_node(name, retailer)
+
+    def test_level_actions_are_paginated_filtered_and_ordered(self):
+        response = self.client.get('/api/nodes/entrepreneurs/', {'search': 'ов', 'ordering': '-name'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(
+            [item['name'] for item in response.data['results']],
+            ['ИП Сидоров', 'ИП Петров', 'ИП Иванов']
+        )
+        response = self.client.get('/api/nodes/factories/')
+        self.assertEqual([item['name'] for item in response.data['results']], ['Завод'])
+
+    def test_fields_projection_skips_products_prefetch(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/nodes/entrepreneurs/', {'fields': 'id,name,debt'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'debt'})
+
+
+class NetworkNodeSparseFieldsetTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Телефон', model='X1', release_date='2024-01-01')
+        self.factory = self.make_node('Завод')
+        self.factory.products.set([self.product])
+        self.retailer = self.make_node('Сеть', self.factory)
+
+    def test_fields_trim_columns_and_joins(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/nodes/', {'fields': 'id,name,debt'})
+        select = queries.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', select)
+        self.assertNotIn('"created_at"', select)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'debt'})
+
+    def test_unknown_fields_rejected(self):
+        response = self.client.get('/api/nodes/', {'fields': 'id,bogus,contact_id,nmae'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data['fields'][0]), 'Неизвестные поля: bogus, contact_id, nmae.')
+
+    def test_empty_fields_give_full_representation(self):
+        full = self.client.get(f'/api/nodes/{self.factory.pk}/').data
+        for value in ('', ' , '):
+            with self.subTest(fields=value):
+                self.assertEqual(self.client.get(f'/api/nodes/{self.factory.pk}/', {'fields': value}).data, full)
+
+    def test_expand_collapses_other_relations_to_ids(self):
+        response = self.client.get(f'/api/nodes/{self.factory.pk}/', {'expand': 'contact'})
+        self.assertEqual(response.data['contact']['city'], 'Москва')
+        self.assertEqual(response.data['products'], [self.product.pk])
+        response = self.client.get(f'/api/nodes/{self.factory.pk}/', {'expand': ''})
+        self.assertEqual(response.data['contact'], self.contact.pk)
+
+    def test_default_output_is_fully_nested(self):
+        response = self.client.get(f'/api/nodes/{self.retailer.pk}/')
+        self.assertEqual(response.data['supplier'], 'Завод')
+        self.assertEqual(response.data['contact']['email'], 'test@example.com')
+        self.assertEqual(response.data['level_display'], 'Розничная сеть')
+
+
+class NetworkNodeDebtAggregateTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory, debt=Decimal('100.00'))
+        self.entrepreneur = self.make_node('ИП', self.retailer, debt=Decimal('10.00'))
+
+    def assertAggregates(self, node, count, customers_debt, subtree_debt):
+        node.refresh_from_db()
+        self.assertEqual(
+            (node.customers_count, node.customers_debt, node.subtree_debt),
+            (count, Decimal(customers_debt), Decimal(subtree_debt))
+        )
+
+    def assertMatchesRecompute(self):
+        expected = list(NetworkNode.objects.order_by('pk').values_list(
+            'customers_count', 'customers_debt', 'subtree_debt'
+        ))
+        NetworkNode.objects.recompute_aggregates()
+        self.assertEqual(expected, list(NetworkNode.objects.order_by('pk').values_list(
+            'customers_count', 'customers_debt', 'subtree_debt'
+        )))
+
+    def test_aggregates_on_create(self):
+        self.assertAggregates(self.factory, 1, '100.00', '110.00')
+        self.assertAggregates(self.retailer, 1, '10.00', '10.00')
+
+    def test_debt_change_propagates(self):
+        self.entrepreneur.debt = Decimal('25.00')
+        self.entrepreneur.save()
+        self.assertAggregates(self.factory, 1, '100.00', '125.00')
+        self.assertAggregates(self.retailer, 1, '25.00', '25.00')
+        self.assertMatchesRecompute()
+
+    def test_reparenting_moves_aggregates(self):
+        other = self.make_node('Другой завод')
+        self.retailer.supplier = other
+        self.retailer.save()
+        self.assertAggregates(self.factory, 0, '0', '0')
+        self.assertAggregates(other, 1, '100.00', '110.00')
+        self.assertMatchesRecompute()
+
+    def test_delete_subtracts_subtree(self):
+        self.retailer.delete()
+        self.assertAggregates(self.factory, 0, '0', '0')
+        self.assertMatchesRecompute()
+
+    def test_recompute_goes_bottom_up_by_level(self):
+        self.make_node('ИП 2', self.retailer, debt=Decimal('5.00'))
+        NetworkNode.objects.update(customers_count=7, customers_debt=1, subtree_debt=1)
+        with CaptureQueriesContext(connection) as queries:
+            recomputed = NetworkNode.objects.recompute_aggregates()
+        self.assertEqual(recomputed, 4)
+        # один запрос на уровень, без подзапросов по префиксам путей
+        self.assertFalse(any('LIKE' in query['sql'].upper() for query in queries.captured_queries))
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "network_networknode"')
+                             for query in queries.captured_queries), NetworkNode.MAX_LEVEL + 1)
+        self.assertAggregates(self.factory, 1, '100.00', '115.00')
+        self.assertAggregates(self.retailer, 2, '15.00', '15.00')
+        self.assertAggregates(self.entrepreneur, 0, '0', '0')
+
+    def test_admin_clear_debt(self):
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        self.client.post('/admin/network/networknode/', {
+            'action': 'clear_debt',
+            '_selected_action': [self.retailer.pk, self.entrepreneur.pk],
+        })
+        self.assertAggregates(self.factory, 1, '0', '0')
+        self.assertMatchesRecompute()
+
+    def test_debt_info_and_summary(self):
+        response = self.client.get(f'/api/nodes/{self.factory.pk}/debt-info/')
+        self.assertEqual(response.data['subtree_debt'], Decimal('110.00'))
+        response = self.client.get('/api/nodes/debt-summary/', {'level': 0})
+        self.assertEqual(response.data['results'][0]['customers_debt'], '100.00')
+
+
+class NetworkNodeBulkTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Телефон', model='X1', release_date='2024-01-01')
+        self.factory = self.make_node('Завод')
+
+    def post(self, items):
+        return self.client.post('/api/nodes/bulk/', items, format='json')
+
+    def batch(self, size):
+        items = [{'ref': 'r', 'name': 'Сеть', 'contact_id': self.contact.pk, 'supplier_id': self.factory.pk}]
+        items += [
+            {'name': f'ИП {i}', 'contact_id': self.contact.pk, 'supplier_ref': 'r', 'products_ids': [self.product.pk]}
+            for i in range(size)
+        ]
+        return items
+
+    def test_create_with_references_inside_batch(self):
+        response = self.post(self.batch(3))
+        self.assertEqual(response.status_code, 201)
+        retailer_id = response.data[0]['id']
+        entrepreneur = NetworkNode.objects.get(pk=response.data[1]['id'])
+        self.assertEqual(entrepreneur.level, 2)
+        self.assertEqual(entrepreneur.path, f'{self.factory.pk}/{retailer_id}/{entrepreneur.pk}/')
+        self.assertEqual(list(entrepreneur.products.all()), [self.product])
+        self.assertEqual(NetworkNode.objects.get(pk=retailer_id).customers_count, 3)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.batch(5))
+        with CaptureQueriesContext(connection) as large:
+            self.post(self.batch(50))
+        self.assertEqual(len(small), len(large))
+
+    def test_foreign_keys_validated(self):
+        response = self.post([
+            {'name': 'ИП', 'contact_id': 0, 'products_ids': [0]},
+            {'name': 'ИП', 'contact_id': self.contact.pk, 'supplier_ref': 'missing'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data[0]), {'contact_id', 'products_ids'})
+        self.assertEqual(set(response.data[1]), {'supplier_ref'})
+        self.assertEqual(NetworkNode.objects.count(), 1)
+
+    def test_update_renames_and_moves(self):
+        retailer = self.make_node('Сеть')
+        entrepreneur = self.make_node('ИП', retailer)
+        response = self.post([
+            {'id': retailer.pk, 'name': 'Сеть 2', 'supplier_id': self.factory.pk},
+            {'id': entrepreneur.pk, 'products_ids': [self.product.pk]},
+        ])
+        self.assertEqual(response.status_code, 201)
+        entrepreneur.refresh_from_db()
+        self.assertEqual(entrepreneur.level, 2)
+        self.assertEqual(entrepreneur.supplier.name, 'Сеть 2')
+        self.assertEqual(list(entrepreneur.products.all()), [self.product])
+
+    def test_rename_changes_customers_etag(self):
+        retailer = self.make_node('Сеть', self.factory)
+        etag = self.client.get(f'/api/nodes/{retailer.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post([{'id': self.factory.pk, 'name': 'Завод 2'}]).status_code, 201)
+        response = self.client.get(f'/api/nodes/{retailer.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['supplier'], 'Завод 2')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class DebtAdjustmentTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory, debt=Decimal('100.00'))
+        self.entrepreneur = self.make_node('ИП', self.retailer, debt=Decimal('50.00'))
+
+    def post(self, items):
+        return self.client.post('/api/debt-adjustments/', items, format='json')
+
+    def debts(self):
+        return dict(NetworkNode.objects.values_list('name', 'debt'))
+
+    def test_batch_applied_with_aggregates(self):
+        response = self.post([
+            {'node_id': self.entrepreneur.pk, 'delta': '-20.00', 'reference': 'pay-1'},
+            {'node_id': self.entrepreneur.pk, 'delta': '5.50', 'reference': 'bill-1'},
+            {'node_id': self.retailer.pk, 'delta': '-100.00', 'reference': 'pay-2'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({row['status'] for row in response.data}, {'applied'})
+        self.assertEqual(self.debts(), {'Завод': 0, 'Сеть': 0, 'ИП': Decimal('35.50')})
+        self.factory.refresh_from_db()
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.customers_debt, Decimal('35.50'))
+        self.assertEqual(self.factory.subtree_debt, Decimal('35.50'))
+        self.assertEqual(self.client.get('/api/debt-adjustments/', {'node': self.entrepreneur.pk}).data['count'], 2)
+
+    def test_stale_instance_keeps_adjusted_debt(self):
+        for stale, supplier in ((self.retailer, None), (self.entrepreneur, self.factory)):
+            stale = NetworkNode.objects.get(pk=stale.pk)
+            self.post([{'node_id': stale.pk, 'delta': '50.00', 'reference': f'bill-{stale.pk}'}])
+            stale.name += ' 2'
+            if supplier:
+                # Перенос под завод: агрегаты переносятся с долгом из БД
+                stale.supplier = supplier
+            stale.save()
+        self.assertEqual(self.debts(), {'Завод': 0, 'Сеть 2': Decimal('150.00'), 'ИП 2': Decimal('100.00')})
+        self.factory.refresh_from_db()
+        self.retailer.refresh_from_db()
+        self.assertEqual(self.retailer.subtree_debt, 0)
+        self.assertEqual(self.factory.customers_debt, Decimal('250.00'))
+        self.assertEqual(self.factory.subtree_debt, Decimal('250.00'))
+
+    def test_replay_is_idempotent(self):
+        items = [{'node_id': self.entrepreneur.pk, 'delta': '-20.00', 'reference': 'pay-1'}]
+        self.post(items)
+        response = self.post(items + [{'node_id': self.entrepreneur.pk, 'delta': '-5.00', 'reference': 'pay-2'}])
+        self.assertEqual([row['status'] for row in response.data], ['duplicate', 'applied'])
+        self.assertEqual(self.debts()['ИП'], Decimal('25.00'))
+        response = self.post([{'node_id': self.retailer.pk, 'delta': '-20.00', 'reference': 'pay-1'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data[0]), {'reference'})
+
+    def test_invalid_batch_rolled_back(self):
+        before = self.debts()
+        response = self.post([
+            {'node_id': self.retailer.pk, 'delta': '-10.00', 'reference': 'pay-1'},
+            {'node_id': self.entrepreneur.pk, 'delta': '-50.01', 'reference': 'pay-2'},
+            {'node_id': 0, 'delta': '1.00', 'reference': 'bill-1'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(set(response.data[1]), {'delta'})
+        self.assertEqual(set(response.data[2]), {'node_id'})
+        self.assertEqual(self.debts(), before)
+        self.assertFalse(DebtAdjustment.objects.exists())
+        self.assertEqual(self.post([{'node_id': self.retailer.pk, 'delta': '0', 'reference': 'x'}]).status_code, 400)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        def batch(prefix, size):
+            return [
+                {'node_id': node.pk, 'delta': '1.00', 'reference': f'{prefix}-{node.pk}-{i}'}
+                for i in range(size) for node in (self.retailer, self.entrepreneur)
+            ]
+        with CaptureQueriesContext(connection) as small:
+            self.post(batch('a', 2))
+        with CaptureQueriesContext(connection) as large:
+            self.post(batch('b', 100))
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(self.debts()['ИП'], Decimal('152.00'))
+
+
+class NetworkNodeCacheTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Телефон', model='X1', release_date='2024-01-01')
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+
+    def get(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url)
+
+    def change(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def test_repeated_reads_hit_cache(self):
+        self.get('/api/nodes/')
+        with self.assertNumQueries(0):
+            response = self.get('/api/nodes/')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.get('/api/nodes/cache-stats/').data['hits'], 1)
+
+    def test_node_save_invalidates_lists_detail_and_ancestors(self):
+        url = f'/api/nodes/{self.factory.pk}/debt-info/'
+        self.get(url)
+        self.get('/api/nodes/')
+        self.retailer.debt = Decimal('10.00')
+        self.change(self.retailer.save)
+        self.assertEqual(self.get(url).data['subtree_debt'], Decimal('10.00'))
+        self.assertEqual(self.get('/api/nodes/').data['results'][1]['debt'], '10.00')
+
+    def test_rename_invalidates_customers(self):
+        url = f'/api/nodes/{self.retailer.pk}/'
+        self.get(url)
+        self.factory.name = 'Новый завод'
+        self.change(self.factory.save)
+        self.assertEqual(self.get(url).data['supplier'], 'Новый завод')
+
+    def test_contact_and_products_invalidate_detail(self):
+        url = f'/api/nodes/{self.retailer.pk}/'
+        self.get(url)
+        self.contact.city = 'Казань'
+        self.change(self.contact.save)
+        self.assertEqual(self.get(url).data['contact']['city'], 'Казань')
+        self.change(lambda: self.retailer.products.add(self.product))
+        self.assertEqual(len(self.get(url).data['products']), 1)
+        self.product.name = 'Смартфон'
+        self.change(self.product.save)
+        self.assertEqual(self.get(url).data['products'][0]['name'], 'Смартфон')
+
+    def test_unrelated_detail_stays_cached(self):
+        url = f'/api/nodes/{self.factory.pk}/'
+        self.get(url)
+        other = self.make_node('Другой завод')
+        other.name = 'Переименованный завод'
+        self.change(other.save)
+        with self.assertNumQueries(0):
+            self.get(url)
+
+    def test_batches_invalidate_only_touched_nodes(self):
+        other = self.make_node('Другой завод')
+        urls = [f'/api/nodes/{pk}/debt-info/' for pk in (self.factory.pk, self.retailer.pk, other.pk)]
+        for url in urls:
+            self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/debt-adjustments/', [
+                {'reference': 'pay-1', 'node_id': self.retailer.pk, 'delta': '7.00'},
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get(urls[0]).data['subtree_debt'], Decimal('7.00'))
+        self.assertEqual(self.get(urls[1]).data['debt'], Decimal('7.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/nodes/bulk/', [
+                {'id': self.factory.pk, 'name': 'Новый завод'},
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get(f'/api/nodes/{self.retailer.pk}/').data['supplier'], 'Новый завод')
+        with self.assertNumQueries(0):
+            self.get(urls[2])
+
+
+class NetworkNodeConditionalGetTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+
+    def get(self, url, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url, headers=headers)
+
+    def test_matching_etag_returns_304_without_sql_when_cached(self):
+        for url in ('/api/nodes/', f'/api/nodes/{self.retailer.pk}/', f'/api/nodes/{self.factory.pk}/debt-info/'):
+            response = self.get(url)
+            self.assertTrue(response['ETag'].startswith('"'))
+            with self.assertNumQueries(0):
+                not_modified = self.get(url, if_none_match=response['ETag'])
+            self.assertEqual(not_modified.status_code, 304, url)
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+            self.assertEqual(not_modified.content, b'')
+            if url != '/api/nodes/':
+                modified_since = self.get(url, if_modified_since=response['Last-Modified'])
+                self.assertEqual(modified_since.status_code, 304, url)
+
+    def test_list_has_no_last_modified(self):
+        # Максимум updated_at набора не растёт при удалении строки
+        self.assertNotIn('Last-Modified', self.get('/api/nodes/'))
+        since = self.get(f'/api/nodes/{self.retailer.pk}/')['Last-Modified']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_node('ИП', self.retailer).delete()
+        response = self.get('/api/nodes/', if_modified_since=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_uncached_304_runs_only_the_version_aggregate(self):
+        etag = self.get('/api/nodes/?ordering=-debt')['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get('/api/nodes/?ordering=-debt', if_none_match=etag).status_code, 304)
+        # Другие параметры — другой ответ и другой ETag
+        self.assertNotEqual(self.get('/api/nodes/?ordering=name')['ETag'], etag)
+
+    def test_changes_produce_new_etag(self):
+        list_etag = self.get('/api/nodes/')['ETag']
+        detail_etag = self.get(f'/api/nodes/{self.factory.pk}/debt-info/')['ETag']
+        # Долг покупателя меняет агрегаты поставщика
+        self.retailer.debt = Decimal('7.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.retailer.save()
+        response = self.get(f'/api/nodes/{self.factory.pk}/debt-info/', if_none_match=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['subtree_debt'], 7)
+        response = self.get('/api/nodes/', if_none_match=list_etag)
+        self.assertEqual(response.status_code, 200)
+        list_etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_node('ИП', self.retailer).delete()
+        self.assertEqual(self.get('/api/nodes/', if_none_match=list_etag).status_code, 200)
+
+
+class NetworkNodeSearchTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.kazan = Contact.objects.create(
+            email='kazan@example.com', country='Россия', city='Казань',
+            street='Баумана', house_number='15'
+        )
+        self.factory = self.make_node('Завод Москва')
+        self.shop = self.make_node('Магазин', self.factory)
+        self.kazan_shop = NetworkNode.objects.create(name='Казанский магазин', contact=self.kazan)
+
+    def test_search_document_maintained(self):
+        self.assertEqual(self.shop.search_document, 'магазин москва россия')
+        self.kazan.city = 'Самара'
+        self.kazan.save()
+        self.kazan_shop.refresh_from_db()
+        self.assertEqual(self.kazan_shop.search_document, 'казанский магазин самара россия')
+
+    def test_ranked_search(self):
+        response = self.client.get('/api/nodes/search/', {'q': 'МАГАЗИН'})
+        self.assertEqual(
+            [item['name'] for item in response.data['results']],
+            ['Магазин', 'Казанский магазин']
+        )
+
+    def test_search_respects_filters_and_requires_query(self):
+        response = self.client.get('/api/nodes/search/', {'q': 'россия', 'level': 1})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Магазин'])
+        self.assertEqual(self.client.get('/api/nodes/search/').status_code, 400)
+
+    def test_search_filter_matches_city_case_insensitively(self):
+        response = self.client.get('/api/nodes/', {'search': 'казань'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Казанский магазин'])
+
+
+class NetworkNodeChangeFeedTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Телефон', model='X1', release_date='2024-01-01')
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory)
+        self.entrepreneur = self.make_node('ИП', self.retailer)
+        self.other_contact = Contact.objects.create(
+            email='other@example.com', country='Беларусь', city='Минск', street='Ленина', house_number='2'
+        )
+        self.lonely = NetworkNode.objects.create(name='Одиночка', contact=self.other_contact)
+
+    def changes(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/nodes/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_initial_load_then_only_changes(self):
+        data = self.changes()
+        self.assertEqual(len(data['changed']), 4)
+        self.assertFalse(data['has_more'])
+        token = data['next']
+        self.assertEqual(self.changes(token)['changed'], [])
+
+        self.entrepreneur.debt = Decimal('5.00')
+        self.entrepreneur.save()
+        data = self.changes(token)
+        # Долг ИП меняет агрегаты всей цепочки поставщиков
+        self.assertEqual(
+            {node['name'] for node in data['changed']}, {'Завод', 'Сеть', 'ИП'}
+        )
+        token = data['next']
+
+        self.lonely.products.add(self.product)
+        data = self.changes(token)
+        self.assertEqual([node['name'] for node in data['changed']], ['Одиночка'])
+        token = data['next']
+
+        self.other_contact.city = 'Гродно'
+        self.other_contact.save()
+        data = self.changes(token)
+        self.assertEqual(data['changed'][0]['contact']['city'], 'Гродно')
+        token = data['next']
+
+        deleted_pk = self.lonely.pk
+        self.lonely.delete()
+        data = self.changes(token)
+        self.assertEqual([item['id'] for item in data['deleted']], [deleted_pk])
+        self.assertEqual(data['changed'], [])
+
+    def test_bounded_batches(self):
+        deleted_pk = self.entrepreneur.pk
+        self.entrepreneur.delete()
+        seen, token, pages = [], None, 0
+        while True:
+            data = self.changes(token, limit=1)
+            seen += [node['id'] for node in data['changed']] + [item['id'] for item in data['deleted']]
+            token, pages = data['next'], pages + 1
+            if not data['has_more']:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(pages, 4)
+        self.assertIn(deleted_pk, seen)
+
+    def test_sparse_fields_and_invalid_token(self):
+        data = self.changes(fields='id,name')
+        self.assertEqual(set(data['changed'][0]), {'id', 'name'})
+        self.assertEqual(self.client.get('/api/nodes/changes/', {'since': 'abc'}).status_code, 400)
+
+    def test_pruned_tombstones_expire_older_tokens(self):
+        token = self.changes()['next']
+        deleted_pk = self.lonely.pk
+        self.lonely.delete()
+        fresh = self.changes(token)['next']
+        output = io.StringIO()
+        call_command('prune_tombstones', days=0, stdout=output)
+        self.assertIn('Удалено надгробий: 1', output.getvalue())
+        # Старый токен пропустил бы удаление: клиент загружает ленту заново
+        self.assertEqual(self.client.get('/api/nodes/changes/', {'since': token}).status_code, 410)
+        self.assertEqual(self.changes(fresh)['deleted'], [])
+        self.assertNotIn(deleted_pk, [node['id'] for node in self.changes()['changed']])
+
+    def test_regeneration_resets_feed(self):
+        token = self.changes()['next']
+        self.assertEqual(graph_store.snapshot().summary['nodes'], 4)
+        clear_network()
+        self.assertFalse(NodeTombstone.objects.exists())
+        self.assertEqual(self.client.get('/api/nodes/changes/', {'since': token}).status_code, 410)
+        self.assertEqual(self.changes()['changed'], [])
+        self.assertEqual(graph_store.snapshot().summary['nodes'], 0)
+
+
+class ProductCatalogTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.phone = Product.objects.create(name='Телефон', model='X1', release_date='2023-03-01')
+        self.tablet = Product.objects.create(name='Планшет', model='T2', release_date='2024-06-01')
+        self.watch = Product.objects.create(name='Часы', model='W3', release_date='2025-01-01')
+        self.factory = self.make_node('Завод')
+        self.factory.products.set([self.phone, self.tablet])
+        self.retailer = self.make_node('Сеть', self.factory)
+        self.retailer.products.set([self.phone])
+        self.entrepreneur = self.make_node('ИП', self.retailer)
+        self.entrepreneur.products.set([self.phone])
+
+    def test_list_with_distribution_and_filters(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/products/')
+        rows = {row['name']: row for row in response.data['results']}
+        self.assertEqual(rows['Телефон']['nodes_by_level'], {0: 1, 1: 1, 2: 1})
+        self.assertEqual(rows['Телефон']['nodes_count'], 3)
+        self.assertEqual(rows['Планшет']['nodes_by_level'], {0: 1, 1: 0, 2: 0})
+        self.assertEqual(rows['Часы']['nodes_count'], 0)
+        # Число запросов не зависит от размера страницы
+        for index in range(10):
+            self.make_node(f'ИП {index}', self.retailer).products.add(self.watch, self.tablet)
+            Product.objects.create(name=f'Наушники {index}', model='H', release_date='2024-01-01')
+        with self.assertNumQueries(3):
+            self.client.get('/api/products/')
+        response = self.client.get('/api/products/', {'released_after': '2024-01-01', 'name': 'асы'})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Часы'])
+        self.assertEqual(response.data['results'][0]['nodes_by_level'], {0: 0, 1: 0, 2: 10})
+        detail = self.client.get(f'/api/products/{self.tablet.pk}/').data
+        self.assertEqual(detail['nodes_by_level'], {0: 1, 1: 0, 2: 10})
+        # Каталог только для чтения: продукты меняются через админку
+        self.assertEqual(self.client.post('/api/products/', {'name': 'Новинка'}).status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/products/{self.tablet.pk}/').status_code, 405)
+
+    def test_nodes_carrying_product(self):
+        response = self.client.get(f'/api/products/{self.phone.pk}/nodes/')
+        self.assertEqual([node['name'] for node in response.data['results']], ['Завод', 'ИП', 'Сеть'])
+        response = self.client.get(f'/api/products/{self.phone.pk}/nodes/', {'level': 1})
+        self.assertEqual([node['id'] for node in response.data['results']], [self.retailer.pk])
+        self.assertEqual(self.client.get(f'/api/products/{self.phone.pk}/nodes/', {'level': 'x'}).status_code, 400)
+
+    def test_distribution_report(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/products/distribution/', {'released_before': '2024-12-31'})
+        self.assertEqual(response.data, [
+            {'id': self.tablet.pk, 'nodes_count': 1, 'nodes_by_level': {0: 1, 1: 0, 2: 0}},
+            {'id': self.phone.pk, 'nodes_count': 3, 'nodes_by_level': {0: 1, 1: 1, 2: 1}},
+        ])
+
+
+class NetworkNodeAssortmentTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.phone = Product.objects.create(name='Телефон', model='X1', release_date='2023-03-01')
+        self.tablet = Product.objects.create(name='Планшет', model='T2', release_date='2024-06-01')
+        self.watch = Product.objects.create(name='Часы', model='W3', release_date='2025-01-01')
+        self.factory = self.make_node('Завод')
+        self.factory.products.set([self.phone, self.tablet])
+        # Сеть наследует ассортимент завода без планшета и добавляет часы
+        self.retailer = self.make_node('Сеть', self.factory, inherits_assortment=True)
+        self.retailer.products.set([self.watch])
+        self.retailer.excluded_products.set([self.tablet])
+        self.entrepreneur = self.make_node('ИП', self.retailer, inherits_assortment=True)
+
+    def product_ids(self, node):
+        return [product['id'] for product in self.client.get(f'/api/nodes/{node.pk}/').data['products']]
+
+    def test_effective_assortment(self):
+        self.assertEqual(self.product_ids(self.retailer), [self.phone.pk, self.watch.pk])
+        self.assertEqual(self.product_ids(self.entrepreneur), [self.phone.pk, self.watch.pk])
+        self.assertEqual(list(NetworkNode.objects.get(pk=self.entrepreneur.pk).assortment), [self.phone, self.watch])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.retailer.inherits_assortment = False
+            self.retailer.save()
+        self.assertEqual(self.product_ids(self.entrepreneur), [self.watch.pk])
+
+    def test_list_resolves_assortment_in_bulk(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/nodes/', {'expand': 'contact'})
+        for index in range(10):
+            self.make_node(f'ИП {index}', self.retailer, inherits_assortment=True)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/nodes/', {'expand': 'contact'})
+        self.assertEqual(len(small), len(large))
+        rows = {row['name']: row['products'] for row in response.data['results']}
+        self.assertEqual(rows['ИП 9'], [self.phone.pk, self.watch.pk])
+        self.assertEqual(rows['Завод'], [self.phone.pk, self.tablet.pk])
+
+    def test_factory_update_reaches_heirs_without_copies(self):
+        etag = self.client.get(f'/api/nodes/{self.entrepreneur.pk}/')['ETag']
+        rows = NetworkNode.products.through.objects.count()
+        headphones = Product.objects.create(name='Наушники', model='H', release_date='2024-01-01')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.factory.products.add(headphones)
+        self.assertEqual(NetworkNode.products.through.objects.count(), rows + 1)
+        response = self.client.get(f'/api/nodes/{self.entrepreneur.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(headphones.pk, [product['id'] for product in response.data['products']])
+
+    def test_distribution_and_carrying_follow_inheritance(self):
+        distribution = Product.objects.distribution()
+        self.assertEqual(distribution[self.phone.pk], {0: 1, 1: 1, 2: 1})
+        self.assertEqual(distribution[self.tablet.pk], {0: 1, 1: 0, 2: 0})
+        self.assertEqual(distribution[self.watch.pk], {0: 0, 1: 1, 2: 1})
+        self.assertEqual(
+            set(NetworkNode.objects.carrying(self.watch)), {self.retailer, self.entrepreneur}
+        )
+
+    def test_bulk_sets_inheritance_and_exclusions(self):
+        response = self.client.post('/api/nodes/bulk/', [
+            {'name': 'ИП 2', 'contact_id': self.contact.pk, 'supplier_id': self.retailer.pk,
+             'inherits_assortment': True, 'excluded_products_ids': [self.phone.pk]},
+            {'id': self.retailer.pk, 'excluded_products_ids': []},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        node = NetworkNode.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(self.product_ids(node), [self.tablet.pk, self.watch.pk])
+        self.assertEqual(self.product_ids(self.entrepreneur), [self.phone.pk, self.tablet.pk, self.watch.pk])
+
+    def test_create_writes_assortment_with_insert_version(self):
+        counter = current_counter()
+        data = {
+            'name': 'ИП 2', 'contact_id': self.contact.pk, 'supplier_id': self.retailer.pk,
+            'products_ids': [self.phone.pk, self.tablet.pk, self.watch.pk], 'inherits_assortment': True,
+        }
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/nodes/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        lookups = [query for query in captured.captured_queries if 'FROM "network_product" WHERE' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(NetworkNode.objects.get(pk=response.data['id']).version, counter + 1)
+        data['products_ids'] = [self.phone.pk, 0]
+        response = self.client.post('/api/nodes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('"0"', response.data['products_ids'][0])
+
+
+class NetworkAnalyticsTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = self.make_node('Завод')
+        self.retailer = self.make_node('Сеть', self.factory, debt=Decimal('10.00'))
+        self.shop = self.make_node('Магазин', self.factory, debt=Decimal('1.50'))
+        self.entrepreneur = self.make_node('ИП', self.retailer, debt=Decimal('5.00'))
+        self.loner = self.make_node('Одиночка')
+
+    def test_summary_and_fanout(self):
+        data = self.client.get('/api/analytics/').data
+        self.assertEqual(data['nodes'], 5)
+        self.assertEqual(data['roots'], 2)
+        self.assertEqual(data['orphans'], 1)
+        self.assertEqual(data['max_depth'], 2)
+        self.assertEqual(data['depths'], {0: 2, 1: 2, 2: 1})
+        self.assertEqual(data['levels'], {0: 2, 1: 2, 2: 1})
+        self.assertEqual(data['total_debt'], Decimal('16.50'))
+        self.assertEqual(data['unreachable'], 0)
+        fanout = self.client.get('/api/analytics/fanout/').data
+        self.assertEqual(fanout, {'max': 2, 'mean': 1.5, 'distribution': {0: 3, 1: 1, 2: 1}})
+
+    def test_subtrees_match_stored_aggregates(self):
+        data = self.client.get('/api/analytics/subtrees/', {'by': 'debt', 'limit': 2}).data
+        self.assertEqual([node['id'] for node in data], [self.factory.pk, self.retailer.pk])
+        for node in data:
+            stored = NetworkNode.objects.get(pk=node['id'])
+            self.assertEqual(node['subtree_debt'], stored.subtree_debt + stored.debt)
+            self.assertEqual(node['customers_count'], stored.customers_count)
+        self.assertEqual(data[0]['subtree_size'], 4)
+        self.assertEqual(data[0]['name'], 'Завод')
+        self.assertEqual(self.client.get('/api/analytics/subtrees/', {'by': 'name'}).status_code, 400)
+        orphans = self.client.get('/api/analytics/orphans/').data
+        self.assertEqual(orphans['count'], 1)
+        self.assertEqual(orphans['results'][0]['id'], self.loner.pk)
+
+    def test_snapshot_follows_change_feed_without_reload(self):
+        graph_store.snapshot()
+        with self.assertNumQueries(1):
+            graph_store.snapshot()
+        self.entrepreneur.supplier = self.loner
+        self.entrepreneur.save()
+        self.shop.delete()
+        self.make_node('Новый', self.entrepreneur, debt=Decimal('2.00'))
+        with mock.patch.object(GraphStore, 'load', side_effect=GraphStore.load) as load:
+            snapshot = graph_store.snapshot()
+        load.assert_not_called()
+        expected = {
+            node.pk: (node.supplier_id, node.level, int(node.debt * 100))
+            for node in NetworkNode.objects.all()
+        }
+        self.assertEqual(snapshot.rows(), expected)
+        self.assertEqual(snapshot.summary['max_depth'], 2)
+        self.assertEqual(snapshot.orphans, [])
+
+    def test_debt_change_reuses_snapshot_structure(self):
+        old = graph_store.snapshot()
+        old.fanout
+        self.retailer.debt = Decimal('20.00')
+        self.retailer.save()
+        with mock.patch.object(GraphSnapshot, '__init__') as build:
+            snapshot = graph_store.snapshot()
+        build.assert_not_called()
+        self.assertIs(snapshot.children, old.children)
+        self.assertIs(snapshot.fanout, old.fanout)
+        self.assertEqual(snapshot.summary['total_debt'], Decimal('26.50'))
+        self.assertEqual(old.summary['total_debt'], Decimal('16.50'))
+
+    def test_readers_keep_snapshot_while_refreshing(self):
+        old = graph_store.snapshot()
+        self.make_node('Новый', self.factory)
+        with graph_store._lock:
+            self.assertIs(graph_store.snapshot(), old)
+        self.assertEqual(graph_store.snapshot().summary['nodes'], 6)
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('network_analytics', '--json', '--top', '1', stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['summary']['nodes'], 5)
+        self.assertEqual(report['subtrees'][0]['id'], self.factory.pk)
+
+
+class GenerateTestDataTests(TestCase):
+    def generate(self, seed=1):
+        call_command(
+            'generate_test_data', factories=2, retailers=5, entrepreneurs=30,
+            products=20, seed=seed, chunk_size=7, quiet=True, stdout=io.StringIO()
+        )
+        return list(NetworkNode.objects.order_by('id').values_list(
+            'level', 'debt', 'customers_count', 'customers_debt', 'subtree_debt'
+        ))
+
+    def test_synthetic_network(self):
+        rows = self.generate()
+        self.assertEqual([level for level, *_ in rows].count(2), 30)
+        self.assertEqual(Product.objects.count(), 20)
+        for node in NetworkNode.objects.select_related('supplier'):
+            expected = f'{node.supplier.path}{node.pk}/' if node.supplier else f'{node.pk}/'
+            self.assertEqual(node.path, expected)
+            self.assertEqual(node.level, node.supplier.level + 1 if node.supplier else 0)
+
+    def test_retailers_inherit_assortment(self):
+        self.generate()
+        self.assertEqual(
+            set(NetworkNode.objects.values_list('level', 'inherits_assortment')), {(0, False), (1, True), (2, False)}
+        )
+        self.assertFalse(NetworkNode.products.through.objects.filter(networknode__level=1).exists())
+        nodes = NetworkNode.objects.in_bulk()
+        NetworkNode.objects.attach_assortments(nodes.values())
+        for node in nodes.values():
+            assortment = {product.pk for product in node.assortment}
+            self.assertTrue(assortment)
+            if node.supplier_id:
+                self.assertLessEqual(assortment, {product.pk for product in nodes[node.supplier_id].assortment})
+
+    def test_deterministic_and_consistent_aggregates(self):
+        first = [row[:2] for row in self.generate(seed=3)]
+        rows = self.generate(seed=3)
+        self.assertEqual([row[:2] for row in rows], first)
+        NetworkNode.objects.recompute_aggregates()
+        self.assertEqual(list(NetworkNode.objects.order_by('id').values_list(
+            'level', 'debt', 'customers_count', 'customers_debt', 'subtree_debt'
+        )), rows)
+
+
+class BenchmarkTests(TestCase):
+    def test_filter_samples_cover_every_filter(self):
+        self.assertEqual(set(FILTER_SAMPLES), set(NetworkNodeFilter.base_filters))
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    )
+    def test_runner_measures_every_scenario(self):
+        results = BenchmarkRunner([10], iterations=2, warmup=0).run()
+        scenarios = results['results']['10']
+        self.assertEqual(set(scenarios), {scenario.name for scenario in build_scenarios()})
+        # Валидаторы условного GET, звено с контактом и поставщиком, продукты
+        self.assertEqual(scenarios['retrieve']['queries'], 3)
+        self.assertGreater(scenarios['list']['bytes'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'results': {'10': {'list': {'p50_ms': 10, 'p95_ms': 20, 'queries': 3, 'bytes': 1000}}}}
+        same = {'results': {'10': {'list': {'p50_ms': 12, 'p95_ms': 24, 'queries': 3, 'bytes': 1050}}}}
+        self.assertEqual(compare(same, baseline), [])
+        worse = {'results': {'10': {'list': {'p50_ms': 40, 'p95_ms': 80, 'queries': 4, 'bytes': 2000}}}}
+        self.assertEqual(len(compare(worse, baseline)), 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryCountRegressionTests(TestCase):
+    """
+    Каждый списочный эндпоинт и changelist админки рендерится на сети из 10
+    и из 1000 звеньев: число запросов не должно расти с числом строк.
+    Меньше запросов на большой сети допустимо: исключения ассортимента
+    читаются, только если на странице есть наследующие звенья.
+    """
+    SMALL = {'factories': 1, 'retailers': 2, 'entrepreneurs': 7, 'products': 20}
+    LARGE = {'factories': 5, 'retailers': 45, 'entrepreneurs': 950, 'products': 20}
+    API_URLS = [
+        '/api/nodes/',
+        '/api/nodes/?expand=contact,products',
+        '/api/nodes/?fields=id,name,supplier',
+        '/api/nodes/?cursor=&page_size=1000',
+        '/api/nodes/factories/',
+        '/api/nodes/retailers/',
+        '/api/nodes/entrepreneurs/',
+        '/api/nodes/search/?q=россия',
+        '/api/nodes/debt-summary/',
+        '/api/nodes/{root}/descendants/',
+        '/api/nodes/{leaf}/ancestors/',
+        '/api/nodes/export/?export_format=csv',
+        '/api/nodes/export/?export_format=ndjson',
+        '/api/nodes/changes/',
+    ]
+    ADMIN_URLS = [
+        '/admin/network/networknode/',
+        '/admin/network/networknode/?all=',
+        '/admin/network/contact/',
+        '/admin/network/product/',
+    ]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='secret'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.client.force_login(self.user)
+
+    def populate(self, sizes):
+        clear_network()
+        SyntheticNetworkGenerator(seed=7).generate(**sizes)
+        return {
+            'root': NetworkNode.objects.filter(level=0).order_by('id').values_list('id', flat=True)[0],
+            'leaf': NetworkNode.objects.filter(level=2).order_by('id').values_list('id', flat=True)[0],
+        }
+
+    def render(self, client, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+            # Потоковые ответы выполняют запросы при чтении тела
+            b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, 200, url)
+        return [query['sql'] for query in captured.captured_queries]
+
+    def render_all(self, sizes):
+        ids = self.populate(sizes)
+        queries = {url: self.render(self.api, url.format(**ids)) for url in self.API_URLS}
+        queries.update({url: self.render(self.client, url) for url in self.ADMIN_URLS})
+        return queries
+
+    def test_query_count_does_not_grow_with_rows(self):
+        small = self.render_all(self.SMALL)
+        large = self.render_all(self.LARGE)
+        failures = [
+            describe_query_growth(url, small[url], large[url])
+            for url in small if len(large[url]) > len(small[url])
+        ]
+        if failures:
+            self.fail('\n\n'.join(failures))
+
+
+def normalize_sql(sql):
+    """SQL без литералов: запросы одной формы для разных строк совпадают"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\((?:\?, )*\?\)', '(...)', sql)
+
+
+def describe_query_growth(url, small, large):
+    """Отчёт о запросах, число которых выросло вместе с числом строк"""
+    grown = Counter(map(normalize_sql, large)) - Counter(map(normalize_sql, small))
+    lines = [f'{url}: {len(small)} запросов на малой сети, {len(large)} на большой']
+    lines += [f'  +{count} × {sql}' for sql, count in grown.most_common()]
+    return '\n'.join(lines)
+
+
+class RequestMetricsTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+        self.factory = self.make_node('Завод')
+
+    def metrics(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_histograms_per_endpoint(self):
+        self.client.get(f'/api/nodes/{self.factory.pk}/debt-info/')
+        self.client.get('/api/nodes/')
+        text = self.metrics()
+        self.assertIn('network_sql_queries_count{endpoint="node-debt-info",method="GET"} 1', text)
+        self.assertIn('network_serialization_duration_seconds_count{endpoint="node-list",method="GET"} 1', text)
+        self.assertIn('network_response_size_bytes_bucket{endpoint="node-list",method="GET",le="+Inf"} 1', text)
+        self.assertIn('network_sql_queries_bucket{endpoint="node-debt-info",method="GET",le="0"} 0', text)
+
+    def test_slow_queries_logged(self):
+        with override_settings(NETWORK_SLOW_QUERY_MS=0), self.assertLogs('network.sql', 'WARNING') as logs:
+            self.client.get(f'/api/nodes/{self.factory.pk}/debt-info/')
+        self.assertIn('node-debt-info', logs.output[0])
+        self.assertIn('network_slow_queries_total{endpoint="node-debt-info"}', self.metrics())
+
+    def test_cache_counters_exported(self):
+        cache_stats.reset()
+        url = f'/api/nodes/{self.factory.pk}/debt-info/'
+        self.client.get(url)
+        self.client.get(url)
+        text = self.metrics()
+        self.assertIn('# TYPE network_cache_hits_total counter', text)
+        self.assertIn('network_cache_hits_total 1\n', text)
+        self.assertIn('network_cache_misses_total 1\n', text)
+        self.assertIn('network_cache_invalidations_total 0\n', text)
+
+
+def basic_auth(username, password):
+    return 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+
+
+class RequestProfilingTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(NETWORK_PROFILE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.factory = self.make_node('Завод')
+
+    def test_header_from_staff_saves_profile_with_metadata(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/api/nodes/', {'level': 0}, HTTP_X_PROFILE='1')
+        [meta] = list_profiles()
+        self.assertEqual(response['X-Profile-File'], os.path.basename(meta['profile']))
+        self.assertEqual((meta['endpoint'], meta['action']), ('node-list', 'list'))
+        self.assertEqual(meta['view'], 'network.views.NetworkNodeViewSet')
+        self.assertEqual(meta['query_params'], {'level': ['0']})
+        output = io.StringIO()
+        call_command('network_profiles', summary='latest', top=5, stdout=output)
+        self.assertIn('node-list', output.getvalue())
+        self.assertIn('cumulative', output.getvalue())
+
+    def test_not_triggered_or_not_staff(self):
+        self.client.get('/api/nodes/')
+        with mock.patch('network.profiling.cProfile.Profile') as profile:
+            APIClient().get('/api/nodes/', HTTP_X_PROFILE='1')
+            APIClient().get('/api/nodes/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION='Token wrong')
+        profile.assert_not_called()
+        self.assertEqual(list_profiles(), [])
+
+    def test_header_with_token_credentials(self):
+        _, key = ApiToken.issue(self.user)
+        response = APIClient().get('/api/nodes/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=f'Token {key}')
+        [meta] = list_profiles()
+        self.assertEqual(response['X-Profile-File'], os.path.basename(meta['profile']))
+        self.assertEqual(meta['user'], 'employee')
+
+    def test_basic_credentials_checked_once(self):
+        get_user_model().objects.create_user(username='courier', password='password')
+        check_password = get_user_model().check_password
+        with mock.patch.object(
+            get_user_model(), 'check_password', autospec=True, side_effect=check_password
+        ) as checked:
+            response = APIClient().get(
+                '/api/nodes/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=basic_auth('employee', 'password')
+            )
+            self.assertEqual(checked.call_count, 1)
+            [meta] = list_profiles()
+            self.assertEqual(response['X-Profile-File'], os.path.basename(meta['profile']))
+            response = APIClient().get(
+                '/api/nodes/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=basic_auth('courier', 'password')
+            )
+            self.assertEqual(checked.call_count, 2)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(len(list_profiles()), 1)
+
+    @override_settings(NETWORK_PROFILE_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        self.client.get(f'/api/nodes/{self.factory.pk}/debt-info/')
+        [meta] = list_profiles()
+        self.assertEqual((meta['action'], meta['trigger']), ('debt_info', 'sample'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ApiTokenTests(NetworkTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.token, self.key = ApiToken.issue(self.user, 'ERP')
+        self.client = APIClient()
+
+    def get(self, key=None):
+        return self.client.get('/api/nodes/', HTTP_AUTHORIZATION=f'Token {key or self.key}')
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.get().status_code, 200)
+        return [
+            query['sql'] for query in captured.captured_queries
+            if 'network_apitoken' in query['sql'] or 'auth_user' in query['sql']
+        ]
+
+    def test_only_hash_is_stored(self):
+        self.assertEqual(self.token.key_hash, hashlib.sha256(self.key.encode()).hexdigest())
+        self.assertFalse(ApiToken.objects.filter(key_hash=self.key).exists())
+        self.assertEqual(self.token.prefix, self.key[:ApiToken.PREFIX_LENGTH])
+
+    def test_verified_token_is_cached(self):
+        self.assertEqual(len(self.auth_queries()), 2)  # SELECT токена с пользователем и last_used_at
+        self.assertEqual(self.auth_queries(), [])
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used_at)
+        self.assertEqual(self.client.get('/api/nodes/', HTTP_AUTHORIZATION='Bearer ' + self.key).status_code, 200)
+
+    def test_invalid_expired_and_revoked_tokens_rejected(self):
+        self.assertEqual(self.get('unknown').status_code, 403)
+        _, expired = ApiToken.issue(self.user, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.get(expired).status_code, 403)
+        self.assertEqual(self.get().status_code, 200)
+        self.token.revoke()
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_user_changes_drop_cached_token(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 403)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_api_tokens_command(self):
+        out = io.StringIO()
+        call_command('api_tokens', 'issue', 'employee', '--name', 'BI', '--days', '30', stdout=out)
+        key = out.getvalue().strip().splitlines()[-1]
+        self.assertEqual(self.get(key).status_code, 200)
+        call_command('api_tokens', 'revoke', key[:ApiToken.PREFIX_LENGTH], stdout=out)
+        self.assertEqual(self.get(key).status_code, 403)
+        call_command('api_tokens', 'list', '--user', 'employee', stdout=out)
+        self.assertIn('отозван', out.getvalue())
+
+
+@override_settings(NETWORK_READ_REPLICAS=['default'])
+class ReplicaRoutingTests(NetworkTestMixin, TestCase):
+    """Реплика в тестах — псевдоним основной БД; важна маршрутизация, а не данные"""
+
+    def setUp(self):
+        super().setUp()
+        pool.reset()
+        self.addCleanup(pool.reset)
+        self.factory = self.make_node('Завод')
+        self.seen_aliases = []
+        original = NetworkNodeViewSet.get_queryset
+
+        def spy(view):
+            self.seen_aliases.append(current_read_alias())
+            return original(view)
+        patcher = mock.patch.object(NetworkNodeViewSet, 'get_queryset', spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_routed_only_inside_scope(self):
+        router = ReplicaRouter()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with mock.patch.object(ReplicaPool, 'check', return_value=True):
+            self.assertIsNone(router.db_for_read(NetworkNode))
+            with replica_reads(request) as alias:
+                self.assertEqual(alias, 'default')
+                self.assertEqual(router.db_for_read(NetworkNode), 'default')
+                with primary_reads():
+                    self.assertIsNone(router.db_for_read(NetworkNode))
+            self.assertIsNone(current_read_alias())
+        self.assertEqual(router.db_for_write(NetworkNode), 'default')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch.object(ReplicaPool, 'check', return_value=False) as check:
+            self.assertEqual(self.client.get('/api/nodes/').status_code, 200)
+            self.assertEqual(self.client.get(f'/api/nodes/{self.factory.pk}/').status_code, 200)
+        self.assertEqual(set(self.seen_aliases), {None})
+        # Результат проверки кэшируется на NETWORK_REPLICA_HEALTH_INTERVAL
+        self.assertEqual(check.call_count, 1)
+
+    def test_write_pins_client_to_primary(self):
+        with mock.patch.object(ReplicaPool, 'check', return_value=True):
+            self.client.get('/api/nodes/')
+            response = self.client.post('/api/nodes/', {
+                'name': 'Сеть', 'contact_id': self.contact.pk, 'products_ids': [],
+                'supplier_id': self.factory.pk
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertIn(STICKY_COOKIE, response.cookies)
+            self.client.get('/api/nodes/', {'page': 1})
+            # Без cookie привязка держится по пользователю
+            self.client.cookies.clear()
+            self.client.get(f'/api/nodes/{self.factory.pk}/')
+        self.assertEqual(self.seen_aliases[0], 'default')
+        self.assertEqual(self.seen_aliases[-2:], [None, None])
+
+    def test_replica_failure_retried_on_primary(self):
+        spy = NetworkNodeViewSet.get_queryset
+
+        def failing(view):
+            queryset = spy(view)
+            if current_read_alias() is not None:
+                raise OperationalError('replica is gone')
+            return queryset
+        with mock.patch.object(ReplicaPool, 'check', return_value=True), \
+                mock.patch.object(NetworkNodeViewSet, 'get_queryset', failing):
+            response = self.client.get('/api/nodes/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 1)
+            # Отказ на первом же запросе (валидаторы ETag) и полный повтор на основной БД
+            self.assertEqual(self.seen_aliases, ['default', None, None])
+            self.assertFalse(pool.is_healthy('default'))
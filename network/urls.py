@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NetworkNodeViewSet
+from .views import DebtAdjustmentViewSet, NetworkAnalyticsViewSet, NetworkNodeViewSet, ProductViewSet, metrics
 
 router = DefaultRouter()
 router.register(r'nodes', NetworkNodeViewSet, basename='node')
+router.register(r'products', ProductViewSet, basename='product')
+router.register(r'analytics', NetworkAnalyticsViewSet, basename='analytics')
+router.register(r'debt-adjustments', DebtAdjustmentViewSet, basename='debt-adjustment')
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
     path('', include(router.urls)),
 ]
@@ -1,19 +1,36 @@
 # network/views.py
-from rest_framework import viewsets
-from rest_framework.decorators import action
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from rest_framework import filters
-from .models import NetworkNode
+from .models import DebtAdjustment, NetworkNode, Product
 from .serializers import (
     NetworkNodeSerializer,
-    NetworkNodeCreateUpdateSerializer
+    NetworkNodeCreateUpdateSerializer,
+    NetworkNodeDebtSummarySerializer,
+    NetworkNodeBulkItemSerializer,
+    ProductCatalogSerializer,
+    DebtAdjustmentItemSerializer,
+    DebtAdjustmentSerializer
 )
-from .filters import NetworkNodeFilter
+from .adjustments import ADJUSTMENTS_MAX_ITEMS, DebtAdjustmentWriter
+from .bulk import BULK_MAX_ITEMS, BulkNodeWriter
+from .cache import cached_response, stats as cache_stats
+from .changes import page_size, read_changes
+from .exports import EXPORT_FORMATS
+from .filters import NetworkNodeFilter, ProductFilter
+from .graph import describe, store as graph_store
+from .metrics import registry as metrics_registry
+from .pagination import NetworkNodeKeysetPagination, NetworkNodePageNumberPagination
+from .search import NetworkNodeSearchFilter, search_nodes
 from .permissions import IsActiveEmployee
+from .routers import ReplicaReadViewMixin, current_read_alias
 
 
-class NetworkNodeViewSet(viewsets.ModelViewSet):
+class NetworkNodeViewSet(ReplicaReadViewMixin, viewsets.ModelViewSet):
     """
     ViewSet для управления звеньями сети.
     Запрещено обновление поля 'debt' через API.
@@ -22,40 +39,132 @@ class NetworkNodeViewSet(viewsets.ModelViewSet):
         'contact', 'supplier'
     ).prefetch_related('products')
     permission_classes = [IsActiveEmployee]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = NetworkNodePageNumberPagination
+    filter_backends = [DjangoFilterBackend, NetworkNodeSearchFilter, filters.OrderingFilter]
     filterset_class = NetworkNodeFilter
-    search_fields = ['name', 'contact__city', 'contact__country']
+    # Название, город и страна денормализованы в NetworkNode.search_document
+    search_fields = ['search_document']
     ordering_fields = ['name', 'level', 'debt', 'created_at']
     ordering = ['name']
 
+    # Действия-списки по уровню иерархии: проходят общий конвейер
+    # фильтрации, поиска, сортировки и пагинации
+    LEVEL_ACTIONS = {'factories': 0, 'retailers': 1, 'entrepreneurs': 2}
+    # Действия, отдающие NetworkNodeSerializer: поддерживают ?fields= и ?expand=
+    SERIALIZED_READ_ACTIONS = {
+        'list', 'retrieve', 'descendants', 'ancestors', 'search', 'changes', *LEVEL_ACTIONS
+    }
+    # Колонки, которые действиям нужны у самого звена помимо выводимых
+    ACTION_COLUMNS = {'descendants': {'path'}, 'ancestors': {'path'}, 'changes': {'version'}}
+
+    @property
+    def paginator(self):
+        """
+        Keyset-пагинация включается параметром ?cursor=
+        (пустое значение — первая страница), иначе постраничная по умолчанию.
+        """
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and NetworkNodeKeysetPagination.cursor_query_param in request.query_params:
+                self._paginator = NetworkNodeKeysetPagination()
+        return super().paginator
+
+    def get_query_param_set(self, name):
+        """Набор значений из параметра вида ?fields=id,name,debt; None — не задан"""
+        request = getattr(self, 'request', None)
+        if request is None or name not in request.query_params:
+            return None
+        return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+    def get_requested_fields(self):
+        """?fields=; пустое значение — полное представление, как без параметра"""
+        return self.get_query_param_set('fields') or None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        fields = self.get_requested_fields()
+        if fields and self.action in self.SERIALIZED_READ_ACTIONS:
+            NetworkNodeSerializer.check_fields(fields)
+
+    def get_ordering_columns(self):
+        """Колонки текущей сортировки: нужны пагинации даже при усечённом ?fields="""
+        request = getattr(self, 'request', None)
+        ordering = request.query_params.get('ordering') if request is not None else None
+        ordering = ordering or ','.join(self.ordering)
+        terms = {term.strip().lstrip('-') for term in ordering.split(',')}
+        return terms & set(self.ordering_fields)
+
+    def get_pagination_columns(self):
+        """Keyset-странице нужна версия строк: по ней считается ETag"""
+        return {'version'} if hasattr(self.paginator, 'page_state') else set()
+
+    def get_queryset(self):
+        """
+        Фильтр по уровню для списков уровней. Для чтения набор колонок,
+        JOIN и prefetch подбирается под запрошенные ?fields= и ?expand=.
+        """
+        queryset = super().get_queryset()
+        if self.action in self.LEVEL_ACTIONS:
+            queryset = queryset.filter(level=self.LEVEL_ACTIONS[self.action])
+        if self.action in self.SERIALIZED_READ_ACTIONS:
+            queryset = NetworkNodeSerializer.setup_eager_loading(
+                queryset,
+                fields=self.get_requested_fields(),
+                expand=self.get_query_param_set('expand'),
+                extra_columns=self.get_ordering_columns() | self.ACTION_COLUMNS.get(self.action, set())
+                | self.get_pagination_columns()
+            )
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.get_serializer_class() is NetworkNodeSerializer:
+            kwargs.setdefault('fields', self.get_requested_fields())
+            kwargs.setdefault('expand', self.get_query_param_set('expand'))
+        return super().get_serializer(*args, **kwargs)
+
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
         if self.action in ['create', 'update', 'partial_update']:
             return NetworkNodeCreateUpdateSerializer
+        if self.action == 'debt_summary':
+            return NetworkNodeDebtSummarySerializer
+        if self.action == 'bulk':
+            return NetworkNodeBulkItemSerializer
         return NetworkNodeSerializer
 
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def _paginated_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'], url_path='factories')
     def factories(self, request):
         """Получение всех заводов (уровень 0)"""
-        factories = self.get_queryset().filter(level=0)
-        serializer = self.get_serializer(factories, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
     @action(detail=False, methods=['get'], url_path='retailers')
     def retailers(self, request):
         """Получение всех розничных сетей (уровень 1)"""
-        retailers = self.get_queryset().filter(level=1)
-        serializer = self.get_serializer(retailers, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
     @action(detail=False, methods=['get'], url_path='entrepreneurs')
     def entrepreneurs(self, request):
         """Получение всех ИП (уровень 2)"""
-        entrepreneurs = self.get_queryset().filter(level=2)
-        serializer = self.get_serializer(entrepreneurs, many=True)
-        return Response(serializer.data)
+        return self.list(request)
 
     @action(detail=True, methods=['get'], url_path='debt-info')
+    @cached_response
     def debt_info(self, request, pk=None):
         """Получение информации о задолженности"""
         node = self.get_object()
@@ -64,5 +173,244 @@ class NetworkNodeViewSet(viewsets.ModelViewSet):
             'debt': node.debt,
             'supplier': node.supplier.name if node.supplier else None,
             'level': node.level,
-            'level_display': node.get_level_display_name()
+            'level_display': node.get_level_display_name(),
+            'customers_count': node.customers_count,
+            'customers_debt': node.customers_debt,
+            'subtree_debt': node.subtree_debt
+        })
+
+    @action(detail=False, methods=['get'], url_path='debt-summary')
+    def debt_summary(self, request):
+        """Задолженность звеньев с агрегатами по цепочкам их покупателей"""
+        queryset = self.filter_queryset(
+            self.get_queryset().select_related(None).prefetch_related(None).only(
+                *NetworkNodeDebtSummarySerializer.Meta.fields
+            )
+        )
+        return self._paginated_response(queryset)
+
+    @action(detail=True, methods=['get'], url_path='descendants')
+    def descendants(self, request, pk=None):
+        """Все звенья ниже по цепочке поставок"""
+        node = self.get_object()
+        queryset = self.filter_queryset(self.get_queryset().descendants_of(node))
+        return self._paginated_response(queryset)
+
+    @action(detail=True, methods=['get'], url_path='ancestors')
+    def ancestors(self, request, pk=None):
+        """Цепочка поставщиков от завода до прямого поставщика"""
+        node = self.get_object()
+        ancestors = self.get_queryset().ancestors_of(node)
+        serializer = self.get_serializer(ancestors, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Потоковая выгрузка звеньев в NDJSON или CSV (?export_format=csv).
+        Учитывает фильтры, поиск и сортировку; читает данные курсором.
+        """
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'export_format': f'Допустимые форматы: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        stream, content_type = EXPORT_FORMATS[export_format]
+        queryset = self.filter_queryset(self.get_queryset())
+        if current_read_alias() is not None:
+            # Поток читается после выхода из представления, когда область реплики уже закрыта
+            queryset = queryset.using(current_read_alias())
+        response = StreamingHttpResponse(stream(queryset), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="network_nodes.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Пакетное создание и обновление звеньев (до BULK_MAX_ITEMS за запрос).
+        Ответ — список {ref, id, created} в порядке элементов запроса.
+        """
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False, max_length=BULK_MAX_ITEMS
+        )
+        serializer.is_valid(raise_exception=True)
+        results = BulkNodeWriter(serializer.validated_data).save()
+        return Response(results, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """Счётчики кэша ответов текущего процесса"""
+        return Response(cache_stats.snapshot())
+
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request):
+        """
+        Лента изменений для синхронизации: звенья, созданные или изменённые
+        после токена ?since=, и id удалённых. Размер пачки — ?limit=
+        (до 5000); токен следующей пачки — в поле next.
+        """
+        changed, deleted, next_token, has_more = read_changes(
+            self.get_queryset(), request.query_params.get('since'),
+            page_size(request.query_params.get('limit'))
+        )
+        return Response({
+            'next': next_token,
+            'has_more': has_more,
+            'changed': self.get_serializer(changed, many=True).data,
+            'deleted': deleted,
+        })
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Ранжированный поиск по названию, городу и стране (?q=).
+        Остальные фильтры применяются, сортировка — по релевантности.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'q': 'Укажите поисковый запрос'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = DjangoFilterBackend().filter_queryset(request, self.get_queryset(), self)
+        return self._paginated_response(search_nodes(queryset, query))
+
+
+class ProductViewSet(ReplicaReadViewMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Каталог продуктов. Число звеньев с продуктом по уровням считается
+    одним сгруппированным запросом на страницу (Product.objects.distribution).
+    """
+    queryset = Product.objects.all()
+    serializer_class = ProductCatalogSerializer
+    permission_classes = [IsActiveEmployee]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['name', 'release_date']
+    ordering = ['name', 'id']
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['distribution'] = getattr(self, 'page_distribution', None)
+        return context
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        products = page if page is not None else list(queryset)
+        self.page_distribution = Product.objects.distribution([product.pk for product in products])
+        serializer = self.get_serializer(products, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='nodes')
+    def nodes(self, request, pk=None):
+        """Звенья, у которых продукт в ассортименте; принимает фильтры звеньев (?level=, ?city=)"""
+        product = self.get_object()
+        filterset = NetworkNodeFilter(request.query_params, queryset=NetworkNode.objects.carrying(product))
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        queryset = NetworkNodeSerializer.setup_eager_loading(filterset.qs.order_by('name', 'id'))
+        page = self.paginate_queryset(queryset)
+        nodes = page if page is not None else queryset
+        serializer = NetworkNodeSerializer(nodes, many=True, context=self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='distribution')
+    def distribution(self, request):
+        """
+        Распределение по уровням для всего каталога (с учётом фильтров)
+        без пагинации: один запрос продуктов и один сгруппированный запрос
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        product_ids = list(queryset.values_list('pk', flat=True))
+        # Подзапрос вместо списка id: размер каталога не ограничен числом параметров SQL
+        distribution = Product.objects.distribution(queryset.order_by().values('pk'))
+        empty = dict.fromkeys(NetworkNode.LEVELS, 0)
+        return Response([
+            {
+                'id': product_id,
+                'nodes_count': sum(distribution.get(product_id, empty).values()),
+                'nodes_by_level': distribution.get(product_id, empty),
+            }
+            for product_id in product_ids
+        ])
+
+
+class NetworkAnalyticsViewSet(ReplicaReadViewMixin, viewsets.ViewSet):
+    """
+    Аналитика по всей сети из снимка дерева в памяти процесса (network.graph):
+    без обхода ORM по звеньям, один запрос счётчика версий на ответ.
+    """
+    permission_classes = [IsActiveEmployee]
+    MAX_LIMIT = 1000
+
+    def get_limit(self, default=10):
+        try:
+            return min(max(int(self.request.query_params['limit']), 1), self.MAX_LIMIT)
+        except (KeyError, ValueError):
+            return default
+
+    def list(self, request):
+        """Сводка: число звеньев, корней и звеньев вне цепочек, глубины, уровни, общий долг"""
+        return Response(graph_store.snapshot().summary)
+
+    @action(detail=False, methods=['get'], url_path='fanout')
+    def fanout(self, request):
+        """Распределение звеньев по числу прямых покупателей"""
+        return Response(graph_store.snapshot().fanout)
+
+    @action(detail=False, methods=['get'], url_path='subtrees')
+    def subtrees(self, request):
+        """Крупнейшие поддеревья по числу звеньев или по долгу (?by=debt), до ?limit="""
+        by = request.query_params.get('by', 'size')
+        if by not in ('size', 'debt'):
+            return Response({'by': 'Допустимые значения: size, debt'}, status=status.HTTP_400_BAD_REQUEST)
+        snapshot = graph_store.snapshot()
+        return Response(describe(snapshot, snapshot.largest_subtrees(self.get_limit(), by)))
+
+    @action(detail=False, methods=['get'], url_path='orphans')
+    def orphans(self, request):
+        """Звенья вне цепочек: без поставщика и без покупателей (до ?limit=)"""
+        snapshot = graph_store.snapshot()
+        orphans = snapshot.orphans
+        return Response({
+            'count': len(orphans),
+            'results': describe(snapshot, orphans[:self.get_limit(100)]),
         })
+
+
+class DebtAdjustmentViewSet(ReplicaReadViewMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Корректировки задолженности. POST — пакет {node_id, delta, reference}
+    (до ADJUSTMENTS_MAX_ITEMS), применяется целиком в одной транзакции;
+    повтор ссылки не меняет долг. GET — журнал (?node=, ?reference=).
+    """
+    queryset = DebtAdjustment.objects.order_by('-id')
+    permission_classes = [IsActiveEmployee]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['node', 'reference']
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return DebtAdjustmentItemSerializer
+        return DebtAdjustmentSerializer
+
+    def create(self, request):
+        """Ответ — список {reference, node_id, status: applied | duplicate} в порядке элементов"""
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False, max_length=ADJUSTMENTS_MAX_ITEMS
+        )
+        serializer.is_valid(raise_exception=True)
+        results = DebtAdjustmentWriter(serializer.validated_data).save()
+        return Response(results, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsActiveEmployee])
+def metrics(request):
+    """Гистограммы запросов и счётчики кэша текущего процесса в текстовом формате Prometheus"""
+    return HttpResponse(
+        metrics_registry.render(cache_stats.snapshot()), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
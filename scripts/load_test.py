@@ -0,0 +1,147 @@
+"""
+Нагрузочный тест чтения API: много одновременных (в том числе медленных)
+клиентов против запущенного сервера. Позволяет сравнить WSGI и ASGI путь:
+
+    gunicorn config.wsgi -w 2 --threads 8 -b 127.0.0.1:8000
+    uvicorn config.asgi:application --workers 2 --port 8001
+
+    python scripts/load_test.py http://127.0.0.1:8000/api/nodes/ --label wsgi -u admin -p secret
+    python scripts/load_test.py http://127.0.0.1:8001/api/nodes/ --label asgi -u admin -p secret
+
+Медленных клиентов имитируют --slow-send-ms (строки запроса отправляются
+с паузами, как на плохом канале) и --slow-read-ms (ответ читается порциями
+с паузами). Поток синхронного воркера занят, пока запрос не дочитан,
+и при числе клиентов больше числа потоков запросы встают в очередь;
+ASGI-сервер ожидает их в цикле событий. Зависимостей, кроме стандартной
+библиотеки, нет.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)] if ordered else 0.0
+
+
+async def fetch(url, headers, slow_send_ms, slow_read_ms, read_size):
+    """Один GET по HTTP/1.1 с Connection: close; возвращает (статус, байт)"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    lines = [f'GET {target} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: close', *headers]
+    for index, line in enumerate(lines):
+        if slow_send_ms and index:
+            await asyncio.sleep(slow_send_ms / 1000)
+        writer.write(f'{line}\r\n'.encode())
+        await writer.drain()
+    writer.write(b'\r\n')
+    await writer.drain()
+    status_line = await reader.readline()
+    received = len(status_line)
+    while True:
+        chunk = await reader.read(read_size)
+        if not chunk:
+            break
+        received += len(chunk)
+        if slow_read_ms:
+            await asyncio.sleep(slow_read_ms / 1000)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+    return int(status_line.split()[1]), received
+
+
+async def run_level(url, concurrency, total, headers, slow_send_ms, slow_read_ms, read_size):
+    timings, statuses, received = [], {}, 0
+    queue = iter(range(total))
+
+    async def client():
+        nonlocal received
+        for _ in queue:
+            started = time.perf_counter()
+            try:
+                status, size = await fetch(url, headers, slow_send_ms, slow_read_ms, read_size)
+            except (OSError, IndexError, ValueError):
+                status, size = 'error', 0
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            received += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'seconds': round(elapsed, 3),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(percentile(timings, 0.5), 1),
+        'p95_ms': round(percentile(timings, 0.95), 1),
+        'statuses': {str(key): value for key, value in statuses.items()},
+        'bytes': received,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест чтения API звеньев сети')
+    parser.add_argument('url', help='URL эндпоинта, например http://127.0.0.1:8000/api/nodes/')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--requests', type=int, default=400, help='Запросов на каждый уровень')
+    parser.add_argument('--slow-send-ms', type=float, default=0, help='Пауза между строками запроса')
+    parser.add_argument('--slow-read-ms', type=float, default=0, help='Пауза между порциями чтения')
+    parser.add_argument('--read-size', type=int, default=4096, help='Размер порции чтения')
+    parser.add_argument('-u', '--user')
+    parser.add_argument('-p', '--password')
+    parser.add_argument(
+        '-H', '--header', action='append', default=[],
+        help='Дополнительный заголовок, например "Cookie: sessionid=..." (Basic-аутентификация '
+             'проверяет пароль на каждом запросе и сама становится узким местом)'
+    )
+    parser.add_argument('--label', default='server', help='Метка прогона, например wsgi или asgi')
+    parser.add_argument('--output', help='Дописать результаты в JSON-файл')
+    args = parser.parse_args()
+
+    headers = list(args.header)
+    if args.user:
+        token = base64.b64encode(f'{args.user}:{args.password or ""}'.encode()).decode()
+        headers.append(f'Authorization: Basic {token}')
+
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_level(
+            args.url, concurrency, max(args.requests, concurrency), headers,
+            args.slow_send_ms, args.slow_read_ms, args.read_size
+        ))
+        results.append(result)
+        print(
+            f'{args.label}: {concurrency:>4} клиентов  {result["rps"]:>8} rps  '
+            f'p50 {result["p50_ms"]} мс  p95 {result["p95_ms"]} мс  {result["statuses"]}',
+            flush=True
+        )
+
+    if args.output:
+        try:
+            with open(args.output, encoding='utf-8') as file:
+                existing = json.load(file)
+        except FileNotFoundError:
+            existing = {}
+        existing[args.label] = {
+            'url': args.url, 'slow_send_ms': args.slow_send_ms,
+            'slow_read_ms': args.slow_read_ms, 'levels': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(existing, file, ensure_ascii=False, indent=2)
+    return 0 if all(set(result['statuses']) <= {'200'} for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())